@@ -1,4 +1,14 @@
 
-from .cairohtml import HtmlSurface, Color, Font
+from .backends import OutputBackend, PngBackend, PdfBackend, SvgBackend, RecordingBackend
+from .cairohtml import HtmlSurface, HtmlRenderer, Color, Font
+from .displaylist import DisplayList
+from .fontpool import FontPool, font_pool
+from .glyphs import GlyphBatch
 from .html import HtmlTag
+from .imagecache import ImageCache, image_cache
+from .layout import BoxTree, LayoutCache, LayoutEngine
+from .nodes import HtmlNode
+from .resourcecache import ResourceCache
+from .streaming import StreamRenderer, render_to_stream
+from .textcache import TextCache, text_cache
 from .province_css import AlignmentDefinition, LineDefinition, Colors
@@ -0,0 +1,94 @@
+import io
+from abc import ABC, abstractmethod
+from typing import Any
+
+from .pycairo.cairo import Content, Format, ImageSurface, PDFSurface, Rectangle, RecordingSurface, SVGSurface, Surface
+
+
+class OutputBackend(ABC):
+    format = ''
+
+    # The output is a path or a writable file object, without one the output is kept in memory
+    def __init__(self, output: Any = None):
+        self.output = io.BytesIO() if output is None else output
+
+    @abstractmethod
+    def create_surface(self, width: float, height: float) -> Surface:
+        pass
+
+    # Completes the output of surface and returns the output
+    @abstractmethod
+    def finish(self, surface: Surface) -> Any:
+        pass
+
+    def getvalue(self) -> bytes:
+        return self.output.getvalue()
+
+
+class PngBackend(OutputBackend):
+    format = 'png'
+
+    def create_surface(self, width: float, height: float) -> Surface:
+        return ImageSurface(Format.ARGB32, int(width), int(height))
+
+    def finish(self, surface: Surface) -> Any:
+        # The surface is not finished, so a scratch surface can be reused for the next document
+        surface.flush()
+        surface.write_to_png(self.output)
+        return self.output
+
+
+class PdfBackend(OutputBackend):
+    format = 'pdf'
+
+    def create_surface(self, width: float, height: float) -> Surface:
+        return PDFSurface(self.output, width, height)
+
+    def finish(self, surface: Surface) -> Any:
+        surface.finish()
+        return self.output
+
+
+class SvgBackend(OutputBackend):
+    format = 'svg'
+
+    def create_surface(self, width: float, height: float) -> Surface:
+        return SVGSurface(self.output, width, height)
+
+    def finish(self, surface: Surface) -> Any:
+        surface.finish()
+        return self.output
+
+
+class RecordingBackend(OutputBackend):
+    format = 'recording'
+
+    # Records the drawing operations for replaying them onto other surfaces, the output is the surface
+    def __init__(self, output: Any = None):
+        super().__init__(output)
+        self.output = output
+
+    def create_surface(self, width: float, height: float) -> Surface:
+        return RecordingSurface(Content.COLOR_ALPHA, Rectangle(0, 0, width, height))
+
+    def finish(self, surface: Surface) -> Any:
+        surface.flush()
+        self.output = surface
+        return surface
+
+    def getvalue(self) -> bytes:
+        raise TypeError('A recording has no encoded value.')
+
+
+backends = {
+    PngBackend.format: PngBackend,
+    PdfBackend.format: PdfBackend,
+    SvgBackend.format: SvgBackend,
+    RecordingBackend.format: RecordingBackend,
+}
+
+
+def backend_for(output_format: str, output: Any = None) -> OutputBackend:
+    if output_format not in backends:
+        raise TypeError("'{0}' is not an output format.".format(output_format))
+    return backends[output_format](output)
@@ -0,0 +1,57 @@
+import os.path
+import sys
+import time
+
+from .cssparser import CssParser
+from .html import HtmlTag
+from .tokenizer import HtmlHandler, HtmlTokenizer
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def html_document(size: int) -> str:
+    row = ('<tr class="row"><td><b>Item</b> with <i>some</i> text</td>'
+           '<td><a href="https://example.com/?a=1&b=2">link</a><br/></td></tr>\n')
+    rows = row * max(1, size // len(row))
+    return '<!DOCTYPE html>\n<html lang="en">\n<body>\n<table>\n' + rows + '</table>\n</body>\n</html>\n'
+
+
+def bench_tokenizer(sizes: [int] = (1 << 10, 10 << 10, 100 << 10, 1 << 20, 10 << 20)):
+    print('{0:>12} {1:>12} {2:>12} {3:>12}'.format('bytes', 'tokenize s', 'tree s', 'us/KB'))
+    for size in sizes:
+        doc = html_document(size)
+        tokenize = timed(HtmlTokenizer(doc).tokenize, HtmlHandler())
+        tree = timed(HtmlTag.fromSource, doc)
+        print('{0:>12} {1:>12.4f} {2:>12.4f} {3:>12.2f}'.format(len(doc), tokenize, tree,
+                                                                  tree * 1e6 / (len(doc) / 1024)))
+
+
+def nested_document(depth: int) -> str:
+    return '<div class="level">' * depth + 'deep text' + '</div>' * depth
+
+
+# The content of every element is a slice of its parent's, building the tree must stay linear in the depth
+def bench_nesting(depths: [int] = (100, 1000, 5000, 20000)):
+    print('{0:>12} {1:>12} {2:>12}'.format('depth', 'tree s', 'us/level'))
+    for depth in depths:
+        tree = timed(HtmlTag.fromSource, nested_document(depth))
+        print('{0:>12} {1:>12.4f} {2:>12.2f}'.format(depth, tree, tree * 1e6 / depth))
+
+
+def bench_css(path: str = os.path.join(os.path.dirname(__file__), 'examples', 'pure.css'), repeat: int = 50):
+    with open(path, 'r') as f:
+        css_source = f.read()
+    seconds = timed(lambda: [CssParser.parse(css_source) for _ in range(repeat)]) / repeat
+    print('{0}: {1} bytes, {2:.3f} ms per parse, {3:.3f} ms/KB'.format(
+        os.path.basename(path), len(css_source), seconds * 1e3, seconds * 1e3 / (len(css_source) / 1024)))
+
+
+if __name__ == '__main__':
+    bench_tokenizer()
+    bench_nesting()
+    bench_css()
+    sys.exit(0)
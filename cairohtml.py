@@ -1,22 +1,59 @@
-import os.path
+import urllib.parse
+from typing import Any, Callable, Iterable
 
-from .pycairo.cairo import Context, Format, ImageSurface, TeeSurface, SVGSurface, Surface
+from .pycairo.cairo import Context, Format, ImageSurface, Operator, TeeSurface, Surface
+from .backends import OutputBackend, PdfBackend, PngBackend, SvgBackend, backend_for, backends
 from .html import HtmlTag, cacao_html, Stack
-from .province_css import CssSurfaceModifier, Color, Font, FontSlant, FontWeight, AlignmentDefinition
+from .province_css import CssSurfaceModifier, Color, Css, Font, FontSlant, FontWeight, AlignmentDefinition
+from .csscache import StylesheetCache
+from .fontpool import font_pool
+from .glyphs import GlyphBatch
+from .imagecache import image_cache
+from .layout import BoxTree
+from .linebreak import LineBreaker, line_breaker
+from .loader import IMG, BackgroundLoader
 from .cacao.py.util import genid
 
 
-class HtmlSurface(TeeSurface):
-    def __init__(self, font_family: str, width: float, height: float):
-        self.svg = SVGSurface('./html.svg', width, height)
-        super().__init__(self.svg)
-        self.ctx = Context(self)
+class HtmlSurface:
+    def __init__(self, font_family: str, width: float, height: float, backend: OutputBackend = None,
+                 css: Css = None, font: Font = None, target: Surface = None, loader: BackgroundLoader = None,
+                 base_url: str = ''):
+        # Tees into target, if given, else into the surface of backend, an SVG written to ./html.svg by default
+        if target is None:
+            self.backend = SvgBackend('./html.svg') if backend is None else backend
+            target = self.backend.create_surface(width, height)
+        else:
+            self.backend = backend
+        self.target = target
+        self.width = width
+        self.height = height
+        # pycairo's TeeSurface cannot be subclassed, the page is drawn into one held here,
+        # more surfaces are teed in with add
+        self.surface = TeeSurface(target)
+        self.ctx = Context(self.surface)
         self.regions = dict()
-        self.font = Font(font_family)
-        self.css = CssSurfaceModifier(self, self.ctx)
+        self.font = Font(font_family) if font is None else font
+        self.css = CssSurfaceModifier(self.surface, Css() if css is None else css, loader=loader)
+        # Pictures are collected from the loader, that prefetched them, while the document was parsed
+        self.loader = loader
+        self.base_url = base_url
+        self.alignment = AlignmentDefinition()
+        self.line_breaker = LineBreaker(alignment=self.alignment)
+        # All text of the page is collected and shown per font, selectable in PDF output
+        self.glyphs = GlyphBatch(self.ctx, isinstance(self.backend, PdfBackend))
+        # Text is set in the pooled scaled font of font, unless CSS changes it
+        key = font_pool.use(self.ctx, self.font.name, self.font.italic, self.font.bold, self.font.fontsize)
+        self.glyphs.set_font(self.ctx.get_scaled_font(), key)
+
+    def add(self, surface: Surface):
+        self.surface.add(surface)
+
+    def remove(self, surface: Surface):
+        self.surface.remove(surface)
 
     def make_region(self, width: float, height: float, x: float = 0.0, y: float = 0.0, idnum: str = genid()) -> Surface:
-        surface = self.create_for_rectangle(x, y, width, height)
+        surface = self.surface.create_for_rectangle(x, y, width, height)
         self.regions[idnum] = surface
         return surface
 
@@ -32,22 +69,53 @@ class HtmlSurface(TeeSurface):
         return self.ctx
 
     def set_main_surface(self):
-        self.ctx.set_source_surface(self, 0.0, 0.0)
+        self.ctx.set_source_surface(self.surface, 0.0, 0.0)
 
     def regiondict(self):
         return self.regions
 
+    # The batched text is shown before a tag begins or ends, so it lands inside the tags it belongs to,
+    # links and structure tags of PDF output cover their own text only
     def tag_open(self, name, attributes=''):
+        self.glyphs.flush()
         self.ctx.tag_begin(name, attributes)
 
     def tag_close(self, name):
+        self.glyphs.flush()
         self.ctx.tag_end(name)
 
     def save(self):
         self.ctx.save()
 
+    @staticmethod
+    def pixel_attribute(html_tag: HtmlTag, name: str) -> int | None:
+        value = html_tag.attrval(name).strip().removesuffix('px')
+        return int(value) if value.isdigit() else None
+
+    # Paints the picture of an img tag at the current point, its top on the top of the line, and moves behind it
+    def make_picture(self, html_tag: HtmlTag):
+        src = html_tag.attrval('src').strip()
+        if self.loader is None or len(src) == 0:
+            return
+        resource = self.loader.get(urllib.parse.urljoin(self.base_url, src))
+        image = image_cache.image(resource.body, self.pixel_attribute(html_tag, 'width'),
+                                  self.pixel_attribute(html_tag, 'height'), resource.content_hash())
+        x, y = self.ctx.get_current_point()
+        # On whole pixels, the picture is not blurred
+        left = round(x)
+        self.ctx.save()
+        self.ctx.set_source_surface(image, left, round(y - self.ctx.font_extents()[0]))
+        self.ctx.paint()
+        self.ctx.restore()
+        self.ctx.move_to(left + image.get_width(), y)
+
     def make_text(self, text):
-        self.ctx.show_text(text)
+        # Wraps at the right edge of the page, or of the fixed span of the alignment
+        x, y = self.ctx.get_current_point()
+        width = self.width if self.alignment.span_hpx == 0.0 else self.alignment.span_hpx
+        if self.glyphs.font_key is None:
+            self.glyphs.use_context_font()
+        self.line_breaker.show_text(self.ctx, text, 0.0, y, width, x, self.glyphs)
 
     @staticmethod
     def align(context: Context, alignment: AlignmentDefinition) -> str:
@@ -66,7 +134,7 @@ class HtmlSurface(TeeSurface):
         return self.regions[regionid]
 
     def do_tag_children(self, html_tag_children: [HtmlTag]):
-        for chld in html_tag_children.childs:
+        for chld in html_tag_children:
             if len(chld.pre_tag) > 0:
                 self.make_text(chld.pre_tag)
             self.do_tag(chld)
@@ -95,12 +163,12 @@ class HtmlSurface(TeeSurface):
         self.tag_open(tagname_cairo)
 
         # Fill the cairo tag with content
-        if tagname is '':
+        if html_tag.is_text():
             self.make_text(html_tag.content)
-        elif html_tag.has_child_tags():
+        elif html_tag.tagid == IMG:
+            self.make_picture(html_tag)
+        elif len(html_tag.children) > 0:
             self.do_tag_children(html_tag.children)
-        elif html_tag.has_child_tags():
-            self.do_tag_with_children(html_tag)
         else:
             self.do_tag_content(html_tag)
 
@@ -112,9 +180,87 @@ class HtmlSurface(TeeSurface):
         return tagname_cairo
 
     def html(self, html_tag: HtmlTag):
-        if len(html_tag.childs) is 0:
-            # Do processing, no childs
-            self.do_tag(html_tag)
+        # The first line of text has its baseline one ascent below the top of the page
+        if not self.ctx.has_current_point():
+            self.ctx.move_to(0.0, self.ctx.font_extents()[0])
+        self.do_tag(html_tag)
+        self.glyphs.flush()
+
+    # Paints the boxes of a finished layout pass, nothing is positioned while drawing
+    def paint(self, box_tree: BoxTree):
+        box_tree.paint(self.ctx, self.glyphs)
+        # The box tree left its last font on the context
+        self.glyphs.set_font(None, None)
+
+    # Finishes drawing and completes the output of the backend
+    def finish_output(self) -> Any:
+        self.glyphs.flush()
+        self.surface.finish()
+        if self.backend is None:
+            return self.target
+        return self.backend.finish(self.target)
+
+
+class HtmlRenderer:
+    # Renders many documents with one set of stylesheets, one font and one scratch surface
+    # With a loader, the pictures of a document are prefetched as soon as it is parsed, urls are resolved
+    # against base_url
+    def __init__(self, font_family: str, width: float, height: float, output_format: str = 'svg',
+                 css: Css = None, loader: BackgroundLoader = None, base_url: str = ''):
+        if output_format not in backends:
+            raise TypeError("'{0}' is not an output format.".format(output_format))
+        self.width = width
+        self.height = height
+        self.output_format = output_format
+        self.css = Css() if css is None else css
+        self.font = Font(font_family)
+        self.font_family = font_family
+        self.loader = loader
+        self.base_url = base_url
+        self.scratch = None
+
+    def add_stylesheet(self, path: str, cache: StylesheetCache = None) -> int:
+        return self.css.append_stylesheet(path, cache)
+
+    def scratch_surface(self) -> ImageSurface:
+        # The raster surface of png output is allocated once and cleared for every document
+        if self.scratch is None:
+            self.scratch = ImageSurface(Format.ARGB32, int(self.width), int(self.height))
+        else:
+            ctx = Context(self.scratch)
+            ctx.set_operator(Operator.CLEAR)
+            ctx.paint()
+        return self.scratch
+
+    # Parses doc and starts fetching its pictures, returns the tag and the urls of the pictures
+    def parse(self, doc: str | HtmlTag) -> (HtmlTag, [str]):
+        html_tag = doc if isinstance(doc, HtmlTag) else HtmlTag.fromSource(doc)
+        urls = [] if self.loader is None else self.loader.prefetch_tag(html_tag, self.base_url)
+        return html_tag, urls
+
+    # The loader keeps the pictures of a document, until it is painted
+    def forget(self, urls: [str]):
+        if self.loader is not None:
+            self.loader.forget(urls)
+
+    # Renders doc to output, a path or a file object, or into memory if output is None
+    def render(self, doc: str | HtmlTag, output: Any = None) -> Any:
+        html_tag, urls = self.parse(doc)
+        backend = backend_for(self.output_format, output)
+        # The png backend draws into the scratch surface, which is never finished
+        target = self.scratch_surface() if isinstance(backend, PngBackend) else None
+        surface = HtmlSurface(self.font_family, self.width, self.height, backend, self.css, self.font, target,
+                              self.loader, self.base_url)
+        try:
+            surface.html(html_tag)
+        finally:
+            self.forget(urls)
+        return surface.finish_output()
+
+    # Renders every document to the output that output_factory returns for it, and yields the outputs in order
+    def render_many(self, docs: Iterable[str | HtmlTag], output_factory: Callable[[Any], Any]):
+        for doc in docs:
+            yield self.render(doc, output_factory(doc))
 
 
 class TextSurface(Surface):
@@ -124,20 +270,17 @@ class TextSurface(Surface):
 
     def make_text(self, text: str, font: Font = None):
         if font is not None:
-            font_options = self.ctx.get_font_options()
-            font_face = self.ctx.get_font_face()
+            scaled_font = self.ctx.get_scaled_font()
             self.set_font(font)
-            self.ctx.show_text(text)
-            self.ctx.set_font_options(font_options)
-            self.ctx.set_font_face(font_face)
+            line_breaker.show(self.ctx, text)
+            self.ctx.set_scaled_font(scaled_font)
         else:
-            self.ctx.show_text(text)
+            line_breaker.show(self.ctx, text)
         self.ctx.save()
 
     def set_font(self, font: Font):
-        self.ctx.set_font_size(font.fontsize)
-        self.ctx.select_font_face(font.family, font.italic, font.bold)
-        self.ctx.set_font_options(font)
+        # One set_scaled_font with the pooled face and scaled font
+        font_pool.use(self.ctx, font.family, font.italic, font.bold, font.fontsize, font)
 
 
 class Image:
@@ -146,17 +289,15 @@ class Image:
     data = None
 
     @staticmethod
-    def from_png(path: str):
-        if not os.path.isfile(path):
-            return None
-        return ImageSurface.create_from_png(path)
+    def from_png(path: str, width: int = None, height: int = None):
+        # Decoded once per process, the surfaces are shared with every other image of the same file
+        return image_cache.from_path(path, width, height)
 
     def __init__(self, path: str, width: int, height: int):
-        format = Format.ARGB32
-        format.stride_for_width(width)
         self.png = self.from_png(path)
-        self.img = self.png.create_similar_image(format, width, height)
-        self.data = self.img.get_data()
+        self.img = self.from_png(path, width, height)
+        # The surface is shared through the image cache, its pixels are read only
+        self.data = self.img.get_data().toreadonly()
 
     def create_for_rectangle(self, x: int, y: int):
         return self.img.create_for_rectangle(x, y, self.img.get_width(), self.png.get_height())
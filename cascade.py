@@ -0,0 +1,225 @@
+from typing import Any
+
+from .cssselector import CompiledSelector, SelectorParser
+from .dom import HtmlDom
+from .symbols import ID, symbols
+
+
+class IndexedRule:
+    __slots__ = ('selector', 'declarations', 'order')
+
+    def __init__(self, selector: CompiledSelector, declarations: Any, order: int):
+        self.selector = selector
+        self.declarations = declarations
+        self.order = order
+
+    def __repr__(self):
+        return 'IndexedRule({0!r}, {1})'.format(self.selector.text, self.order)
+
+    def precedence(self) -> tuple:
+        return self.selector.specificity, self.order
+
+
+class RuleIndex:
+    # Rules bucketed by the id, a class or the tag of their rightmost compound
+    def __init__(self):
+        self.ids = dict()
+        self.classes = dict()
+        self.tags = dict()
+        self.universal = []
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __getstate__(self):
+        # The buckets are keyed by symbol ids, so only the rules are pickled
+        return [(rule.selector, rule.declarations) for rule in self.rules()]
+
+    def __setstate__(self, state):
+        self.__init__()
+        for selector, declarations in state:
+            self.add_selector(selector, declarations)
+
+    def rules(self) -> [IndexedRule]:
+        rules = list(self.universal)
+        for buckets in (self.tags, self.classes, self.ids):
+            for bucket in buckets.values():
+                rules += bucket
+        rules.sort(key=lambda rule: rule.order)
+        return rules
+
+    # Appends all rules of index after the own rules
+    def extend(self, index):
+        for rule in index.rules():
+            self.add_selector(rule.selector, rule.declarations)
+
+    def add_selector(self, selector: CompiledSelector, declarations: Any) -> IndexedRule:
+        rule = IndexedRule(selector, declarations, self.count)
+        self.count += 1
+        self.file(rule)
+        return rule
+
+    def file(self, rule: IndexedRule):
+        compound = rule.selector.rightmost()
+        if compound.idval is not None:
+            self.ids.setdefault(compound.idval, []).append(rule)
+        elif len(compound.classids) > 0:
+            self.classes.setdefault(compound.classids[0], []).append(rule)
+        elif compound.tagid > -1:
+            self.tags.setdefault(compound.tagid, []).append(rule)
+        else:
+            self.universal.append(rule)
+
+    # Adds a rule for every selector of selector_list, returns the number of indexed selectors
+    def add(self, selector_list: str, declarations: Any) -> int:
+        try:
+            selectors = SelectorParser.compile(selector_list)
+        except TypeError:
+            # An invalid selector drops the whole rule
+            return 0
+        added = 0
+        for selector in selectors:
+            # Pseudo elements never style an element itself
+            if selector.pseudo_element is None:
+                self.add_selector(selector, declarations)
+                added += 1
+        return added
+
+    def candidates(self, dom: HtmlDom, index: int) -> [IndexedRule]:
+        rules = list(self.universal)
+        rules += self.tags.get(dom.tag[index], [])
+        for classid in dom.classnames[index]:
+            rules += self.classes.get(classid, [])
+        idval = dom.attributes[index].get(ID)
+        if idval is not None:
+            rules += self.ids.get(idval, [])
+        return rules
+
+    # All rules matching the element, in cascade order from lowest to highest precedence
+    def match(self, dom: HtmlDom, index: int) -> [IndexedRule]:
+        rules = [rule for rule in self.candidates(dom, index) if rule.selector.matches(dom, index)]
+        rules.sort(key=IndexedRule.precedence)
+        return rules
+
+    def stats(self) -> dict:
+        return dict(rules=self.count, ids=len(self.ids), classes=len(self.classes), tags=len(self.tags),
+                    universal=len(self.universal))
+
+
+class ComputedStyle:
+    __slots__ = ('properties', 'parent', 'derived_values')
+
+    inherited_properties = frozenset([
+        'color', 'cursor', 'direction', 'font', 'font-family', 'font-size', 'font-style', 'font-variant',
+        'font-weight', 'letter-spacing', 'line-height', 'list-style', 'list-style-image',
+        'list-style-position', 'list-style-type', 'quotes', 'text-align', 'text-indent',
+        'text-transform', 'visibility', 'white-space', 'word-spacing',
+    ])
+
+    def __init__(self, properties: dict, parent=None):
+        self.properties = properties
+        self.parent = parent
+        self.derived_values = dict()
+
+    def __getitem__(self, name: str) -> str:
+        return self.properties[name]
+
+    def __contains__(self, name: str):
+        return name in self.properties
+
+    def get(self, name: str, default: str = None) -> str | None:
+        return self.properties.get(name, default)
+
+    # Values derived from the style, like a CssFont, are computed once per shared style
+    def derived(self, name: str, factory) -> Any:
+        value = self.derived_values.get(name)
+        if value is None:
+            value = factory(self)
+            self.derived_values[name] = value
+        return value
+
+    @staticmethod
+    def cascade(parent, declaration_lists: [list]):
+        properties = dict()
+        if parent is not None:
+            for name, value in parent.properties.items():
+                if name in ComputedStyle.inherited_properties:
+                    properties[name] = value
+
+        important = []
+        for declarations in declaration_lists:
+            for name, value in declarations:
+                if value.endswith('!important'):
+                    important.append((name, value[:-10].rstrip()))
+                else:
+                    properties[name] = value
+        for name, value in important:
+            properties[name] = value
+
+        for name, value in properties.items():
+            if value == 'inherit':
+                properties[name] = str() if parent is None else parent.properties.get(name, str())
+        return ComputedStyle(properties, parent)
+
+
+class StyleResolver:
+    STYLE = symbols.intern('style')
+
+    # Shares one computed style between elements with identical tag, classes, attributes, parent style and
+    # matching structural rules
+    def __init__(self, index: RuleIndex):
+        self.index = index
+        self.shared = dict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def inline_declarations(style_attr: str) -> [tuple]:
+        declarations = []
+        for declaration in style_attr.split(';'):
+            pos_colon = declaration.find(':')
+            if pos_colon > -1:
+                declarations.append((declaration[:pos_colon].strip().lower(), declaration[pos_colon+1:].strip()))
+        return declarations
+
+    def compute(self, dom: HtmlDom, index: int, parent_style: ComputedStyle | None,
+                rules: [IndexedRule]) -> ComputedStyle:
+        rules = [rule for rule in rules if rule.selector.matches(dom, index)]
+        rules.sort(key=IndexedRule.precedence)
+        declaration_lists = [rule.declarations for rule in rules]
+        style_attr = dom.attributes[index].get(StyleResolver.STYLE)
+        if style_attr is not None:
+            declaration_lists.append(StyleResolver.inline_declarations(style_attr))
+        return ComputedStyle.cascade(parent_style, declaration_lists)
+
+    def resolve(self, dom: HtmlDom, index: int, parent_style: ComputedStyle | None = None) -> ComputedStyle:
+        rules = self.index.candidates(dom, index)
+        # Rules depending on the position among siblings are matched up front, elements share a style as long
+        # as the same of them match
+        structural = tuple([rule.selector.matches(dom, index) for rule in rules if rule.selector.structural])
+        key = (dom.tag[index], dom.classnames[index], frozenset(dom.attributes[index].items()), parent_style,
+               structural)
+        style = self.shared.get(key)
+        if style is None:
+            self.misses += 1
+            style = self.compute(dom, index, parent_style, rules)
+            self.shared[key] = style
+        else:
+            self.hits += 1
+        return style
+
+    # The computed style of every node of dom, text nodes have the style of their parent
+    def resolve_all(self, dom: HtmlDom) -> list:
+        styles = [None] * len(dom)
+        tag = dom.tag
+        parent = dom.parent
+        for index in dom.walk(0):
+            if tag[index] > HtmlDom.DOCUMENT:
+                styles[index] = self.resolve(dom, index, styles[parent[index]])
+            elif index > 0:
+                styles[index] = styles[parent[index]]
+        return styles
+
+    def stats(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses, shared=len(self.shared))
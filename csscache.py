@@ -0,0 +1,123 @@
+import hashlib
+import os
+import os.path
+import pickle
+import struct
+import tempfile
+
+from .cascade import RuleIndex
+from .cssparser import CssParser, CssStylesheet
+from .util import open_mapped
+
+
+class StylesheetCache:
+    VERSION = 2
+    MAGIC = b'PCHCSS'
+    # Magic, version and the sha256 of the pickled entry, checked before anything is unpickled
+    HEADER = struct.Struct('>6sH32s')
+
+    # Compiled stylesheets on disk in cache_dir, by default a private directory of the user
+    def __init__(self, cache_dir: str | None = None):
+        self.cache_dir = self.default_dir() if cache_dir is None else cache_dir
+        try:
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            self.private = self.is_private(self.cache_dir)
+        except OSError:
+            self.private = False
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def default_dir() -> str:
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(cache_home, 'pycairohtml', 'stylesheets')
+
+    @staticmethod
+    def is_private(directory: str) -> bool:
+        # Unpickling runs code, so only a directory of this user, that no one else can write to, is used
+        if not hasattr(os, 'getuid'):
+            return os.path.isdir(directory)
+        stat = os.stat(directory)
+        return stat.st_uid == os.getuid() and stat.st_mode & 0o022 == 0
+
+    @staticmethod
+    def content_hash(css_source: bytes) -> str:
+        return hashlib.sha256(css_source).hexdigest()
+
+    def cache_path(self, path: str, media: str, width: float | None) -> str:
+        name = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+        return os.path.join(self.cache_dir, '{0}.{1}-{2}.cache'.format(name, media, width))
+
+    def read(self, cache_path: str) -> dict | None:
+        if not self.private:
+            return None
+        try:
+            with open(cache_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < StylesheetCache.HEADER.size:
+            return None
+        magic, version, digest = StylesheetCache.HEADER.unpack_from(data)
+        payload = memoryview(data)[StylesheetCache.HEADER.size:]
+        if magic != StylesheetCache.MAGIC or version != StylesheetCache.VERSION \
+                or hashlib.sha256(payload).digest() != digest:
+            return None
+        try:
+            entry = pickle.loads(payload)
+        except (EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError):
+            return None
+        if type(entry) is not dict or entry.get('version') != StylesheetCache.VERSION:
+            return None
+        return entry
+
+    def write(self, cache_path: str, entry: dict):
+        if not self.private:
+            return
+        payload = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        header = StylesheetCache.HEADER.pack(StylesheetCache.MAGIC, StylesheetCache.VERSION,
+                                             hashlib.sha256(payload).digest())
+        try:
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, delete=False) as tmp_file:
+                tmp_file.write(header)
+                tmp_file.write(payload)
+            os.replace(tmp_file.name, cache_path)
+        except OSError:
+            # A read-only directory only costs the parse on the next start
+            pass
+
+    def load_entry(self, path: str, media: str = 'screen', width: float | None = None) -> dict:
+        cache_path = self.cache_path(path, media, width)
+        stat = os.stat(path)
+        entry = self.read(cache_path)
+        if entry is not None and entry['path'] == os.path.abspath(path) \
+                and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            self.hits += 1
+            return entry
+
+        # Hashed and parsed over the mapped file, the parsed stylesheet does not refer to the mapping
+        with open_mapped(path) as css_source:
+            content_hash = self.content_hash(css_source)
+            if entry is not None and entry['hash'] == content_hash:
+                # Touched, but not changed
+                self.hits += 1
+            else:
+                self.misses += 1
+                stylesheet = CssParser.parse(css_source)
+                index = RuleIndex()
+                for rule in stylesheet.style_rules(media, width):
+                    index.add(rule.selectors, rule.declarations)
+                entry = dict(version=StylesheetCache.VERSION, hash=content_hash, stylesheet=stylesheet, index=index)
+
+        entry.update(path=os.path.abspath(path), mtime=stat.st_mtime_ns, size=stat.st_size)
+        self.write(cache_path, entry)
+        return entry
+
+    def load(self, path: str, media: str = 'screen', width: float | None = None) -> RuleIndex:
+        return self.load_entry(path, media, width)['index']
+
+    def load_stylesheet(self, path: str, media: str = 'screen', width: float | None = None) -> CssStylesheet:
+        return self.load_entry(path, media, width)['stylesheet']
+
+    def stats(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses)
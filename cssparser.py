@@ -0,0 +1,181 @@
+import re
+
+
+token_pattern = re.compile(r'/\*.*?(?:\*/|\Z)|"(?:[^"\\]|\\.)*"?|\'(?:[^\'\\]|\\.)*\'?|[{};]', re.S)
+bytes_token_pattern = re.compile(token_pattern.pattern.encode(), re.S)
+media_feature_pattern = re.compile(r'\(\s*(min|max)-width\s*:\s*([\d.]+)(px|em|rem)\s*\)')
+
+
+class CssRule:
+    __slots__ = ('selectors', 'declarations')
+
+    # A qualified rule, the selector list and its declarations as (name, value) pairs
+    def __init__(self, selectors: str, declarations: [tuple]):
+        self.selectors = selectors
+        self.declarations = declarations
+
+    def __repr__(self):
+        return 'CssRule({0!r}, {1})'.format(self.selectors, len(self.declarations))
+
+
+class CssAtRule:
+    __slots__ = ('name', 'prelude', 'rules', 'declarations')
+
+    # An at-rule like @media with nested rules, @font-face with declarations or @import without a block
+    def __init__(self, name: str, prelude: str, rules: list = None, declarations: [tuple] = None):
+        self.name = name
+        self.prelude = prelude
+        self.rules = rules
+        self.declarations = declarations
+
+    def __repr__(self):
+        return 'CssAtRule({0!r}, {1!r})'.format(self.name, self.prelude)
+
+
+class CssStylesheet:
+    nested_at_rules = frozenset(['media', 'supports', 'document', '-moz-document', 'layer', 'container'])
+
+    def __init__(self, rules: list):
+        self.rules = rules
+
+    def __len__(self):
+        return len(self.rules)
+
+    @staticmethod
+    def media_matches(query_list: str, media: str, width: float | None) -> bool:
+        for query in query_list.lower().split(','):
+            tokens = query.replace('(', ' (').split()
+            if len(tokens) > 0 and tokens[0] == 'only':
+                tokens = tokens[1:]
+            if len(tokens) > 0 and tokens[0] == 'not':
+                continue
+            if len(tokens) > 0 and not tokens[0].startswith('(') and tokens[0] not in (media, 'all'):
+                continue
+            matches = True
+            for feature in re.findall(r'\([^)]*\)', query):
+                m = media_feature_pattern.match(feature)
+                if m is None or width is None:
+                    matches = False
+                    break
+                px = float(m.group(2)) * (1.0 if m.group(3) == 'px' else 16.0)
+                matches = width >= px if m.group(1) == 'min' else width <= px
+                if not matches:
+                    break
+            if matches:
+                return True
+        return False
+
+    # All qualified rules, that apply for the media type and the viewport width
+    def style_rules(self, media: str = 'screen', width: float | None = None, rules: list = None):
+        for rule in self.rules if rules is None else rules:
+            if type(rule) is CssRule:
+                yield rule
+            elif rule.rules is not None and rule.name == 'media':
+                if CssStylesheet.media_matches(rule.prelude, media, width):
+                    yield from self.style_rules(media, width, rule.rules)
+            elif rule.rules is not None and rule.name in ('supports', 'layer', 'container'):
+                yield from self.style_rules(media, width, rule.rules)
+
+    def at_rules(self, name: str) -> [CssAtRule]:
+        return [rule for rule in self.rules if type(rule) is CssAtRule and rule.name == name]
+
+
+class CssParser:
+    # The css_source is a str, or bytes or a mmap, that are scanned in place
+    def __init__(self, css_source, encoding: str = 'utf-8'):
+        self.source = css_source
+        self.tokens = self.tokenize(css_source, encoding)
+
+    @staticmethod
+    def tokenize(css_source, encoding: str = 'utf-8'):
+        # Yields the text between the structural characters '{', '}' and ';', without comments.
+        # Of bytes only the text between the tokens is decoded
+        if isinstance(css_source, str):
+            pattern = token_pattern
+            decode = str
+        else:
+            pattern = bytes_token_pattern
+            decode = lambda raw: raw.decode(encoding, 'replace')
+        text = []
+        pos = 0
+        for m in pattern.finditer(css_source):
+            # Comments and strings are skipped without being decoded
+            token = decode(m.group(0)[:1])
+            if token == '/':
+                text.append(decode(css_source[pos:m.start()]))
+                text.append(' ')
+            elif token in '"\'':
+                continue
+            else:
+                text.append(decode(css_source[pos:m.start()]))
+                yield ''.join(text), token
+                text = []
+            pos = m.end()
+        text.append(decode(css_source[pos:]))
+        yield ''.join(text), None
+
+    @staticmethod
+    def declaration(text: str) -> tuple | None:
+        pos_colon = text.find(':')
+        if pos_colon == -1:
+            return None
+        name = text[:pos_colon].strip().lower()
+        value = text[pos_colon+1:].strip()
+        pos_important = value.rfind('!')
+        if pos_important > -1 and value[pos_important+1:].strip().lower() == 'important':
+            value = value[:pos_important].rstrip() + ' !important'
+        if len(name) == 0 or len(value) == 0:
+            return None
+        return name, value
+
+    def skip_block(self):
+        depth = 1
+        for text, token in self.tokens:
+            if token == '{':
+                depth += 1
+            elif token == '}' or token is None:
+                depth -= 1
+                if depth == 0 or token is None:
+                    return
+
+    def declarations(self) -> [tuple]:
+        declarations = []
+        for text, token in self.tokens:
+            if token == '{':
+                # Nested blocks inside of declarations, like margin boxes of @page, are skipped
+                self.skip_block()
+                continue
+            declaration = self.declaration(text)
+            if declaration is not None:
+                declarations.append(declaration)
+            if token == '}' or token is None:
+                break
+        return declarations
+
+    def rules(self, nested: bool = False) -> list:
+        rules = []
+        for text, token in self.tokens:
+            prelude = text.strip()
+            if token == '{':
+                if prelude.startswith('@'):
+                    name, _, at_prelude = prelude[1:].partition(' ')
+                    name = name.lower()
+                    if name in CssStylesheet.nested_at_rules or name.endswith('keyframes'):
+                        rules.append(CssAtRule(name, at_prelude.strip(), rules=self.rules(True)))
+                    else:
+                        rules.append(CssAtRule(name, at_prelude.strip(), declarations=self.declarations()))
+                else:
+                    rules.append(CssRule(' '.join(prelude.split()), self.declarations()))
+            elif token == ';':
+                if prelude.startswith('@'):
+                    name, _, at_prelude = prelude[1:].partition(' ')
+                    rules.append(CssAtRule(name.lower(), at_prelude.strip()))
+            elif token == '}' and nested:
+                break
+            elif token is None:
+                break
+        return rules
+
+    @staticmethod
+    def parse(css_source, encoding: str = 'utf-8') -> CssStylesheet:
+        return CssStylesheet(CssParser(css_source, encoding).rules())
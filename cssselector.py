@@ -0,0 +1,406 @@
+import re
+
+from .dom import HtmlDom
+from .symbols import symbols, ID
+
+
+ident_pattern = re.compile(r'(?:[\w-]|\\.)+')
+attr_op_pattern = re.compile(r'\s*([~|^$*]?=)\s*')
+nth_pattern = re.compile(r'^([+-]?\d*)n\s*(?:([+-])\s*(\d+))?$')
+
+# Tests of an attribute value against the value of an attribute selector, by operator
+attr_value_tests = {
+    '=': lambda v, t: v == t,
+    '|=': lambda v, t: v == t or v.startswith(t + '-'),
+    '~=': lambda v, t: t in v.split(),
+    '^=': lambda v, t: len(t) > 0 and v.startswith(t),
+    '$=': lambda v, t: len(t) > 0 and v.endswith(t),
+    '*=': lambda v, t: len(t) > 0 and t in v,
+}
+
+
+class CssCompound:
+    __slots__ = ('tagid', 'idval', 'classids', 'attrs', 'pseudos', 'negations')
+
+    structural_pseudos = frozenset(['nth-child', 'nth-last-child', 'nth-of-type', 'nth-last-of-type', 'empty'])
+
+    # One compound selector like 'a.button[href]:first-child', tagid -1 matches every tag
+    def __init__(self):
+        self.tagid = -1
+        self.idval = None
+        self.classids = []
+        self.attrs = []
+        self.pseudos = []
+        self.negations = []
+
+    def __getstate__(self):
+        # Symbol ids are only valid in this process, pickle the names
+        names = symbols.names
+        return (names[self.tagid] if self.tagid > -1 else None, self.idval,
+                [names[classid] for classid in self.classids],
+                [(names[attrid], op, value) for attrid, op, value in self.attrs],
+                self.pseudos, self.negations)
+
+    def __setstate__(self, state):
+        tagname, self.idval, classnames, attrs, self.pseudos, self.negations = state
+        self.tagid = -1 if tagname is None else symbols.intern(tagname)
+        self.classids = [symbols.intern(name) for name in classnames]
+        self.attrs = [(symbols.intern(name), op, value) for name, op, value in attrs]
+
+    def is_structural(self) -> bool:
+        # Depends on the siblings or the children of the element, not only on the element and its ancestors
+        for pseudo in self.pseudos:
+            if pseudo[0] in CssCompound.structural_pseudos:
+                return True
+        for negation in self.negations:
+            if negation.is_structural():
+                return True
+        return False
+
+    def matches(self, dom: HtmlDom, index: int) -> bool:
+        if self.tagid > -1 and dom.tag[index] != self.tagid:
+            return False
+        attributes = dom.attributes[index]
+        if self.idval is not None and attributes.get(ID) != self.idval:
+            return False
+        if len(self.classids) > 0:
+            classnames = dom.classnames[index]
+            for classid in self.classids:
+                if classid not in classnames:
+                    return False
+        for attrid, op, value in self.attrs:
+            attrval = attributes.get(attrid)
+            if attrval is None or (op is not None and not attr_value_tests[op](attrval, value)):
+                return False
+        for pseudo in self.pseudos:
+            if not CssPseudoClasses.match(pseudo, dom, index):
+                return False
+        for negation in self.negations:
+            if negation.matches(dom, index):
+                return False
+        return True
+
+
+class CssPseudoClasses:
+    @staticmethod
+    def nth(expr: str) -> tuple:
+        expr = expr.strip().lower()
+        if expr == 'odd':
+            return 2, 1
+        if expr == 'even':
+            return 2, 0
+        if expr.lstrip('+-').isdigit():
+            return 0, int(expr)
+        m = nth_pattern.match(expr)
+        if m is None:
+            raise TypeError("'{0}' is not an nth expression.".format(expr))
+        a = m.group(1)
+        a = 1 if a in ('', '+') else -1 if a == '-' else int(a)
+        b = 0 if m.group(3) is None else int(m.group(3)) * (-1 if m.group(2) == '-' else 1)
+        return a, b
+
+    @staticmethod
+    def nth_match(a: int, b: int, pos: int) -> bool:
+        if a == 0:
+            return pos == b
+        return (pos - b) % a == 0 and (pos - b) // a >= 0
+
+    @staticmethod
+    def is_empty(dom: HtmlDom, index: int) -> bool:
+        child = dom.first_child[index]
+        while child != HtmlDom.NONE:
+            if dom.tag[child] != HtmlDom.TEXT or dom.body_end[child] > dom.body_start[child]:
+                return False
+            child = dom.next_sibling[child]
+        return True
+
+    @staticmethod
+    def match(pseudo: tuple, dom: HtmlDom, index: int) -> bool:
+        name, a, b = pseudo
+        if name == 'root':
+            return dom.parent[index] == 0
+        if name == 'empty':
+            return CssPseudoClasses.is_empty(dom, index)
+        if name in ('link', 'any-link'):
+            return symbols.get('href') in dom.attributes[index]
+        if name in ('disabled', 'checked', 'required', 'readonly'):
+            return symbols.get(name) in dom.attributes[index]
+        if name == 'enabled':
+            return symbols.get('disabled') not in dom.attributes[index]
+
+        dom.index_siblings()
+        if name == 'nth-child':
+            return CssPseudoClasses.nth_match(a, b, dom.element_index[index])
+        if name == 'nth-last-child':
+            return CssPseudoClasses.nth_match(a, b, dom.element_count[index] - dom.element_index[index] + 1)
+        if name == 'nth-of-type':
+            return CssPseudoClasses.nth_match(a, b, dom.type_index[index])
+        if name == 'nth-last-of-type':
+            return CssPseudoClasses.nth_match(a, b, dom.type_count[index] - dom.type_index[index] + 1)
+        # Dynamic states like hover or focus never match on a rendered page
+        return False
+
+    aliases = {
+        'first-child': ('nth-child', 0, 1),
+        'last-child': ('nth-last-child', 0, 1),
+        'first-of-type': ('nth-of-type', 0, 1),
+        'last-of-type': ('nth-last-of-type', 0, 1),
+    }
+
+    @staticmethod
+    def compile(name: str, arg: str | None) -> [tuple]:
+        if name in CssPseudoClasses.aliases:
+            return [CssPseudoClasses.aliases[name]]
+        if name == 'only-child':
+            return [('nth-child', 0, 1), ('nth-last-child', 0, 1)]
+        if name == 'only-of-type':
+            return [('nth-of-type', 0, 1), ('nth-last-of-type', 0, 1)]
+        if name.startswith('nth-'):
+            if arg is None:
+                raise TypeError("':{0}' needs an argument.".format(name))
+            a, b = CssPseudoClasses.nth(arg)
+            return [(name, a, b)]
+        return [(name, 0, 0)]
+
+
+class CompiledSelector:
+    __slots__ = ('text', 'compounds', 'combinators', 'specificity', 'pseudo_element', 'structural')
+
+    # Compounds and combinators are stored right to left, combinators[k] joins compounds[k] and compounds[k+1]
+    def __init__(self, text: str, compounds: [CssCompound], combinators: [str], specificity: tuple,
+                 pseudo_element: str | None = None):
+        self.text = text
+        self.compounds = compounds
+        self.combinators = combinators
+        self.specificity = specificity
+        self.pseudo_element = pseudo_element
+        self.structural = '+' in combinators or '~' in combinators \
+            or any([compound.is_structural() for compound in compounds])
+
+    def __repr__(self):
+        return 'CompiledSelector({0!r})'.format(self.text)
+
+    def rightmost(self) -> CssCompound:
+        return self.compounds[0]
+
+    def matches(self, dom: HtmlDom, index: int) -> bool:
+        # A pseudo element styles generated content, never the element itself
+        if self.pseudo_element is not None:
+            return False
+        return self.match_from(dom, index, 0)
+
+    def match_from(self, dom: HtmlDom, index: int, k: int) -> bool:
+        if not self.compounds[k].matches(dom, index):
+            return False
+        if k + 1 == len(self.compounds):
+            return True
+
+        combinator = self.combinators[k]
+        if combinator == '>':
+            parent = dom.parent[index]
+            return parent > 0 and self.match_from(dom, parent, k + 1)
+        if combinator == ' ':
+            parent = dom.parent[index]
+            while parent > 0:
+                if self.match_from(dom, parent, k + 1):
+                    return True
+                parent = dom.parent[parent]
+            return False
+
+        dom.index_siblings()
+        sibling = dom.prev_element[index]
+        if combinator == '+':
+            return sibling != HtmlDom.NONE and self.match_from(dom, sibling, k + 1)
+        while sibling != HtmlDom.NONE:
+            if self.match_from(dom, sibling, k + 1):
+                return True
+            sibling = dom.prev_element[sibling]
+        return False
+
+
+class SelectorParser:
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+        self.pseudo_element = None
+
+    def error(self):
+        raise TypeError("'{0}' is not a valid selector.".format(self.text))
+
+    def peek(self) -> str:
+        return self.text[self.pos:self.pos+1]
+
+    def skip_ws(self) -> bool:
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos].isspace():
+            self.pos += 1
+        return self.pos > start
+
+    def ident(self) -> str:
+        m = ident_pattern.match(self.text, self.pos)
+        if m is None:
+            self.error()
+        self.pos = m.end()
+        return m.group(0).replace('\\', '')
+
+    def until_closing(self, opening: str, closing: str) -> str:
+        # Returns the text up to the matching closing bracket and skips it
+        depth = 1
+        start = self.pos
+        quote = None
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            self.pos += 1
+            if quote is not None:
+                if char == quote:
+                    quote = None
+            elif char in '"\'':
+                quote = char
+            elif char == opening:
+                depth += 1
+            elif char == closing:
+                depth -= 1
+                if depth == 0:
+                    return self.text[start:self.pos-1]
+        self.error()
+
+    @staticmethod
+    def split_list(text: str) -> [str]:
+        # Splits a selector list at the commas outside of brackets and strings
+        parts = []
+        depth = 0
+        quote = None
+        start = 0
+        for idx, char in enumerate(text):
+            if quote is not None:
+                if char == quote:
+                    quote = None
+            elif char in '"\'':
+                quote = char
+            elif char in '([':
+                depth += 1
+            elif char in ')]':
+                depth -= 1
+            elif char == ',' and depth == 0:
+                parts.append(text[start:idx])
+                start = idx + 1
+        parts.append(text[start:])
+        return parts
+
+    def attribute(self, compound: CssCompound, specificity: list):
+        inner = self.until_closing('[', ']').strip()
+        m = ident_pattern.match(inner)
+        if m is None:
+            self.error()
+        attrid = symbols.intern(m.group(0).replace('\\', '').lower())
+        rest = inner[m.end():]
+        op = attr_op_pattern.match(rest)
+        if op is None:
+            if len(rest.strip()) > 0:
+                self.error()
+            compound.attrs.append((attrid, None, None))
+        else:
+            value = rest[op.end():].strip()
+            if value.endswith((' i', ' s')):
+                value = value[:-2].strip()
+            if len(value) > 1 and value[0] in '"\'' and value[-1] == value[0]:
+                value = value[1:-1]
+            compound.attrs.append((attrid, op.group(1), value))
+        specificity[1] += 1
+
+    def pseudo(self, compound: CssCompound, specificity: list) -> str | None:
+        self.pos += 1
+        element = self.peek() == ':'
+        if element:
+            self.pos += 1
+        name = self.ident().lower()
+        arg = None
+        if self.peek() == '(':
+            self.pos += 1
+            arg = self.until_closing('(', ')')
+
+        if element or name in ('before', 'after', 'first-line', 'first-letter'):
+            specificity[2] += 1
+            return name
+        if name == 'not':
+            if arg is None:
+                self.error()
+            for part in SelectorParser.split_list(arg):
+                negation = SelectorParser(part.strip())
+                compound.negations.append(negation.compound(specificity))
+                if negation.pos < len(negation.text):
+                    negation.error()
+            return None
+        compound.pseudos += CssPseudoClasses.compile(name, arg)
+        specificity[1] += 1
+        return None
+
+    def compound(self, specificity: list) -> CssCompound:
+        compound = CssCompound()
+        pseudo_element = None
+        start = self.pos
+        char = self.peek()
+        if char == '*':
+            self.pos += 1
+        elif len(char) > 0 and ident_pattern.match(char) is not None:
+            compound.tagid = symbols.intern(self.ident().lower())
+            specificity[2] += 1
+
+        while self.pos < len(self.text):
+            char = self.peek()
+            if char == '#':
+                self.pos += 1
+                compound.idval = self.ident()
+                specificity[0] += 1
+            elif char == '.':
+                self.pos += 1
+                compound.classids.append(symbols.intern(self.ident()))
+                specificity[1] += 1
+            elif char == '[':
+                self.pos += 1
+                self.attribute(compound, specificity)
+            elif char == ':':
+                pseudo_element = self.pseudo(compound, specificity) or pseudo_element
+            else:
+                break
+
+        if self.pos == start:
+            self.error()
+        self.pseudo_element = pseudo_element
+        return compound
+
+    def selector(self) -> CompiledSelector:
+        specificity = [0, 0, 0]
+        compounds = []
+        combinators = []
+        pseudo_element = None
+        self.skip_ws()
+        while True:
+            compounds.append(self.compound(specificity))
+            if self.pseudo_element is not None:
+                pseudo_element = self.pseudo_element
+            had_ws = self.skip_ws()
+            if self.pos >= len(self.text):
+                break
+            char = self.peek()
+            if char in '>+~':
+                self.pos += 1
+                self.skip_ws()
+                combinators.append(char)
+            elif had_ws:
+                combinators.append(' ')
+            else:
+                self.error()
+
+        compounds.reverse()
+        combinators.reverse()
+        return CompiledSelector(self.text.strip(), compounds, combinators, tuple(specificity), pseudo_element)
+
+    @staticmethod
+    def compile(selector_list: str) -> [CompiledSelector]:
+        return [SelectorParser(part.strip()).selector() for part in SelectorParser.split_list(selector_list)]
+
+
+def select(dom: HtmlDom, selector_list: str) -> [int]:
+    selectors = SelectorParser.compile(selector_list)
+    return [index for index in dom.elements() if any([sel.matches(dom, index) for sel in selectors])]
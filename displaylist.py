@@ -0,0 +1,63 @@
+from typing import Any, Callable, Iterable
+
+from .pycairo.cairo import Context, Filter, Format, ImageSurface, RecordingSurface, Surface
+from .backends import OutputBackend, RecordingBackend
+from .cairohtml import HtmlSurface
+from .html import HtmlTag
+from .province_css import Css, Font
+
+
+class DisplayList:
+    # The drawing operations of one layout and paint pass, replayable onto any surface at any scale
+    def __init__(self, recording: RecordingSurface, width: float, height: float):
+        self.recording = recording
+        self.width = width
+        self.height = height
+
+    @staticmethod
+    def record(html_tag: HtmlTag, font_family: str, width: float, height: float, css: Css = None,
+               font: Font = None):
+        surface = HtmlSurface(font_family, width, height, RecordingBackend(), css, font)
+        surface.html(html_tag)
+        return DisplayList(surface.finish_output(), width, height)
+
+    @staticmethod
+    def fromSource(doc: str, font_family: str, width: float, height: float, css: Css = None, font: Font = None):
+        return DisplayList.record(HtmlTag.fromSource(doc), font_family, width, height, css, font)
+
+    def size(self, scale: float) -> (int, int):
+        return max(1, round(self.width * scale)), max(1, round(self.height * scale))
+
+    # Paints the recording onto target, scaled by scale and with its origin at x, y
+    def replay(self, target: Surface, scale: float = 1.0, x: float = 0.0, y: float = 0.0):
+        ctx = Context(target)
+        ctx.translate(x, y)
+        ctx.scale(scale, scale)
+        ctx.set_source_surface(self.recording, 0, 0)
+        if scale < 1.0:
+            # Thumbnails are resampled, not point sampled
+            ctx.get_source().set_filter(Filter.GOOD)
+        ctx.rectangle(0, 0, self.width, self.height)
+        ctx.fill()
+        target.flush()
+
+    def rasterize(self, scale: float = 1.0) -> ImageSurface:
+        width, height = self.size(scale)
+        image = ImageSurface(Format.ARGB32, width, height)
+        self.replay(image, scale)
+        return image
+
+    # Replays into the surface of backend and completes its output
+    def render(self, backend: OutputBackend, scale: float = 1.0) -> Any:
+        width, height = self.size(scale)
+        target = backend.create_surface(width, height)
+        self.replay(target, scale)
+        return backend.finish(target)
+
+    # Yields (scale, output) for every scale, the layout is not repeated
+    def render_scales(self, scales: Iterable[float], backend_factory: Callable[[float], OutputBackend]):
+        for scale in scales:
+            yield scale, self.render(backend_factory(scale), scale)
+
+    def finish(self):
+        self.recording.finish()
@@ -0,0 +1,252 @@
+from array import array
+from types import MappingProxyType
+
+from .nodes import HtmlSource
+from .symbols import symbols, parse_attrs, parse_classes, no_attributes, no_classes
+from .tokenizer import HtmlHandler, HtmlTokenizer
+
+
+class HtmlDom:
+    NONE = -1
+    TEXT = symbols.intern('')
+    DOCUMENT = symbols.intern('#document')
+
+    # All nodes of a document in parallel columns, node 0 is the document itself
+    def __init__(self, source: HtmlSource):
+        self.source = source
+        self.tag = array('i')
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        # Offsets take 4 bytes each, unless the source is larger than 2 GB
+        offset = 'i' if len(source) < 1 << 31 else 'q'
+        self.start = array(offset)
+        self.end = array(offset)
+        self.body_start = array(offset)
+        self.body_end = array(offset)
+        self.attrs_start = array(offset)
+        self.attrs_end = array(offset)
+        # Parsed attributes and class names of every node, None and no_classes for text. Elements with the same
+        # attribute text share one read-only dict and set, elements without attributes share no_attributes
+        self.attributes = []
+        self.classnames = []
+        # Positions among the element siblings, filled by index_siblings()
+        self.element_index = None
+        self.element_count = None
+        self.type_index = None
+        self.type_count = None
+        self.prev_element = None
+        self.add(HtmlDom.DOCUMENT, HtmlDom.NONE, 0, len(source), 0, len(source))
+
+    def __len__(self):
+        return len(self.tag)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.source.close()
+
+    def __getitem__(self, index: int):
+        return DomNode(self, index)
+
+    def add(self, tagid: int, parent: int, start: int, end: int, body_start: int, body_end: int,
+            attrs_start: int = 0, attrs_end: int = 0, attributes: dict = None, classnames: frozenset = None) -> int:
+        index = len(self.tag)
+        self.tag.append(tagid)
+        self.parent.append(parent)
+        self.first_child.append(HtmlDom.NONE)
+        self.next_sibling.append(HtmlDom.NONE)
+        self.start.append(start)
+        self.end.append(end)
+        self.body_start.append(body_start)
+        self.body_end.append(body_end)
+        self.attrs_start.append(attrs_start)
+        self.attrs_end.append(attrs_end)
+        self.attributes.append(attributes)
+        if classnames is None:
+            classnames = no_classes if attributes is None else parse_classes(attributes)
+        self.classnames.append(classnames)
+        return index
+
+    def children(self, index: int):
+        child = self.first_child[index]
+        next_sibling = self.next_sibling
+        while child != HtmlDom.NONE:
+            yield child
+            child = next_sibling[child]
+
+    def walk(self, index: int = 0):
+        # Pre-order over the subtree of index, without recursion
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+        parent = self.parent
+        node = index
+        while node != HtmlDom.NONE:
+            yield node
+            if first_child[node] != HtmlDom.NONE:
+                node = first_child[node]
+                continue
+            while node != index and next_sibling[node] == HtmlDom.NONE:
+                node = parent[node]
+            node = HtmlDom.NONE if node == index else next_sibling[node]
+
+    def elements(self, index: int = 0):
+        tag = self.tag
+        for node in self.walk(index):
+            if tag[node] > HtmlDom.DOCUMENT:
+                yield node
+
+    def index_siblings(self):
+        # Counts the element children of every parent once, for the structural pseudo classes
+        if self.element_index is not None:
+            return
+        size = len(self.tag)
+        tag = self.tag
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+        element_index = array('i', bytes(4 * size))
+        element_count = array('i', bytes(4 * size))
+        type_index = array('i', bytes(4 * size))
+        type_count = array('i', bytes(4 * size))
+        prev_element = array('i', [HtmlDom.NONE]) * size
+
+        for parent in range(size):
+            child = first_child[parent]
+            if child == HtmlDom.NONE:
+                continue
+            elements = []
+            types = dict()
+            prev = HtmlDom.NONE
+            while child != HtmlDom.NONE:
+                tagid = tag[child]
+                if tagid > HtmlDom.DOCUMENT:
+                    elements.append(child)
+                    element_index[child] = len(elements)
+                    types[tagid] = types.get(tagid, 0) + 1
+                    type_index[child] = types[tagid]
+                    prev_element[child] = prev
+                    prev = child
+                child = next_sibling[child]
+            for child in elements:
+                element_count[child] = len(elements)
+                type_count[child] = types[tag[child]]
+
+        self.element_count = element_count
+        self.type_index = type_index
+        self.type_count = type_count
+        self.prev_element = prev_element
+        self.element_index = element_index
+
+    @staticmethod
+    def fromSource(source, encoding: str = 'utf-8'):
+        builder = HtmlDomBuilder(HtmlSource(source, encoding))
+        HtmlTokenizer(builder.dom.source.buffer, encoding).tokenize(builder)
+        return builder.dom
+
+
+class DomNode:
+    __slots__ = ('dom', 'index')
+
+    # A view on one row of an HtmlDom
+    def __init__(self, dom: HtmlDom, index: int):
+        self.dom = dom
+        self.index = index
+
+    def __eq__(self, other):
+        return type(other) is DomNode and other.dom is self.dom and other.index == self.index
+
+    def __hash__(self):
+        return self.index
+
+    def __iter__(self):
+        return self.children()
+
+    def __repr__(self):
+        return 'DomNode({0!r}, {1})'.format(self.tagname, self.index)
+
+    @property
+    def tagid(self) -> int:
+        return self.dom.tag[self.index]
+
+    @property
+    def tagname(self) -> str:
+        return symbols.name(self.dom.tag[self.index])
+
+    @property
+    def attributes(self) -> dict:
+        return self.dom.attributes[self.index]
+
+    @property
+    def classnames(self) -> frozenset:
+        return self.dom.classnames[self.index]
+
+    def attr(self, key: str) -> str | None:
+        attributes = self.dom.attributes[self.index]
+        return None if attributes is None else attributes.get(symbols.get(key))
+
+    @property
+    def content(self) -> str:
+        return self.dom.source.text(self.dom.body_start[self.index], self.dom.body_end[self.index])
+
+    @property
+    def classes(self) -> str:
+        return self.dom.source.text(self.dom.attrs_start[self.index], self.dom.attrs_end[self.index]).strip()
+
+    @property
+    def parent(self):
+        parent = self.dom.parent[self.index]
+        return None if parent == HtmlDom.NONE else DomNode(self.dom, parent)
+
+    def is_text(self) -> bool:
+        return self.dom.tag[self.index] == HtmlDom.TEXT
+
+    def children(self):
+        for child in self.dom.children(self.index):
+            yield DomNode(self.dom, child)
+
+
+class HtmlDomBuilder(HtmlHandler):
+    def __init__(self, source: HtmlSource):
+        self.dom = HtmlDom(source)
+        self.current = 0
+        self.last_child = array('i', [HtmlDom.NONE])
+        # Attributes and class names by attribute text, for the elements of this document to share
+        self.shared_attributes = {'': (no_attributes, no_classes)}
+
+    def append(self, index: int):
+        dom = self.dom
+        self.last_child.append(HtmlDom.NONE)
+        last = self.last_child[self.current]
+        if last == HtmlDom.NONE:
+            dom.first_child[self.current] = index
+        else:
+            dom.next_sibling[last] = index
+        self.last_child[self.current] = index
+
+    def start(self, tagname: str, attrs_start: int, attrs_end: int, start: int, end: int):
+        dom = self.dom
+        attrs_text = dom.source.text(attrs_start, attrs_end).strip()
+        shared = self.shared_attributes.get(attrs_text)
+        if shared is None:
+            # Read-only, a change through one element would show in every element sharing the dict
+            attributes = MappingProxyType(parse_attrs(attrs_text))
+            shared = (attributes, parse_classes(attributes))
+            self.shared_attributes[attrs_text] = shared
+        index = dom.add(symbols.intern(tagname), self.current, start, end, end, end, attrs_start, attrs_end,
+                        shared[0], shared[1])
+        self.append(index)
+        self.current = index
+
+    def end(self, tagname: str, start: int, end: int):
+        dom = self.dom
+        dom.body_end[self.current] = start
+        dom.end[self.current] = end
+        self.current = dom.parent[self.current]
+
+    def text(self, start: int, end: int):
+        index = self.dom.add(HtmlDom.TEXT, self.current, start, end, start, end)
+        self.append(index)
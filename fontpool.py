@@ -0,0 +1,83 @@
+import collections
+import threading
+
+from .pycairo.cairo import Context, FontOptions, FontSlant, FontWeight, Matrix, ScaledFont, ToyFontFace
+from .textcache import TextCache
+
+
+class FontPool:
+    # Font faces and scaled fonts shared by all contexts of the process, switching fonts is one set_scaled_font
+    def __init__(self, max_scaled_fonts: int = 512):
+        self.max_scaled_fonts = max_scaled_fonts
+        self.options = FontOptions()
+        self.faces = dict()
+        self.scaled_fonts = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def face(self, family: str, slant: FontSlant, weight: FontWeight) -> ToyFontFace:
+        key = (family, int(slant), int(weight))
+        font_face = self.faces.get(key)
+        if font_face is None:
+            with self.lock:
+                font_face = self.faces.get(key)
+                if font_face is None:
+                    font_face = ToyFontFace(family, slant, weight)
+                    self.faces[key] = font_face
+        return font_face
+
+    # Returns (key, scaled font), the key is the font key of the text and glyph caches
+    def get(self, family: str, slant: FontSlant, weight: FontWeight, size: float,
+            options: FontOptions = None) -> (tuple, ScaledFont):
+        options = self.options if options is None else options
+        key = TextCache.font_key(family, slant, weight, size, options)
+        with self.lock:
+            scaled_font = self.lookup(key)
+        if scaled_font is not None:
+            return key, scaled_font
+        font_face = self.face(family, slant, weight)
+        with self.lock:
+            # Another thread may have created the font meanwhile
+            scaled_font = self.lookup(key)
+            if scaled_font is None:
+                self.misses += 1
+                scaled_font = ScaledFont(font_face, Matrix(xx=size, yy=size), Matrix(), options)
+                self.scaled_fonts[key] = scaled_font
+                if len(self.scaled_fonts) > self.max_scaled_fonts:
+                    self.scaled_fonts.popitem(last=False)
+        return key, scaled_font
+
+    # A hit makes the font the most recently used, the least recently used is evicted first. Needs the lock
+    def lookup(self, key: tuple) -> ScaledFont | None:
+        scaled_font = self.scaled_fonts.get(key)
+        if scaled_font is not None:
+            self.hits += 1
+            self.scaled_fonts.move_to_end(key)
+        return scaled_font
+
+    def scaled_font(self, family: str, slant: FontSlant, weight: FontWeight, size: float,
+                    options: FontOptions = None) -> ScaledFont:
+        return self.get(family, slant, weight, size, options)[1]
+
+    # The css_font is a CssFont
+    def get_css_font(self, css_font, options: FontOptions = None) -> (tuple, ScaledFont):
+        return self.get(css_font.name, css_font.slant(), css_font.weight(), css_font.fontsize, options)
+
+    # Sets the pooled font on ctx and returns its key
+    def use(self, ctx: Context, family: str, slant: FontSlant, weight: FontWeight, size: float,
+            options: FontOptions = None) -> tuple:
+        key, scaled_font = self.get(family, slant, weight, size, options)
+        ctx.set_scaled_font(scaled_font)
+        return key
+
+    def use_css_font(self, ctx: Context, css_font, options: FontOptions = None) -> tuple:
+        key, scaled_font = self.get_css_font(css_font, options)
+        ctx.set_scaled_font(scaled_font)
+        return key
+
+    def stats(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses, faces=len(self.faces), scaled_fonts=len(self.scaled_fonts))
+
+
+font_pool = FontPool()
@@ -0,0 +1,87 @@
+from .pycairo.cairo import Context, Glyph, ScaledFont, TextCluster
+from .textcache import TextCache
+
+
+class GlyphRun:
+    __slots__ = ('scaled_font', 'color', 'glyphs', 'text', 'clusters')
+
+    # The glyphs of one font and color, with the text and clusters for show_text_glyphs
+    def __init__(self, scaled_font: ScaledFont, color: tuple | None):
+        self.scaled_font = scaled_font
+        self.color = color
+        self.glyphs = []
+        self.text = ''
+        self.clusters = []
+
+
+class GlyphBatch:
+    # Collects positioned glyphs and shows all glyphs of one font and color with one call.
+    # with_clusters keeps the text, so show_text_glyphs makes it selectable in PDF output
+    def __init__(self, ctx: Context, with_clusters: bool = False, cache: TextCache = None):
+        self.ctx = ctx
+        self.with_clusters = with_clusters
+        self.cache = glyph_cache if cache is None else cache
+        self.runs = dict()
+        self.scaled_font = None
+        self.font_key = None
+
+    def __len__(self):
+        return sum(len(run.glyphs) for run in self.runs.values())
+
+    def set_font(self, scaled_font: ScaledFont, font_key: tuple):
+        self.scaled_font = scaled_font
+        self.font_key = font_key
+
+    # Reads the font of ctx once, instead of for every run
+    def use_context_font(self):
+        self.set_font(self.ctx.get_scaled_font(), TextCache.context_font_key(self.ctx))
+
+    # Converts text to glyphs at the origin once, returns (advance, clusters, *glyphs)
+    def shape(self, text: str) -> tuple:
+        shaped = self.cache.get(self.font_key, text)
+        if shaped is None:
+            glyphs, clusters, flags = self.scaled_font.text_to_glyphs(0.0, 0.0, text, True)
+            advance = self.scaled_font.text_extents(text)[4]
+            shaped = (advance, tuple(clusters)) + tuple(glyphs)
+            self.cache.put(self.font_key, text, shaped)
+        return shaped
+
+    # Adds text with its origin at x, y and returns its advance
+    def add_text(self, text: str, x: float, y: float, color: tuple = None, letter_spacing: float = 0.0) -> float:
+        shaped = self.shape(text)
+        key = (self.font_key, color)
+        run = self.runs.get(key)
+        if run is None:
+            run = GlyphRun(self.scaled_font, color)
+            self.runs[key] = run
+        glyphs = run.glyphs
+        for position in range(2, len(shaped)):
+            glyph = shaped[position]
+            glyphs.append(Glyph(glyph[0], x + glyph[1] + letter_spacing * (position - 2), y + glyph[2]))
+        if self.with_clusters:
+            if len(run.text) > 0:
+                # The space between two texts has no glyph
+                run.text += ' '
+                run.clusters.append(TextCluster(1, 0))
+            run.text += text
+            run.clusters.extend(shaped[1])
+        return shaped[0] + letter_spacing * (len(shaped) - 3 if len(shaped) > 2 else 0)
+
+    def flush(self):
+        if len(self.runs) == 0:
+            return
+        ctx = self.ctx
+        ctx.save()
+        for run in self.runs.values():
+            ctx.set_scaled_font(run.scaled_font)
+            if run.color is not None:
+                ctx.set_source_rgba(*run.color)
+            if self.with_clusters:
+                ctx.show_text_glyphs(run.text, run.glyphs, run.clusters, 0)
+            else:
+                ctx.show_glyphs(run.glyphs)
+        ctx.restore()
+        self.runs.clear()
+
+
+glyph_cache = TextCache(16 << 20)
@@ -1,6 +1,8 @@
 
 from .cacao import Cacao, Stack, cacao
+from .symbols import symbols, no_classes
 from .util import HtmlTagBasic
+from .tokenizer import HtmlHandler, HtmlTokenizer
 
 
 class HtmlSourceEnvironment(Cacao.Environment):
@@ -26,70 +28,130 @@ class HtmlTag(HtmlTagBasic):
     tagname = ''
     tagname_cairo = ''
     classes = ''
-    content = ''
     childs = []
 
     pre_tag = ''
     post_tag =''
 
-    def __init__(self, tagname: str, classes: str, content: str, pre: str = '', post: str = ''):
-        super().__init__(content)
+    # The string of a tag is its opening tag, the string of a text node its text
+    def __new__(cls, tagname: str, classes: str, content: str, pre: str = '', post: str = '',
+                children: list = None, body: tuple = None):
+        return super().__new__(cls, content if len(tagname) == 0 else '<' + tagname + ' ' + classes + '>')
+
+    # body is (source, start, end), the content is sliced from the source, when it is read
+    def __init__(self, tagname: str, classes: str, content: str, pre: str = '', post: str = '',
+                 children: list = None, body: tuple = None):
+        if len(tagname) > 0:
+            super().__init__('<' + tagname + ' ' + classes + '>')
+        else:
+            # A text node has no tag to parse
+            self.attrs = list()
+            self.closing = False
+            self.tagid = symbols.intern(tagname)
+            self.attributes = dict()
+            self.classnames = no_classes
         self.tagname = tagname
         self.tagname_cairo = str()
         self.classes = classes
-        self.content = content
-        self.children = self.scan_for_children(content)
+        self.body = (content, 0, len(content)) if body is None else body
+        self.children = self.scan_for_children(self.content) if children is None else children
         self.pre_tag = pre
         self.post_tag = post
 
+    @property
+    def content(self) -> str:
+        source, start, end = self.body
+        if start == 0 and end == len(source):
+            return source
+        return source[start:end]
+
     def __iter__(self):
-        return self.childs
+        return iter(self.children)
+
+    def is_text(self) -> bool:
+        return len(self.tagname) == 0
 
     def has_child_tags(self):
         return len(self.children) > 1
 
-    def scan_for_children(self, html_tag_str: str, varstack: Stack = Stack()):
-        # Read pre and post for the first child
-        cacao_html.templates.scan_child.transform(html_tag_str, varstack)
-        html_tag_list = list()
-        if len(varstack.html_tag) is 0:
-            html_tag = HtmlTag('', '', html_tag_str)
-            html_tag_list.append(html_tag)
-            return html_tag_list
-        # Create html tag
-        cacao_html.templates.html.transform(varstack.html_tag, varstack)
-        varstack.until = str()
-        cacao_html.templates.until.transform(varstack.post, varstack)
-        html_tag = HtmlTag(varstack.starttag, varstack.classes, varstack.htmlbody, varstack.pre, varstack.until)
-        html_tag_list.append(html_tag)
-
-        while len(varstack.post) > 0:
-            # Find out, if a tag will follow
-            varstack.until = str()
-            cacao_html.templates.until.transform(varstack.post, varstack)
-            if len(varstack.until) is 0:
-                html_tag = HtmlTag('', '', varstack.post)
-                html_tag_list.append(html_tag)
-                varstack.post = str()
-            else:
-                # Scan for more children
-                html_chlds = self.scan_for_children(varstack.post)
-                html_tag_list.append(html_chlds)
-
-        return html_tag_list
+    def scan_for_children(self, html_tag_str: str):
+        if len(self.tagname) == 0:
+            return []
+        # Tokenize the body once and build all children from the events
+        builder = HtmlTokenizer(html_tag_str).tokenize(HtmlTreeBuilder(html_tag_str))
+        return builder.children()
 
     @staticmethod
     def fromSource(html_tag_str: str):
-        # Create a new Stack for reading the tags
-        varstack = Stack()
-        # Read the most outer tag to environment
-        cacao_html.templates.scan.transform(html_tag_str, varstack)
-        # Create a html tag with the values from stack
-        return HtmlTag(varstack.starttag, varstack.classes, varstack.htmlbody, varstack.pre, varstack.post)
+        builder = HtmlTokenizer(html_tag_str).tokenize(HtmlTreeBuilder(html_tag_str))
+        # The most outer tag of the source
+        return builder.outer()
 
     def html(self):
 
         return self
 
 
+class HtmlTreeBuilder(HtmlHandler):
+    class Frame:
+        def __init__(self, tagname: str, classes: str, pre: str, body_start: int):
+            self.tagname = tagname
+            self.classes = classes
+            self.pre = pre
+            self.body_start = body_start
+            self.children = []
+            self.texts = []
+
+    def __init__(self, source: str):
+        self.source = source
+        self.stack = [HtmlTreeBuilder.Frame('', '', '', 0)]
+
+    def pending_text(self, frame: Frame) -> str:
+        text = ''.join([self.source[start:end] for start, end in frame.texts])
+        frame.texts = []
+        return text
+
+    def start(self, tagname: str, attrs_start: int, attrs_end: int, start: int, end: int):
+        frame = self.stack[-1]
+        text = self.pending_text(frame)
+        pre = str()
+        if len(frame.children) == 0:
+            # Text in front of the first child tag is its pre tag text
+            pre = text
+        else:
+            frame.children[-1].post_tag += text
+        classes = self.source[attrs_start:attrs_end].strip()
+        self.stack.append(HtmlTreeBuilder.Frame(tagname, classes, pre, end))
+
+    def end(self, tagname: str, start: int, end: int):
+        frame = self.stack.pop()
+        text = self.pending_text(frame)
+        if len(frame.children) == 0:
+            if len(text) > 0:
+                frame.children.append(HtmlTag('', '', text, children=[]))
+        else:
+            # Text after a child tag is its post tag text
+            frame.children[-1].post_tag += text
+        # Only the offsets of the body are kept, copying it for every closing tag is quadratic in the depth
+        html_tag = HtmlTag(frame.tagname, frame.classes, '', frame.pre, children=frame.children,
+                           body=(self.source, frame.body_start, start))
+        self.stack[-1].children.append(html_tag)
+
+    def text(self, start: int, end: int):
+        self.stack[-1].texts.append((start, end))
+
+    def children(self) -> [HtmlTag]:
+        root = self.stack[0]
+        text = self.pending_text(root)
+        if len(root.children) == 0:
+            return [HtmlTag('', '', text, children=[])]
+        root.children[-1].post_tag += text
+        return root.children
+
+    def outer(self) -> HtmlTag:
+        return self.children()[0]
+
+
+
 def html(html_str):
+    return HtmlTag.fromSource(html_str)
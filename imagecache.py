@@ -0,0 +1,130 @@
+import collections
+import hashlib
+import io
+import os
+import threading
+
+from .pycairo.cairo import Context, Filter, Format, ImageSurface, Operator
+
+
+class ImageCache:
+    # Decoded images by (content hash, width, height), the decoded PNG has the size None, None,
+    # least recently used evicted first, when the pixels take more than max_bytes.
+    # The content hashes of the last max_paths files are kept, so unchanged files are not read again
+    def __init__(self, max_bytes: int = 64 << 20, max_paths: int = 1024):
+        self.max_bytes = max_bytes
+        self.max_paths = max_paths
+        self.entries = collections.OrderedDict()
+        self.paths = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def surface_size(surface: ImageSurface) -> int:
+        return surface.get_stride() * surface.get_height()
+
+    def get(self, key: tuple) -> ImageSurface | None:
+        with self.lock:
+            surface = self.entries.get(key)
+            if surface is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surface
+
+    def put(self, key: tuple, surface: ImageSurface):
+        with self.lock:
+            previous = self.entries.get(key)
+            if previous is not None:
+                self.size -= self.surface_size(previous)
+                self.entries.move_to_end(key)
+            self.entries[key] = surface
+            self.size += self.surface_size(surface)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                evicted, evicted_surface = self.entries.popitem(last=False)
+                self.size -= self.surface_size(evicted_surface)
+                self.evictions += 1
+
+    # The PNG scaled to width x height once, painted with a good filter
+    @staticmethod
+    def scale(png: ImageSurface, width: int, height: int) -> ImageSurface:
+        surface = ImageSurface(Format.ARGB32, width, height)
+        ctx = Context(surface)
+        ctx.scale(width / png.get_width(), height / png.get_height())
+        ctx.set_source_surface(png, 0, 0)
+        ctx.get_source().set_filter(Filter.GOOD)
+        ctx.set_operator(Operator.SOURCE)
+        ctx.paint()
+        surface.flush()
+        return surface
+
+    # The decoded PNG data, scaled to width x height, if given. Returned surfaces are shared
+    # and must only be used as a source
+    def image(self, data: bytes, width: int = None, height: int = None, content_hash: str = None) -> ImageSurface:
+        content_hash = self.content_hash(data) if content_hash is None else content_hash
+        png = self.get((content_hash, None, None))
+        if png is None:
+            png = ImageSurface.create_from_png(io.BytesIO(data))
+            self.put((content_hash, None, None), png)
+        return self.scaled(content_hash, png, width, height)
+
+    def scaled(self, content_hash: str, png: ImageSurface, width: int = None, height: int = None) -> ImageSurface:
+        if width is None or height is None or (width == png.get_width() and height == png.get_height()):
+            return png
+        width = max(1, int(round(width)))
+        height = max(1, int(round(height)))
+        key = (content_hash, width, height)
+        surface = self.get(key)
+        if surface is None:
+            surface = self.scale(png, width, height)
+            self.put(key, surface)
+        return surface
+
+    # Files are hashed once per modification, an unchanged file is not read again
+    def from_path(self, path: str, width: int = None, height: int = None) -> ImageSurface | None:
+        if not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        path_key = (path, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            content_hash = self.paths.get(path_key)
+            if content_hash is not None:
+                self.paths.move_to_end(path_key)
+        if content_hash is not None:
+            png = self.get((content_hash, None, None))
+            if png is not None:
+                return self.scaled(content_hash, png, width, height)
+        with open(path, 'rb') as f:
+            data = f.read()
+        content_hash = self.content_hash(data)
+        with self.lock:
+            self.paths[path_key] = content_hash
+            self.paths.move_to_end(path_key)
+            while len(self.paths) > self.max_paths:
+                self.paths.popitem(last=False)
+        return self.image(data, width, height, content_hash)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.paths.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(hits=self.hits, misses=self.misses, entries=len(self.entries), bytes=self.size,
+                        max_bytes=self.max_bytes, evictions=self.evictions, paths=len(self.paths))
+
+
+image_cache = ImageCache()
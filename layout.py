@@ -0,0 +1,488 @@
+import collections
+import re
+from array import array
+
+from .pycairo.cairo import Context
+from .cascade import ComputedStyle, RuleIndex, StyleResolver
+from .dom import HtmlDom
+from .fontpool import FontPool, font_pool
+from .glyphs import GlyphBatch
+from .linebreak import LineBreaker
+from .province_css import CssFont, Font
+from .symbols import symbols
+from .textcache import TextCache, text_cache
+
+
+ROOT_FONT_SIZE = CssFont.MEDIUM
+
+length_pattern = re.compile(r'\s*(-?[0-9]*\.?[0-9]+)\s*(px|em|rem|pt|%)?\s*$')
+color_pattern = re.compile(r'rgba?\(\s*([0-9.]+)\s*,\s*([0-9.]+)\s*,\s*([0-9.]+)\s*(?:,\s*([0-9.]+)\s*)?\)$')
+word_pattern = re.compile(r'\S+')
+
+named_colors = dict(
+    black=(0.0, 0.0, 0.0, 1.0), white=(1.0, 1.0, 1.0, 1.0), red=(1.0, 0.0, 0.0, 1.0),
+    green=(0.0, 0.5, 0.0, 1.0), blue=(0.0, 0.0, 1.0, 1.0), gray=(0.5, 0.5, 0.5, 1.0), grey=(0.5, 0.5, 0.5, 1.0),
+    silver=(0.75, 0.75, 0.75, 1.0), yellow=(1.0, 1.0, 0.0, 1.0), transparent=(0.0, 0.0, 0.0, 0.0),
+)
+
+block_tags = frozenset(symbols.intern(tagname) for tagname in (
+    'address', 'article', 'aside', 'blockquote', 'body', 'dd', 'div', 'dl', 'dt', 'fieldset', 'figcaption',
+    'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'html', 'li', 'main', 'nav',
+    'ol', 'p', 'pre', 'section', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'ul',
+))
+hidden_tags = frozenset(symbols.intern(tagname) for tagname in (
+    'head', 'link', 'meta', 'script', 'style', 'template', 'title',
+))
+BR = symbols.intern('br')
+
+
+# Resolves a CSS length to pixels, percentages relate to reference, default for auto and unknown values
+def css_length(value: str | None, font_size: float, reference: float, default: float | None = 0.0) -> float | None:
+    if value is None:
+        return default
+    match = length_pattern.match(value)
+    if match is None:
+        return default
+    number = float(match.group(1))
+    unit = match.group(2)
+    if unit == 'em':
+        return number * font_size
+    if unit == 'rem':
+        return number * ROOT_FONT_SIZE
+    if unit == 'pt':
+        return number * 4.0 / 3.0
+    if unit == '%':
+        return number * reference / 100.0
+    return number
+
+
+# Returns (top, right, bottom, left) of the margin or padding shorthand and its longhands
+def css_edges(style: ComputedStyle, name: str, font_size: float, reference: float) -> [float]:
+    values = [css_length(value, font_size, reference) for value in style.get(name, '').split()][:4]
+    if len(values) == 0:
+        values = [0.0]
+    if len(values) == 1:
+        values = values * 4
+    elif len(values) == 2:
+        values = values * 2
+    elif len(values) == 3:
+        values.append(values[1])
+    for side, longhand in enumerate(('-top', '-right', '-bottom', '-left')):
+        value = style.get(name + longhand)
+        if value is not None:
+            values[side] = css_length(value, font_size, reference)
+    return values
+
+
+# Returns (red, green, blue, alpha) in 0..1, or None
+def css_color(value: str | None) -> tuple | None:
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if value.startswith('#'):
+        digits = value[1:]
+        if len(digits) in (3, 4):
+            digits = ''.join(digit * 2 for digit in digits)
+        if len(digits) not in (6, 8):
+            return None
+        try:
+            channels = [int(digits[pos:pos+2], 16) / 255.0 for pos in range(0, len(digits), 2)]
+        except ValueError:
+            return None
+        return tuple(channels) if len(channels) == 4 else tuple(channels) + (1.0,)
+    match = color_pattern.match(value)
+    if match is not None:
+        alpha = 1.0 if match.group(4) is None else float(match.group(4))
+        return float(match.group(1)) / 255.0, float(match.group(2)) / 255.0, float(match.group(3)) / 255.0, alpha
+    return named_colors.get(value)
+
+
+class TextMeasurer:
+    # Measures text with the pooled scaled fonts, through the shared text cache
+    def __init__(self, pool: FontPool = None, cache: TextCache = None):
+        self.pool = font_pool if pool is None else pool
+        self.cache = text_cache if cache is None else cache
+
+    def font_key(self, css_font: CssFont) -> tuple:
+        return self.pool.get_css_font(css_font)[0]
+
+    def advance(self, css_font: CssFont, text: str) -> float:
+        key, scaled_font = self.pool.get_css_font(css_font)
+        extents = self.cache.get(key, text)
+        if extents is None:
+            extents = tuple(scaled_font.text_extents(text))
+            self.cache.put(key, text, extents)
+        return extents[4]
+
+    # Returns (ascent, descent, height) of css_font
+    def font_metrics(self, css_font: CssFont) -> tuple:
+        key, scaled_font = self.pool.get_css_font(css_font)
+        extents = self.cache.get(key, None)
+        if extents is None:
+            extents = tuple(scaled_font.extents())
+            self.cache.put(key, None, extents)
+        return extents[:3]
+
+
+class BoxTree:
+    NONE = -1
+    BLOCK = 0
+    INLINE = 1
+    LINE = 2
+    TEXT = 3
+
+    # All boxes of a layout in parallel columns, in paint order, box 0 is the block of the document
+    def __init__(self, dom: HtmlDom, width: float):
+        self.dom = dom
+        self.page_width = width
+        self.kind = array('b')
+        self.node = array('i')
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.last_child = array('i')
+        self.x = array('d')
+        self.y = array('d')
+        self.width = array('d')
+        self.height = array('d')
+        # Distance from the top of a text box to its baseline
+        self.baseline = array('d')
+        self.styles = []
+        self.fonts = []
+        self.texts = []
+
+    def __len__(self):
+        return len(self.kind)
+
+    def add(self, kind: int, node: int, parent: int, x: float, y: float, width: float, height: float,
+            style: ComputedStyle | None, css_font: CssFont = None, text: str = None, baseline: float = 0.0) -> int:
+        index = len(self.kind)
+        self.kind.append(kind)
+        self.node.append(node)
+        self.parent.append(parent)
+        self.first_child.append(BoxTree.NONE)
+        self.next_sibling.append(BoxTree.NONE)
+        self.last_child.append(BoxTree.NONE)
+        self.x.append(x)
+        self.y.append(y)
+        self.width.append(width)
+        self.height.append(height)
+        self.baseline.append(baseline)
+        self.styles.append(style)
+        self.fonts.append(css_font)
+        self.texts.append(text)
+        if parent != BoxTree.NONE:
+            last = self.last_child[parent]
+            if last == BoxTree.NONE:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[last] = index
+            self.last_child[parent] = index
+        return index
+
+    def children(self, index: int):
+        child = self.first_child[index]
+        while child != BoxTree.NONE:
+            yield child
+            child = self.next_sibling[child]
+
+    def rect(self, index: int) -> tuple:
+        return self.x[index], self.y[index], self.width[index], self.height[index]
+
+    @property
+    def page_height(self) -> float:
+        return self.height[0] if len(self.kind) > 0 else 0.0
+
+    # The text boxes, that intersect the rectangle, for hit testing and partial repaints
+    def text_boxes(self, x: float, y: float, width: float, height: float):
+        for index in range(len(self.kind)):
+            if self.kind[index] == BoxTree.TEXT and self.x[index] < x + width and x < self.x[index] + self.width[index] \
+                    and self.y[index] < y + height and y < self.y[index] + self.height[index]:
+                yield index
+
+    @staticmethod
+    def same_style(style: ComputedStyle | None, other: ComputedStyle | None) -> bool:
+        return style is other or (style is not None and other is not None and style.properties == other.properties)
+
+    # Returns the rectangles to repaint, when other is replaced by this layout
+    def diff(self, other) -> [tuple]:
+        if other is None or len(other) != len(self) or other.kind != self.kind or other.node != self.node:
+            return [(0.0, 0.0, max(self.page_width, 0.0 if other is None else other.page_width),
+                     max(self.page_height, 0.0 if other is None else other.page_height))]
+        damaged = []
+        for index in range(len(self.kind)):
+            if self.rect(index) != other.rect(index):
+                damaged.append(other.rect(index))
+                damaged.append(self.rect(index))
+            elif self.texts[index] != other.texts[index] or not BoxTree.same_style(self.styles[index],
+                                                                                   other.styles[index]):
+                damaged.append(self.rect(index))
+        return damaged
+
+    # Paints the boxes in order, the text is batched into one show_glyphs call per font and color
+    def paint(self, ctx: Context, batch: GlyphBatch = None):
+        batch = GlyphBatch(ctx) if batch is None else batch
+        font_key = None
+        css_font = None
+        for index in range(len(self.kind)):
+            kind = self.kind[index]
+            style = self.styles[index]
+            if kind == BoxTree.TEXT:
+                if self.fonts[index] is not css_font:
+                    css_font = self.fonts[index]
+                    key, scaled_font = font_pool.get_css_font(css_font)
+                    if key != font_key:
+                        batch.set_font(scaled_font, key)
+                        font_key = key
+                color = css_color(style.get('color')) if style is not None else None
+                batch.add_text(self.texts[index], self.x[index], self.y[index] + self.baseline[index],
+                               (0.0, 0.0, 0.0, 1.0) if color is None else color)
+            elif kind != BoxTree.LINE and style is not None:
+                background = css_color(style.get('background-color', style.get('background')))
+                if background is not None and background[3] > 0.0:
+                    # The text collected so far is painted before the background
+                    batch.flush()
+                    ctx.set_source_rgba(*background)
+                    ctx.rectangle(self.x[index], self.y[index], self.width[index], self.height[index])
+                    ctx.fill()
+        batch.flush()
+
+
+class InlineItem:
+    __slots__ = ('text', 'node', 'style', 'font', 'width', 'space', 'forced_break')
+
+    # A word with the width of the space before it, or a forced line break
+    def __init__(self, text: str, node: int, style: ComputedStyle, css_font: CssFont, width: float,
+                 space: float, forced_break: bool = False):
+        self.text = text
+        self.node = node
+        self.style = style
+        self.font = css_font
+        self.width = width
+        self.space = space
+        self.forced_break = forced_break
+
+
+class LayoutEngine:
+    # Builds the box tree of a document from its computed styles, without drawing anything
+    def __init__(self, measurer: TextMeasurer = None, line_breaker: LineBreaker = None):
+        self.measurer = TextMeasurer() if measurer is None else measurer
+        self.line_breaker = LineBreaker() if line_breaker is None else line_breaker
+
+    @staticmethod
+    def font(style: ComputedStyle | None) -> CssFont:
+        if style is None:
+            return CssFont(Font.Style.normal, Font.Family.serif, 'arial', ROOT_FONT_SIZE)
+        return CssFont.from_style(style)
+
+    @staticmethod
+    def display(dom: HtmlDom, styles: list, node: int) -> str:
+        tagid = dom.tag[node]
+        if tagid == HtmlDom.TEXT:
+            return 'inline'
+        if tagid == HtmlDom.DOCUMENT:
+            return 'block'
+        display = styles[node].get('display')
+        if display is None:
+            if tagid in hidden_tags:
+                return 'none'
+            return 'block' if tagid in block_tags else 'inline'
+        return display.strip().lower()
+
+    def is_block(self, dom: HtmlDom, styles: list, node: int) -> bool:
+        display = self.display(dom, styles, node)
+        return display != 'none' and not display.startswith('inline')
+
+    def line_height(self, style: ComputedStyle | None, css_font: CssFont) -> float:
+        height = self.measurer.font_metrics(css_font)[2]
+        value = None if style is None else style.get('line-height')
+        if value is None or value == 'normal':
+            return height
+        try:
+            return float(value) * css_font.fontsize
+        except ValueError:
+            return css_length(value, css_font.fontsize, css_font.fontsize, height)
+
+    def layout(self, dom: HtmlDom, styles: list, width: float) -> BoxTree:
+        tree = BoxTree(dom, width)
+        self.layout_block(tree, styles, 0, BoxTree.NONE, 0.0, 0.0, width)
+        return tree
+
+    # Lays out node and its subtree at x, y and returns the height it takes, including its margins
+    def layout_block(self, tree: BoxTree, styles: list, node: int, parent_box: int, x: float, y: float,
+                     available: float) -> float:
+        dom = tree.dom
+        style = styles[node]
+        if style is None:
+            margin = padding = (0.0, 0.0, 0.0, 0.0)
+            width = available
+            font_size = ROOT_FONT_SIZE
+        else:
+            font_size = self.font(style).fontsize
+            margin = css_edges(style, 'margin', font_size, available)
+            padding = css_edges(style, 'padding', font_size, available)
+            width = css_length(style.get('width'), font_size, available, None)
+            if width is None:
+                width = max(0.0, available - margin[1] - margin[3] - padding[1] - padding[3])
+        box = tree.add(BoxTree.BLOCK, node, parent_box, x + margin[3], y + margin[0],
+                       width + padding[1] + padding[3], 0.0, style)
+
+        content_x = x + margin[3] + padding[3]
+        content_y = y + margin[0] + padding[0]
+        cursor_y = content_y
+        inline_run = []
+        for child in dom.children(node):
+            if self.is_block(dom, styles, child):
+                if len(inline_run) > 0:
+                    cursor_y += self.layout_inline(tree, styles, inline_run, box, content_x, cursor_y, width)
+                    inline_run = []
+                cursor_y += self.layout_block(tree, styles, child, box, content_x, cursor_y, width)
+            elif self.display(dom, styles, child) != 'none':
+                inline_run.append(child)
+        if len(inline_run) > 0:
+            cursor_y += self.layout_inline(tree, styles, inline_run, box, content_x, cursor_y, width)
+
+        height = None if style is None else css_length(style.get('height'), font_size, 0.0, None)
+        if height is None:
+            height = cursor_y - content_y
+        tree.height[box] = height + padding[0] + padding[2]
+        return margin[0] + tree.height[box] + margin[2]
+
+    # The words of the inline nodes in document order, whitespace collapsed into the space before a word
+    def inline_items(self, dom: HtmlDom, styles: list, nodes: [int]) -> [InlineItem]:
+        items = []
+        pending_space = False
+        stack = list(reversed(nodes))
+        while len(stack) > 0:
+            node = stack.pop()
+            tagid = dom.tag[node]
+            if tagid == HtmlDom.TEXT:
+                style = styles[node]
+                css_font = self.font(style)
+                text = dom.source.text(dom.body_start[node], dom.body_end[node])
+                if len(text) > 0 and text[0].isspace():
+                    pending_space = True
+                for match in word_pattern.finditer(text):
+                    word = match.group()
+                    space = self.measurer.advance(css_font, ' ') if pending_space and len(items) > 0 else 0.0
+                    items.append(InlineItem(word, node, style, css_font, self.measurer.advance(css_font, word), space))
+                    pending_space = match.end() < len(text)
+                if len(text) > 0 and text[-1].isspace():
+                    pending_space = True
+            elif tagid == BR:
+                items.append(InlineItem('', node, styles[node], self.font(styles[node]), 0.0, 0.0, True))
+                pending_space = False
+            elif self.display(dom, styles, node) != 'none':
+                stack.extend(reversed(list(dom.children(node))))
+        return items
+
+    # Breaks items into lines no wider than width, returns the index ranges (start, end) of the lines
+    def break_lines(self, items: [InlineItem], width: float) -> [tuple]:
+        lines = []
+        start = 0
+        for index in range(len(items) + 1):
+            if index < len(items) and not items[index].forced_break:
+                continue
+            # Every forced break ends a paragraph, that is broken on its own
+            widths = [item.width for item in items[start:index]]
+            spaces = [0.0] + [item.space for item in items[start+1:index]]
+            for line_start, line_end in self.line_breaker.break_words(widths, spaces, width):
+                lines.append((start + line_start, start + line_end))
+            if index < len(items):
+                if index > start:
+                    # The break ends the last line of the paragraph
+                    lines[-1] = (lines[-1][0], index + 1)
+                else:
+                    lines.append((index, index + 1))
+            start = index + 1
+        return lines
+
+    def layout_inline(self, tree: BoxTree, styles: list, nodes: [int], block_box: int, x: float, y: float,
+                      width: float) -> float:
+        dom = tree.dom
+        items = self.inline_items(dom, styles, nodes)
+        block_node = tree.node[block_box]
+        text_align = None if tree.styles[block_box] is None else tree.styles[block_box].get('text-align')
+        cursor_y = y
+        for start, end in self.break_lines(items, width):
+            ascent = 0.0
+            descent = 0.0
+            line_height = 0.0
+            positions = []
+            line_width = 0.0
+            for index in range(start, end):
+                item = items[index]
+                metrics = self.measurer.font_metrics(item.font)
+                ascent = max(ascent, metrics[0])
+                descent = max(descent, metrics[1])
+                line_height = max(line_height, self.line_height(item.style, item.font))
+                if index > start:
+                    line_width += item.space
+                positions.append(line_width)
+                line_width += item.width
+            if line_height == 0.0:
+                # An empty line of a <br>
+                css_font = self.font(tree.styles[block_box])
+                line_height = self.line_height(tree.styles[block_box], css_font)
+                ascent, descent = self.measurer.font_metrics(css_font)[:2]
+
+            offset = 0.0
+            if text_align == 'right':
+                offset = width - line_width
+            elif text_align == 'center':
+                offset = (width - line_width) / 2.0
+            line = tree.add(BoxTree.LINE, block_node, block_box, x, cursor_y, width, line_height, None)
+            # Half leading above the tallest ascent
+            baseline = ascent + (line_height - ascent - descent) / 2.0
+
+            # One inline box per element and line, spanning its words, painted below the text
+            fragments = collections.OrderedDict()
+            for index in range(start, end):
+                owner = dom.parent[items[index].node]
+                if owner != block_node and not items[index].forced_break:
+                    left = positions[index - start]
+                    right = left + items[index].width
+                    span = fragments.get(owner)
+                    fragments[owner] = (left, right) if span is None else (span[0], right)
+            for owner, span in fragments.items():
+                tree.add(BoxTree.INLINE, owner, line, x + offset + span[0], cursor_y, span[1] - span[0],
+                         line_height, styles[owner])
+            for index in range(start, end):
+                item = items[index]
+                if not item.forced_break:
+                    tree.add(BoxTree.TEXT, item.node, line, x + offset + positions[index - start], cursor_y,
+                             item.width, line_height, item.style, item.font, item.text, baseline)
+            cursor_y += line_height
+        return cursor_y - y
+
+    @staticmethod
+    def fromSource(source, index: RuleIndex, width: float, measurer: TextMeasurer = None,
+                   line_breaker: LineBreaker = None) -> BoxTree:
+        dom = HtmlDom.fromSource(source)
+        return LayoutEngine(measurer, line_breaker).layout(dom, StyleResolver(index).resolve_all(dom), width)
+
+
+class LayoutCache:
+    # Keeps the layouts of the last capacity (key, width) pairs, key names the document and its stylesheets
+    def __init__(self, engine: LayoutEngine = None, capacity: int = 64):
+        self.engine = LayoutEngine() if engine is None else engine
+        self.capacity = capacity
+        self.layouts = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def layout(self, key, dom: HtmlDom, styles: list, width: float) -> BoxTree:
+        tree = self.layouts.get((key, width))
+        if tree is not None:
+            self.hits += 1
+            self.layouts.move_to_end((key, width))
+            return tree
+        self.misses += 1
+        tree = self.engine.layout(dom, styles, width)
+        self.layouts[(key, width)] = tree
+        if len(self.layouts) > self.capacity:
+            self.layouts.popitem(last=False)
+        return tree
+
+    def stats(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses, layouts=len(self.layouts))
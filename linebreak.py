@@ -0,0 +1,172 @@
+from typing import Any
+
+from .pycairo.cairo import Context
+from .glyphs import GlyphBatch
+from .textcache import TextCache, text_cache
+
+
+class LineBreaker:
+    GREEDY = 'greedy'
+    OPTIMAL = 'optimal'
+
+    # Badness of a line, that cannot stretch or shrink to the width
+    MAX_BADNESS = 10000.0
+    LINE_PENALTY = 10.0
+
+    # Breaks text into lines by cached word widths and shows the glyphs of all lines with one call,
+    # optimal lines are justified.
+    # The alignment (an AlignmentDefinition) scales the word space by hspace and the line height by vspace,
+    # adds lspace between letters and limits the number of lines to linebreaks, unless it is 0.0
+    def __init__(self, mode: str = GREEDY, alignment: Any = None, cache: TextCache = None):
+        if mode not in (LineBreaker.GREEDY, LineBreaker.OPTIMAL):
+            raise TypeError("'{0}' is not a line breaking mode.".format(mode))
+        self.mode = mode
+        self.alignment = alignment
+        self.cache = text_cache if cache is None else cache
+
+    # Breaks as late as possible, returns the index ranges (start, end) of the lines
+    @staticmethod
+    def greedy(widths: [float], spaces: [float], width: float) -> [tuple]:
+        lines = []
+        start = 0
+        line_width = 0.0
+        for index in range(len(widths)):
+            advance = widths[index] if index == start else spaces[index] + widths[index]
+            if index > start and line_width + advance > width:
+                lines.append((start, index))
+                start = index
+                advance = widths[index]
+                line_width = 0.0
+            line_width += advance
+        if start < len(widths):
+            lines.append((start, len(widths)))
+        return lines
+
+    # Knuth-Plass: the breaks with the least total demerits, where the spaces stretch by stretch
+    # and shrink by shrink of their width, and the last line may be short
+    @staticmethod
+    def optimal(widths: [float], spaces: [float], width: float, stretch: float = 0.5,
+                shrink: float = 1.0 / 3.0) -> [tuple]:
+        count = len(widths)
+        if count == 0:
+            return []
+        total = [float('inf')] * (count + 1)
+        previous = [0] * (count + 1)
+        total[0] = 0.0
+        for start in range(count):
+            if total[start] == float('inf'):
+                continue
+            natural = 0.0
+            glue = 0.0
+            for end in range(start + 1, count + 1):
+                index = end - 1
+                if index > start:
+                    natural += spaces[index]
+                    glue += spaces[index]
+                natural += widths[index]
+                slack = width - natural
+                if index > start and natural - glue * shrink > width:
+                    # Wider than the line, even with its spaces shrunk, and every longer line is too
+                    break
+
+                if slack >= 0.0 and end == count:
+                    badness = 0.0
+                elif slack >= 0.0 and glue > 0.0:
+                    badness = min(LineBreaker.MAX_BADNESS, 100.0 * (slack / (glue * stretch)) ** 3)
+                elif slack >= 0.0:
+                    badness = LineBreaker.MAX_BADNESS if slack > 0.0 else 0.0
+                elif index == start:
+                    # A single word wider than the line
+                    badness = LineBreaker.MAX_BADNESS
+                else:
+                    badness = 100.0 * (-slack / (glue * shrink)) ** 3
+
+                demerits = total[start] + (LineBreaker.LINE_PENALTY + badness) ** 2
+                if demerits < total[end]:
+                    total[end] = demerits
+                    previous[end] = start
+                if slack < 0.0 and index == start:
+                    # The word alone is wider than the line, so it is a line of its own
+                    break
+
+        lines = []
+        end = count
+        while end > 0:
+            lines.append((previous[end], end))
+            end = previous[end]
+        lines.reverse()
+        return lines
+
+    def break_words(self, widths: [float], spaces: [float], width: float) -> [tuple]:
+        if self.mode == LineBreaker.OPTIMAL:
+            return self.optimal(widths, spaces, width)
+        return self.greedy(widths, spaces, width)
+
+    def spacing(self) -> tuple:
+        if self.alignment is None:
+            return 1.0, 1.0, 0.0, 0
+        return self.alignment.hspace, self.alignment.vspace, self.alignment.lspace, int(self.alignment.linebreaks)
+
+    # Returns the words with their origins (word, x, y) and the end of the last line,
+    # the first line starts indent right of left and y is its baseline
+    def place_words(self, ctx: Context, text: str, left: float, y: float, width: float, indent: float = 0.0,
+                    font_key: tuple = None) -> ([tuple], tuple):
+        words = text.split()
+        if len(words) == 0:
+            return [], (left + indent, y)
+        hspace, vspace, lspace, max_lines = self.spacing()
+        key = TextCache.context_font_key(ctx) if font_key is None else font_key
+        space = self.cache.advance(ctx, key, ' ') * hspace
+        widths = [self.cache.advance(ctx, key, word) + lspace * (len(word) - 1) for word in words]
+        spaces = [0.0] + [space] * (len(words) - 1)
+        # The indent of the first line is breaking like a wider first word
+        widths[0] += indent
+        lines = self.break_words(widths, spaces, width)
+        widths[0] -= indent
+        if max_lines > 0:
+            lines = lines[:max_lines]
+
+        line_height = self.cache.font_extents(ctx, key)[2] * vspace
+        placed = []
+        x = left + indent
+        for number, (start, end) in enumerate(lines):
+            if number > 0:
+                x = left
+                y += line_height
+            # Optimal lines but the last are justified, their spaces stretch or shrink to the width
+            extra = 0.0
+            if self.mode == LineBreaker.OPTIMAL and number < len(lines) - 1 and end - start > 1:
+                natural = sum(widths[start:end]) + sum(spaces[start+1:end]) + (indent if number == 0 else 0.0)
+                extra = (width - natural) / (end - start - 1)
+            for index in range(start, end):
+                if index > start:
+                    x += spaces[index] + extra
+                placed.append((words[index], x, y))
+                x += widths[index]
+        return placed, (x, y)
+
+    # Shows text into batch, or with one show_glyphs call of its own, and moves the current point
+    # to the end of the last line
+    def show_text(self, ctx: Context, text: str, left: float, y: float, width: float, indent: float = 0.0,
+                  batch: GlyphBatch = None) -> tuple:
+        own_batch = batch is None
+        if own_batch:
+            batch = GlyphBatch(ctx)
+            batch.use_context_font()
+        placed, end = self.place_words(ctx, text, left, y, width, indent, batch.font_key)
+        lspace = self.spacing()[2]
+        for word, x, word_y in placed:
+            batch.add_text(word, x, word_y, letter_spacing=lspace)
+        if own_batch:
+            batch.flush()
+        ctx.move_to(end[0], end[1])
+        return end
+
+    # Shows text from the current point, wrapping at the right edge of the clip
+    def show(self, ctx: Context, text: str, width: float | None = None, batch: GlyphBatch = None) -> tuple:
+        x, y = ctx.get_current_point()
+        left, top, right, bottom = ctx.clip_extents()
+        return self.show_text(ctx, text, left, y, (right - left) if width is None else width, x - left, batch)
+
+
+line_breaker = LineBreaker()
@@ -0,0 +1,350 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import http.client
+import os.path
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from .dom import HtmlDom
+from .resourcecache import ResourceCache
+from .symbols import symbols
+from .util import HtmlTagBasic
+
+
+url_pattern = re.compile(r'url\(\s*[\'"]?([^\'")]+?)[\'"]?\s*\)')
+
+IMG = symbols.intern('img')
+SRC = symbols.intern('src')
+STYLE = symbols.intern('style')
+url_properties = ('background', 'background-image', 'list-style-image')
+
+
+# The image and background urls of the elements (tag, attributes, style) in document order,
+# resolved against base_url
+def element_urls(elements, base_url: str = '') -> [str]:
+    urls = []
+    seen = set()
+
+    def add(url: str):
+        url = urllib.parse.urljoin(base_url, url.strip())
+        if len(url) > 0 and not url.startswith('data:') and url not in seen:
+            seen.add(url)
+            urls.append(url)
+
+    for tag, attributes, style in elements:
+        if tag == IMG and SRC in attributes:
+            add(attributes[SRC])
+        if STYLE in attributes:
+            for match in url_pattern.finditer(attributes[STYLE]):
+                add(match.group(1))
+        if style is not None:
+            for name in url_properties:
+                value = style.get(name)
+                if value is not None:
+                    for match in url_pattern.finditer(value):
+                        add(match.group(1))
+    return urls
+
+
+# The image and background urls of dom in document order, resolved against base_url
+def resource_urls(dom: HtmlDom, base_url: str = '', styles: list = None) -> [str]:
+    return element_urls(((dom.tag[node], dom.attributes[node], None if styles is None else styles[node])
+                         for node in dom.elements()), base_url)
+
+
+# The image and background urls of the tree of html_tag in document order, resolved against base_url
+def tag_resource_urls(html_tag: HtmlTagBasic, base_url: str = '') -> [str]:
+    def elements():
+        stack = [html_tag]
+        while len(stack) > 0:
+            tag = stack.pop()
+            yield tag.tagid, tag.attributes, None
+            stack.extend(reversed(tag.children))
+
+    return element_urls(elements(), base_url)
+
+
+class Resource:
+    __slots__ = ('url', 'status', 'headers', 'body', 'hash')
+
+    def __init__(self, url: str, status: int, headers: dict, body: bytes):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.hash = None
+
+    # The SHA-256 of the body, hashed once, the key of the body in the image cache
+    def content_hash(self) -> str:
+        if self.hash is None:
+            self.hash = hashlib.sha256(self.body).hexdigest()
+        return self.hash
+
+
+class ConnectionPool:
+    # Idle keep-alive connections per (scheme, host, port), shared by the worker threads
+    def __init__(self, timeout: float = 10.0, max_idle: int = 8):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle = dict()
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def acquire(self, key: tuple) -> (http.client.HTTPConnection, bool):
+        with self.lock:
+            connections = self.idle.get(key)
+            if connections:
+                self.reused += 1
+                return connections.pop(), True
+            self.opened += 1
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout), False
+        return http.client.HTTPConnection(host, port, timeout=self.timeout), False
+
+    def release(self, key: tuple, connection: http.client.HTTPConnection):
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    # The socket timeout is the time left until deadline, so a stalled server cannot keep the worker thread
+    @staticmethod
+    def set_deadline(connection: http.client.HTTPConnection, deadline: float):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0.0:
+            raise TimeoutError('The request timed out.')
+        connection.timeout = remaining
+        if connection.sock is not None:
+            connection.sock.settimeout(remaining)
+
+    # Reads the body in chunks, a server that trickles it is still stopped at deadline
+    @staticmethod
+    def read_body(connection: http.client.HTTPConnection, response: http.client.HTTPResponse,
+                  deadline: float) -> bytes:
+        chunks = []
+        while True:
+            ConnectionPool.set_deadline(connection, deadline)
+            chunk = response.read1(1 << 16)
+            if len(chunk) == 0:
+                # Completes the response, so the connection can send the next request
+                chunks.append(response.read())
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    # Blocking, runs on a worker thread, returns (status, headers, body). The whole request, including
+    # the retry, ends within timeout, the timeout of the pool by default
+    def request(self, url: str, headers: dict = None, timeout: float | None = None) -> (int, dict, bytes):
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        parsed = urllib.parse.urlsplit(url)
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        key = (parsed.scheme, parsed.hostname, port)
+        target = urllib.parse.urlunsplit(('', '', parsed.path or '/', parsed.query, ''))
+        request_headers = {'Host': parsed.netloc, 'Accept-Encoding': 'identity', 'User-Agent': 'pycairohtml'}
+        if headers is not None:
+            request_headers.update(headers)
+
+        while True:
+            connection, reused = self.acquire(key)
+            try:
+                self.set_deadline(connection, deadline)
+                connection.request('GET', target, headers=request_headers)
+                response = connection.getresponse()
+                body = self.read_body(connection, response, deadline)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused:
+                    # The server closed the idle connection, retry on a new one
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(key, connection)
+            return response.status, {name.lower(): value for name, value in response.getheaders()}, body
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle.clear()
+
+    def stats(self) -> dict:
+        return dict(opened=self.opened, reused=self.reused, idle=sum(len(c) for c in self.idle.values()))
+
+
+class ResourceLoader:
+    MAX_REDIRECTS = 5
+    redirects = frozenset([301, 302, 303, 307, 308])
+
+    # Fetches resources concurrently, the blocking requests run on a pool of worker threads and the event loop
+    # only schedules them. At most per_host requests are in flight per host, every request ends within
+    # timeout, the resources go through the resource cache, if one is given. Scheme-less and file: urls are
+    # files below base_dir, without a base_dir no file is read
+    def __init__(self, per_host: int = 6, timeout: float = 10.0, workers: int = 16, pool: ConnectionPool = None,
+                 cache: ResourceCache = None, base_dir: str | None = None):
+        self.per_host = per_host
+        self.base_dir = None if base_dir is None else os.path.realpath(base_dir)
+        self.timeout = timeout
+        self.pool = ConnectionPool(timeout) if pool is None else pool
+        self.cache = cache
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self.semaphores = dict()
+        self.tasks = dict()
+
+    def semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphore = self.semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host)
+            self.semaphores[host] = semaphore
+        return semaphore
+
+    @staticmethod
+    def read_file(path: str) -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
+
+    # The path of a scheme-less or file: url, resolved against base_dir, that must not leave it
+    def local_path(self, url: str) -> str:
+        if self.base_dir is None:
+            raise PermissionError("'{0}' is a local file, the loader has no base directory.".format(url))
+        parsed = urllib.parse.urlsplit(url)
+        path = urllib.request.url2pathname(parsed.path) if parsed.scheme == 'file' else url
+        path = os.path.realpath(os.path.join(self.base_dir, path))
+        if os.path.commonpath([self.base_dir, path]) != self.base_dir:
+            raise PermissionError("'{0}' is outside of '{1}'.".format(url, self.base_dir))
+        return path
+
+    # Blocking, follows redirects, returns (status, headers, body) of the last response. All redirects
+    # together end within the timeout, the worker thread raises TimeoutError itself
+    def request(self, url: str, headers: dict = None) -> (int, dict, bytes):
+        deadline = time.monotonic() + self.timeout
+        for _ in range(ResourceLoader.MAX_REDIRECTS + 1):
+            status, response_headers, body = self.pool.request(url, headers, deadline - time.monotonic())
+            if status not in ResourceLoader.redirects or 'location' not in response_headers:
+                break
+            url = urllib.parse.urljoin(url, response_headers['location'])
+        return status, response_headers, body
+
+    async def fetch(self, url: str, headers: dict = None) -> Resource:
+        loop = asyncio.get_running_loop()
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme in ('', 'file'):
+            body = await loop.run_in_executor(self.executor, self.read_file, self.local_path(url))
+            return Resource(url, 200, dict(), body)
+        if parsed.scheme not in ('http', 'https'):
+            raise TypeError("'{0}' is not a fetchable url.".format(url))
+
+        # The slot of the host is held until the worker thread returns, asyncio.wait_for would give it back
+        # while the thread still runs the request
+        async with self.semaphore(parsed.netloc):
+            if self.cache is None:
+                future = loop.run_in_executor(self.executor, self.request, url, headers)
+            else:
+                # Fresh cached resources do not touch the network, stale ones are revalidated
+                future = loop.run_in_executor(self.executor, self.cache.fetch, url, self.request, headers)
+            status, response_headers, body = await future
+        if status >= 400:
+            raise urllib.error.HTTPError(url, status, 'HTTP {0}'.format(status), response_headers, None)
+        return Resource(url, status, response_headers, body)
+
+    # Starts fetching urls, without waiting for them, has to be called on the loop
+    def prefetch(self, urls: [str]):
+        for url in urls:
+            if url not in self.tasks:
+                self.tasks[url] = asyncio.ensure_future(self.fetch(url))
+
+    # Drops the task of url, once it is done, the loader does not keep the bodies it handed out
+    def done(self, url: str, task: asyncio.Future):
+        if self.tasks.get(url) is task:
+            del self.tasks[url]
+
+    # Awaits only url, it is fetched now, if it was not prefetched
+    async def get(self, url: str) -> Resource:
+        self.prefetch([url])
+        task = self.tasks[url]
+        try:
+            return await task
+        finally:
+            self.done(url, task)
+
+    async def get_all(self, urls: [str]) -> [Resource]:
+        self.prefetch(urls)
+        tasks = [self.tasks[url] for url in urls]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            for url, task in zip(urls, tasks):
+                self.done(url, task)
+
+    def forget(self, url: str):
+        task = self.tasks.pop(url, None)
+        if task is not None and not task.done():
+            task.cancel()
+
+    def close(self):
+        for task in self.tasks.values():
+            if not task.done():
+                task.cancel()
+        self.tasks.clear()
+        self.executor.shutdown(wait=False)
+        self.pool.close()
+
+
+class BackgroundLoader:
+    # Runs a ResourceLoader on an event loop thread, synchronous rendering blocks only on the resources it uses
+    def __init__(self, loader: ResourceLoader = None):
+        self.loader = ResourceLoader() if loader is None else loader
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='resource-loader', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def prefetch(self, urls: [str]):
+        self.loop.call_soon_threadsafe(self.loader.prefetch, list(urls))
+
+    def prefetch_dom(self, dom: HtmlDom, base_url: str = '', styles: list = None) -> [str]:
+        urls = resource_urls(dom, base_url, styles)
+        self.prefetch(urls)
+        return urls
+
+    def prefetch_tag(self, html_tag: HtmlTagBasic, base_url: str = '') -> [str]:
+        urls = tag_resource_urls(html_tag, base_url)
+        self.prefetch(urls)
+        return urls
+
+    # Drops the resources of urls, a document forgets the urls it prefetched, once it is painted
+    def forget(self, urls: [str]):
+        for url in urls:
+            self.loop.call_soon_threadsafe(self.loader.forget, url)
+
+    def get(self, url: str, timeout: float | None = None) -> Resource:
+        return asyncio.run_coroutine_threadsafe(self.loader.get(url), self.loop).result(timeout)
+
+    def result(self, url: str, timeout: float | None = None) -> bytes:
+        return self.get(url, timeout).body
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loader.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
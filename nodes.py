@@ -0,0 +1,117 @@
+import mmap
+
+from .tokenizer import HtmlHandler, HtmlTokenizer
+
+
+class HtmlSource:
+    __slots__ = ('buffer', 'encoding')
+
+    # The buffer is a str, bytes or a mmap (also as memoryview), that all nodes of a document share
+    def __init__(self, buffer, encoding: str = 'utf-8'):
+        self.buffer = HtmlTokenizer.buffer(buffer)
+        self.encoding = encoding
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def text(self, start: int, end: int) -> str:
+        raw = self.buffer[start:end]
+        if isinstance(raw, str):
+            return raw
+        return raw.decode(self.encoding, 'replace')
+
+    # Unmaps a mapped buffer, the nodes can not read their text any more
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+class HtmlNode:
+    __slots__ = ('source', 'tagname', 'tagname_cairo', 'start', 'end', 'body_start', 'body_end',
+                 'attrs_start', 'attrs_end', 'parent', 'children')
+
+    # A tag, that only knows its (start, end) offsets in the shared source, text nodes have no tagname
+    def __init__(self, source: HtmlSource, tagname: str, start: int, end: int, body_start: int, body_end: int,
+                 attrs_start: int = 0, attrs_end: int = 0, parent=None):
+        self.source = source
+        self.tagname = tagname
+        self.tagname_cairo = str()
+        self.start = start
+        self.end = end
+        self.body_start = body_start
+        self.body_end = body_end
+        self.attrs_start = attrs_start
+        self.attrs_end = attrs_end
+        self.parent = parent
+        self.children = []
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def __len__(self):
+        return self.body_end - self.body_start
+
+    def __repr__(self):
+        return 'HtmlNode({0!r}, {1}, {2})'.format(self.tagname, self.start, self.end)
+
+    @property
+    def content(self) -> str:
+        return self.source.text(self.body_start, self.body_end)
+
+    @property
+    def classes(self) -> str:
+        return self.source.text(self.attrs_start, self.attrs_end).strip()
+
+    @property
+    def outer(self) -> str:
+        return self.source.text(self.start, self.end)
+
+    @property
+    def pre_tag(self) -> str:
+        # Text around a node is kept in the text nodes next to it
+        return str()
+
+    @property
+    def post_tag(self) -> str:
+        return str()
+
+    def is_text(self) -> bool:
+        return len(self.tagname) == 0
+
+    def has_child_tags(self):
+        return len(self.children) > 1
+
+    @staticmethod
+    def fromSource(source, encoding: str = 'utf-8'):
+        builder = HtmlNodeBuilder(HtmlSource(source, encoding))
+        HtmlTokenizer(builder.source.buffer, encoding).tokenize(builder)
+        return builder.outer()
+
+
+class HtmlNodeBuilder(HtmlHandler):
+    def __init__(self, source: HtmlSource):
+        self.source = source
+        self.root = HtmlNode(source, '', 0, len(source), 0, len(source))
+        self.current = self.root
+
+    def start(self, tagname: str, attrs_start: int, attrs_end: int, start: int, end: int):
+        node = HtmlNode(self.source, tagname, start, end, end, end, attrs_start, attrs_end, self.current)
+        self.current.children.append(node)
+        self.current = node
+
+    def end(self, tagname: str, start: int, end: int):
+        node = self.current
+        node.body_end = start
+        node.end = end
+        self.current = node.parent
+
+    def text(self, start: int, end: int):
+        node = HtmlNode(self.source, '', start, end, start, end, parent=self.current)
+        node.children = ()
+        self.current.children.append(node)
+
+    def outer(self) -> HtmlNode:
+        for node in self.root.children:
+            if not node.is_text():
+                return node
+        return self.root
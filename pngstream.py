@@ -0,0 +1,99 @@
+import re
+import struct
+import sys
+import zlib
+from typing import Any
+
+from .pycairo.cairo import ImageSurface
+
+
+# Runs of pixels with the same alpha, that are neither transparent nor opaque
+partial_alpha_run = re.compile(rb'([\x01-\xfe])\1*')
+
+
+class PngStreamWriter:
+    SIGNATURE = b'\x89PNG\r\n\x1a\n'
+    # Byte offsets of red, green, blue and alpha in a pixel of a native endian ARGB32 surface
+    offsets = (2, 1, 0, 3) if sys.byteorder == 'little' else (1, 2, 3, 0)
+    unpremultiply_tables = [None] * 256
+
+    # Writes an RGBA PNG of width x height to fp strip by strip, every strip is deflated and
+    # written, when it is added, so no more than one strip of the image is held
+    def __init__(self, fp: Any, width: int, height: int, level: int = 6):
+        self.fp = fp
+        self.width = width
+        self.height = height
+        self.rows = 0
+        self.compressor = zlib.compressobj(level)
+        self.fp.write(PngStreamWriter.SIGNATURE)
+        self.chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+
+    def chunk(self, kind: bytes, data: bytes):
+        self.fp.write(struct.pack('>I', len(data)))
+        self.fp.write(kind)
+        self.fp.write(data)
+        self.fp.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    # The lookup table of the colors premultiplied with alpha, built once per alpha
+    @staticmethod
+    def unpremultiply_table(alpha: int) -> bytes:
+        table = PngStreamWriter.unpremultiply_tables[alpha]
+        if table is None:
+            half = alpha // 2
+            table = bytes([min(255, (value * 255 + half) // alpha) for value in range(256)])
+            PngStreamWriter.unpremultiply_tables[alpha] = table
+        return table
+
+    # The premultiplied colors of the transparent pixels of row are divided by their alpha,
+    # every run of pixels with the same alpha is translated by one bytes.translate call
+    @staticmethod
+    def unpremultiply(row: bytearray):
+        alphas = bytes(row[3::4])
+        for run in partial_alpha_run.finditer(alphas):
+            start = 4 * run.start()
+            end = 4 * run.end()
+            row[start:end] = row[start:end].translate(PngStreamWriter.unpremultiply_table(alphas[run.start()]))
+            # The table maps the alpha bytes too, they are put back
+            row[start + 3:end:4] = alphas[run.start():run.end()]
+
+    # The rows of surface as PNG scanlines, each with the filter type none in front
+    def scanlines(self, surface: ImageSurface) -> bytearray:
+        data = surface.get_data()
+        stride = surface.get_stride()
+        size = 4 * self.width
+        r, g, b, a = PngStreamWriter.offsets
+        lines = bytearray()
+        for y in range(surface.get_height()):
+            pixels = bytes(data[y * stride:y * stride + size])
+            row = bytearray(size)
+            row[0::4] = pixels[r::4]
+            row[1::4] = pixels[g::4]
+            row[2::4] = pixels[b::4]
+            row[3::4] = pixels[a::4]
+            if row[3::4].count(255) != self.width:
+                self.unpremultiply(row)
+            lines.append(0)
+            lines += row
+        return lines
+
+    # Appends the rows of an ARGB32 surface, that is as wide as the image, below the rows written so far
+    def write_surface(self, surface: ImageSurface):
+        surface.flush()
+        if surface.get_width() != self.width or self.rows + surface.get_height() > self.height:
+            raise TypeError("'{0}x{1}' is not a strip of the png.".format(surface.get_width(), surface.get_height()))
+        self.rows += surface.get_height()
+        data = self.compressor.compress(self.scanlines(surface))
+        # Flushed, so the strip can be sent before the next one is painted
+        data += self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        if len(data) > 0:
+            self.chunk(b'IDAT', data)
+        if hasattr(self.fp, 'flush'):
+            self.fp.flush()
+
+    def close(self):
+        if self.rows != self.height:
+            raise TypeError("The png has {0} of {1} rows.".format(self.rows, self.height))
+        self.chunk(b'IDAT', self.compressor.flush(zlib.Z_FINISH))
+        self.chunk(b'IEND', bytes())
+        if hasattr(self.fp, 'flush'):
+            self.fp.flush()
@@ -1,10 +1,21 @@
 
 import os.path
+import re
 from enum import Enum
 from .html import HtmlTag
-from .util import hex_to_int, int_to_hex, ifnonot, percent, op_to_func_numeric, PathBasic, Url
+from .util import hex_to_int, int_to_hex, ifnonot, percent, op_to_func_numeric, PathBasic, Url, open_mapped
 from .utilcss import HtmlTagBasic, css_functions, css_operators, css_selectors
-from ..pycairo.cairo import FontSlant, FontWeight, FontOptions, LineCap, LineJoin, Context, ImageSurface, Format, Surface, RectangleInt
+from .cascade import ComputedStyle, RuleIndex
+from .cssparser import CssParser, CssRule, CssStylesheet
+from .csscache import StylesheetCache
+from .fontpool import font_pool
+from .imagecache import image_cache
+from .linebreak import line_breaker
+from .loader import BackgroundLoader
+from .pycairo.cairo import FontSlant, FontWeight, FontOptions, LineCap, LineJoin, Context, ImageSurface, Format, Surface, RectangleInt
+
+
+font_size_pattern = re.compile(r'(-?[0-9]*\.?[0-9]+)(px|em|rem|pt|%)?$')
 
 
 class Color:
@@ -31,13 +42,13 @@ class ColorCode:
 
     def __init__(self, color_code: str = '#ffffff'):
         self.code = color_code
-        if color_code[0] is not '#' or len(color_code) is not 7:
+        if color_code[:1] != '#' or len(color_code) != 7:
             raise TypeError("'{0}' is not a color code.".format(color_code))
 
     def to_rgba(self):
-        r = hex_to_int(self.code[1:2])
-        g = hex_to_int(self.code[3:4])
-        b = hex_to_int(self.code[5:6])
+        r = hex_to_int(self.code[1:3])
+        g = hex_to_int(self.code[3:5])
+        b = hex_to_int(self.code[5:7])
         return Color(r, g, b, 1.0)
 
 
@@ -45,7 +56,8 @@ class Colors(Enum):
     default_black = Color(27.0, 25.0, 23.0, 0.8)
 
 
-class Font(FontOptions):
+# cairo.FontOptions cannot be subclassed, a Font holds its options
+class Font:
     class Style:
         normal = 0,
         italic = 1,
@@ -70,11 +82,14 @@ class Font(FontOptions):
     fontsize: 13.0
     color: Colors.default_black
 
-    def __init__(self, font_name: str, font_family: Family, font_size: float = 13.0):
-        super().__init__()
+    def __init__(self, font_name: str, font_family: Family = Family.sansserif, font_size: float = 13.0):
+        self.options = FontOptions()
         self.name = font_name
         self.family = font_family
         self.fontsize = font_size
+        self.italic = FontSlant.NORMAL
+        self.bold = FontWeight.NORMAL
+        self.color = Colors.default_black.value
 
     def set_italic(self, slant: FontSlant):
         self.italic = slant
@@ -82,9 +97,8 @@ class Font(FontOptions):
     def set_bold(self, weight: FontWeight):
         self.bold = weight
 
-    def set_color(self, color: Color = Colors.default_black):
+    def set_color(self, color: Color = Colors.default_black.value):
         self.color = color
-        self.set_custom_palette_color(0, color.r(), color.g(), color.b(), color.a())
 
     def copy(self):
         font = Font(self.name, self.family, self.fontsize)
@@ -127,8 +141,7 @@ class AlignmentDefinition:
 
 
 class Pixel(float):
-    def __init__(self, px: float):
-        super().__init__(px)
+    pass
 
 
 class PixelPos:
@@ -141,15 +154,12 @@ class PixelPos:
 
 
 class CssValue(str):
-    def __init__(self, value: str):
-        super().__init__(value)
-
     def as_color(self) -> Color | None:
-        if self[0] is not '#' or len(self) < 7:
+        if self[:1] != '#' or len(self) < 7:
             return None
-        r = self[1:2]
-        g = self[3:4]
-        b = self[5:6]
+        r = self[1:3]
+        g = self[3:5]
+        b = self[5:7]
         return Color(hex_to_int(r), hex_to_int(g), hex_to_int(b), 1.0)
 
     def as_pixel(self) -> Pixel | None:
@@ -168,14 +178,16 @@ class CssPair(str):
     @staticmethod
     def value_tokens(value):
         values = value.split(' ')
-        lst = [CssValue]
+        lst = []
         for value in values:
             cssval = CssValue(value)
             lst.append(cssval)
         return lst
 
+    def __new__(cls, key: str, value: str, *args):
+        return super().__new__(cls, key)
+
     def __init__(self, key: str, value: str):
-        super().__init__(key)
         self.value = value
         self.values = self.value_tokens(value)
 
@@ -202,17 +214,17 @@ class CssAttributes(list):
     def __init__(self, css_attributes: [CssAttribute] = [], css_class = None):
         super().__init__(css_attributes)
         self.css_class = css_class
+        self.keys = dict()
         for css_attr in css_attributes:
             css_attr.css_class = css_class
+            self.keys[str(css_attr)] = css_attr
 
     def find(self, attribute_key: str) -> CssAttribute | None:
-        for attr in self:
-            if attr is attribute_key:
-                return attr
-        return None
+        return self.keys.get(attribute_key)
 
     def add(self, css_attribute: CssAttribute):
         self.append(css_attribute)
+        self.keys[str(css_attribute)] = css_attribute
 
 
 class CssBorderWidthProperty(Enum):
@@ -248,30 +260,22 @@ class CssTextAlignProperty(Enum):
     inherit = 5,
 
 
-class CssBorderWidth([int, int, int, int]):
+# The widths [top, bottom, left, right] in pixels
+class CssBorderWidth(list):
     def __init__(self, toppx: int = 0, bottompx: int = 0, leftpx: int = 0, rightpx: int = 0):
         super().__init__([toppx, bottompx, leftpx, rightpx])
 
     def __getitem__(self, item: int):
         if -1 < item < 4:
-            return self[item]
+            return super().__getitem__(item)
         return -1
 
+    # One width for all sides, or one for top and bottom and one for left and right
     @staticmethod
-    def new(topbottompx: int = 0, leftrightpx: int = 0):
+    def new(topbottompx: int = 0, leftrightpx: int | None = None):
+        leftrightpx = topbottompx if leftrightpx is None else leftrightpx
         return CssBorderWidth(topbottompx, topbottompx, leftrightpx, leftrightpx)
 
-    @staticmethod
-    def new(allpx: int = 0):
-        return CssBorderWidth(allpx, allpx, allpx, allpx)
-    @staticmethod
-    def new(toppx: int = 0, bottompx: int = 0, leftpx: int = 0, rightpx: int = 0):
-        return CssBorderWidth(toppx, bottompx, leftpx, rightpx)
-
-    @staticmethod
-    def new(width: CssBorderWidthProperty = CssBorderWidthProperty.inherit):
-        return CssBorderWidth.new(1, 1) # TODO
-
 
 class CssBorder:
     px = Pixel
@@ -304,9 +308,6 @@ class CssAlignment(CssAttributes):
 
 class CssClass:
     class Name(str):
-        def __init__(self, cls_str: str):
-            super().__init__(cls_str)
-
         def __str__(self):
             return self[1:]
 
@@ -375,6 +376,18 @@ class CssClass:
         self.inheriting = inheriting
         self.inherits = inherits
 
+    @staticmethod
+    def from_rule(rule: CssRule):
+        # Takes selectors and declarations from an already parsed rule
+        css_class = CssClass.__new__(CssClass)
+        css_class.classname = rule.selectors
+        css_class.classnames = [CssClass.Name(token) for token in rule.selectors.split(' ') if token.startswith('.')]
+        css_class.htmltag = rule.selectors
+        css_class.attributes = CssAttributes([CssAttribute(key, value) for key, value in rule.declarations], css_class)
+        css_class.inheriting = []
+        css_class.inherits = []
+        return css_class
+
 
 class CssFont:
     style: Font.Style
@@ -382,7 +395,17 @@ class CssFont:
     name: str
     fontsize: float
 
-    def __init__(self, font_style: Font.Style, font_family: Font.Family, font_name: str = 'arial', fontsize: float):
+    # The font size of the root element and of the 'medium' keyword
+    MEDIUM = 13.0
+
+    font_size_scale = {'xx-small': 0.6, 'x-small': 0.75, 'small': 8.0 / 9.0, 'medium': 1.0, 'large': 1.2,
+                       'x-large': 1.5, 'xx-large': 2.0, 'xxx-large': 3.0}
+    generic_families = {'serif': Font.Family.serif, 'sans-serif': Font.Family.sansserif, 'sans': Font.Family.sans,
+                        'monospace': Font.Family.monospace, 'cursive': Font.Family.cursive}
+    longhands = ('font-style', 'font-weight', 'font-size', 'font-family', 'text-decoration')
+
+    def __init__(self, font_style: Font.Style, font_family: Font.Family, font_name: str = 'arial',
+                 fontsize: float = MEDIUM):
         self.style = font_style
         self.family = font_family
         self.name = font_name
@@ -391,74 +414,170 @@ class CssFont:
     def to_font(self) -> Font:
         return Font(self.name, self.family)
 
+    def slant(self) -> FontSlant:
+        if self.style in (Font.Style.italic, Font.Style.italicbold, Font.Style.italicunderlined,
+                          Font.Style.italicboldunderlined):
+            return FontSlant.ITALIC
+        return FontSlant.NORMAL
+
+    def weight(self) -> FontWeight:
+        if self.style in (Font.Style.bold, Font.Style.italicbold, Font.Style.boldunderlined,
+                          Font.Style.italicboldunderlined):
+            return FontWeight.BOLD
+        return FontWeight.NORMAL
+
+    def underlined(self) -> bool:
+        return self.style in (Font.Style.underlined, Font.Style.italicunderlined, Font.Style.boldunderlined,
+                              Font.Style.italicboldunderlined)
+
     @staticmethod
-    def new(css_attribute: CssAttribute, current_font_size: float):
-        css_values = css_attribute.values
-
-        italic = False
-        bold = False
-        underlined = False
-        font_family = Font.Family.serif
-        name_now = False
-        font_name = 'arial'
-        fontsize = 11.2
-        for value in css_values:
-            if value.find('italic') > -1:
-                italic = True
-            if value.find('bold') > -1:
-                bold = True
-            if value.find('underlined') > -1:
-                underlined = True
-
-            if value.find('sans-serif') > -1:
-                font_family = Font.Family.sansserif
-                name_now = True
-            elif value.find('sans') > -1:
-                font_family = Font.Family.sans
-                name_now = True
-            elif value.find('monospace') > -1:
-                font_family = Font.Family.monospace
-                name_now = True
-            elif value.find('cursive') > -1:
-                font_family = Font.Family.cursive
-                name_now = True
-            elif value.find('em') is not -1:
-                fontsize = Css.em(current_font_size, value)
-            elif value.find('%') is not -1:
-                fontsize = Css.font_size_percent(current_font_size, value)
-            if name_now:
-                pos_comma = value.find(',')
-                if pos_comma > -1:
-                    font_name = value[:pos_comma-1]
-
-        font_style = Font.Style.normal
+    def font_style(italic: bool, bold: bool, underlined: bool) -> Font.Style:
         if underlined and bold and italic:
-            font_style = Font.Style.italicboldunderlined
+            return Font.Style.italicboldunderlined
         elif underlined and bold:
-            font_style = Font.Style.boldunderlined
+            return Font.Style.boldunderlined
         elif underlined and italic:
-            font_style = Font.Style.italicunderlined
+            return Font.Style.italicunderlined
         elif bold and italic:
-            font_style = Font.Style.italicbold
+            return Font.Style.italicbold
         elif bold:
-            font_style = Font.Style.bold
+            return Font.Style.bold
         elif italic:
-            font_style = Font.Style.italic
+            return Font.Style.italic
         elif underlined:
-            font_style = Font.Style.underlined
+            return Font.Style.underlined
+        return Font.Style.normal
 
-        return CssFont(font_style, font_family, font_name, fontsize)
+    @staticmethod
+    def size(value: str, parent_size: float) -> float | None:
+        # The font size in pixels, em and percentages relate to the font size of the parent
+        value = value.strip().lower()
+        scale = CssFont.font_size_scale.get(value)
+        if scale is not None:
+            return scale * CssFont.MEDIUM
+        if value == 'smaller':
+            return parent_size / 1.2
+        if value == 'larger':
+            return parent_size * 1.2
+        match = font_size_pattern.match(value)
+        if match is None:
+            return None
+        number = float(match.group(1))
+        unit = match.group(2)
+        if unit == 'em':
+            return number * parent_size
+        if unit == '%':
+            return number * parent_size / 100.0
+        if unit == 'rem':
+            return number * CssFont.MEDIUM
+        if unit == 'pt':
+            return number * 4.0 / 3.0
+        return number
+
+    @staticmethod
+    def shorthand(value: str) -> dict:
+        # The longhands of 'font: italic bold 12px/1.5 Arial, sans-serif', the family follows the size
+        longhands = dict()
+        tokens = value.split()
+        for idx, token in enumerate(tokens):
+            lowered = token.lower()
+            if CssFont.size(lowered.split('/')[0], CssFont.MEDIUM) is not None:
+                longhands['font-size'] = lowered.split('/')[0]
+                if idx + 1 < len(tokens):
+                    longhands['font-family'] = ' '.join(tokens[idx+1:])
+                break
+            if lowered in ('italic', 'oblique'):
+                longhands['font-style'] = lowered
+            elif lowered in ('bold', 'bolder', 'lighter') or lowered.isdigit():
+                longhands['font-weight'] = lowered
+            elif lowered in ('underline', 'underlined'):
+                longhands['text-decoration'] = 'underline'
+        return longhands
+
+    @staticmethod
+    def from_values(values: dict, parent=None):
+        # values holds the longhands set on the element, all others are taken from the parent font
+        if parent is None:
+            parent = CssFont(Font.Style.normal, Font.Family.serif)
+        italic = parent.slant() == FontSlant.ITALIC
+        bold = parent.weight() == FontWeight.BOLD
+        underlined = parent.underlined()
+        font_family = parent.family
+        font_name = parent.name
+        fontsize = parent.fontsize
+
+        font_style = values.get('font-style')
+        if font_style is not None:
+            italic = font_style.strip().lower() in ('italic', 'oblique')
+        font_weight = values.get('font-weight')
+        if font_weight is not None:
+            font_weight = font_weight.strip().lower()
+            if font_weight.isdigit():
+                bold = int(font_weight) >= 600
+            elif font_weight in ('bold', 'bolder'):
+                bold = True
+            elif font_weight in ('normal', 'lighter'):
+                bold = False
+        text_decoration = values.get('text-decoration')
+        if text_decoration is not None:
+            underlined = 'underline' in text_decoration.lower()
+        font_size = values.get('font-size')
+        if font_size is not None:
+            size = CssFont.size(font_size, parent.fontsize)
+            if size is not None:
+                fontsize = size
+        families = values.get('font-family')
+        if families is not None:
+            # The first family is the font name, the first generic family the fallback
+            names = [name.strip().strip('"\'') for name in families.split(',')]
+            if len(names[0]) > 0:
+                font_name = names[0]
+            for name in names:
+                generic = CssFont.generic_families.get(name.lower())
+                if generic is not None:
+                    font_family = generic
+                    break
+
+        return CssFont(CssFont.font_style(italic, bold, underlined), font_family, font_name, fontsize)
+
+    @staticmethod
+    def from_attribute(css_attribute: CssAttribute, current_font_size: float):
+        # A 'font' shorthand attribute
+        parent = CssFont(Font.Style.normal, Font.Family.serif, 'arial', current_font_size)
+        return CssFont.from_values(CssFont.shorthand(css_attribute.value), parent)
 
     @staticmethod
     def new(css_class: CssClass, current_font_size: float):
-        # Find font-style, font-family, font-size
-        font_style = css_class.attributes.find('font-style')
-        font_size = css_class.attributes.find('font-size')
-        font_family = css_class.attributes.find('font-family')
+        parent = CssFont(Font.Style.normal, Font.Family.serif, 'arial', current_font_size)
+        values = dict()
+        font = css_class.attributes.find('font')
+        if font is not None:
+            values.update(CssFont.shorthand(font.value))
+        for name in CssFont.longhands:
+            css_attribute = css_class.attributes.find(name)
+            if css_attribute is not None:
+                values[name] = css_attribute.value
+        return CssFont.from_values(values, parent)
 
-        css_attribute_value = ifnonot(font_style) + ' ' + ifnonot(font_size) + ' ' + ifnonot(font_family)
-        css_attribute = CssAttribute('font', css_attribute_value)
-        return CssFont.new(css_attribute, current_font_size)
+    @staticmethod
+    def from_style(style: ComputedStyle):
+        # Derived once per computed style and shared by all elements with that style
+        return style.derived('font', CssFont.derive)
+
+    @staticmethod
+    def derive(style: ComputedStyle):
+        parent = None if style.parent is None else CssFont.from_style(style.parent)
+        # An inherited property holds the value object of the parent style, which the parent font already
+        # resolved, relative sizes would otherwise be applied twice
+        values = dict()
+        font = style.get('font')
+        if font is not None and (style.parent is None or font is not style.parent.get('font')):
+            values.update(CssFont.shorthand(font))
+        for name in CssFont.longhands:
+            value = style.get(name)
+            if value is not None and (style.parent is None or value is not style.parent.get(name)):
+                values[name] = value
+        return CssFont.from_values(values, parent)
 
 
 class CssAttributeSelector:
@@ -505,34 +624,24 @@ class CssSelector:
 
 class CssFile:
     @staticmethod
-    def parse(css_file: str):
-        classes = [CssClass]
-        lanes = css_file.split('\n')
-
-        pos_last_dot = 0
-        pos_last_closing_brace = 0
-        for idx, lane in enumerate(lanes):
-            if lane.startswith('.'):
-                pos_last_dot = idx
-            elif lane.startswith('}'):
-                pos_last_closing_brace = idx
-            elif pos_last_dot < pos_last_closing_brace:
-                cls_str = str()
-                cls_lanes = lanes[pos_last_dot:pos_last_closing_brace]
-                for string in cls_lanes:
-                    cls_str += string + '\n'
-
-                classes += CssClass(cls_str)
-
-        return classes
-
-    def __init__(self, path: str):
-        self.path = path
-        self.classes = [CssClass]
+    def parse(css_file: str, media: str = 'screen', width: float | None = None) -> [CssClass]:
+        stylesheet = CssParser.parse(css_file)
+        return [CssClass.from_rule(rule) for rule in stylesheet.style_rules(media, width)]
 
-        if os.path.isfile(path):
+    # mapped parses over the mapped file instead of reading it into a string
+    def __init__(self, path: str, media: str = 'screen', width: float | None = None, mapped: bool = False):
+        self.path = path
+        self.classes = []
+        self.stylesheet = CssStylesheet([])
+
+        if os.path.isfile(path) and mapped:
+            with open_mapped(path) as css_source:
+                self.stylesheet = CssParser.parse(css_source)
+            self.classes = [CssClass.from_rule(rule) for rule in self.stylesheet.style_rules(media, width)]
+        elif os.path.isfile(path):
             with open(path, 'r') as f:
-                self.classes = self.parse(f.read())
+                self.stylesheet = CssParser.parse(f.read())
+            self.classes = [CssClass.from_rule(rule) for rule in self.stylesheet.style_rules(media, width)]
 
 
 class Css:
@@ -540,22 +649,31 @@ class Css:
     paths = [str]
 
     def __init__(self):
-        pass
+        self.classes = []
+        self.paths = []
+        self.classnames = dict()
+        self.index = RuleIndex()
 
     # Registers new_css_class at every known class that is inheriting from and returns
     # the number of inherits for new_css_class
     def add_css_class(self, new_css_class: CssClass) -> int:
-        # Register inheriting at the parent classes, that are inherited
+        # Register inheriting at the parent classes, that share a classname
         inherits = 0
-        for css_class in self.classes:
-            for css_classname in new_css_class.classnames:
-                if css_classname in css_class.classnames:
+        registered = set()
+        for css_classname in new_css_class.classnames:
+            for css_class in self.classnames.get(str(css_classname), []):
+                if id(css_class) not in registered:
+                    registered.add(id(css_class))
                     css_class.register_inheriting(new_css_class)
                     inherits += 1
-        self.classes += new_css_class
+        for css_classname in new_css_class.classnames:
+            self.classnames.setdefault(str(css_classname), []).append(new_css_class)
+        self.classes.append(new_css_class)
+        declarations = [(str(css_attr), css_attr.value) for css_attr in new_css_class.attributes]
+        self.index.add(new_css_class.classname, declarations)
         return inherits
 
-    def add_css(self, css: Css) -> int:
+    def add_css(self, css: 'Css') -> int:
         inheriting = 0
         # Register at foreign class, if new inheriting class
         for new_css_class in css.classes:
@@ -563,14 +681,29 @@ class Css:
         self.paths += css.paths
         return inheriting
 
-    def add_css(self, css: [CssClass], paths: [str]) -> int:
+    def add_css_classes(self, css: [CssClass], paths: [str]) -> int:
         css_classes = Css()
         css_classes.classes = css
         css_classes.paths += paths
         return self.add_css(css_classes)
 
     def append(self, css_file: CssFile):
-        return self.add_css(css_file.classes, css_file.path)
+        return self.add_css_classes(css_file.classes, [css_file.path])
+
+    # Adds the compiled rules of a stylesheet to the index, loaded from cache if given
+    def append_stylesheet(self, path: str, cache: StylesheetCache = None, media: str = 'screen',
+                          width: float | None = None) -> int:
+        if cache is not None:
+            index = cache.load(path, media, width)
+        else:
+            index = RuleIndex()
+            with open_mapped(path) as css_source:
+                stylesheet = CssParser.parse(css_source)
+            for rule in stylesheet.style_rules(media, width):
+                index.add(rule.selectors, rule.declarations)
+        self.index.extend(index)
+        self.paths.append(path)
+        return len(index)
 
     @staticmethod
     def em(current_font_size: float, em_str: str) -> float:
@@ -620,25 +753,31 @@ class CssContext(Context):
     css = None
     fetch_buffer = None
     img_surfaces = [ImageSurface]
-    
-    def __init__(self, surface: Surface, css: Css, buffer_dir: str):
-        super().__init__(surface)
+
+    # cairo.Context takes the surface in __new__ only
+    def __new__(cls, surface: Surface, css: Css, buffer_dir: str | None = None):
+        return super().__new__(cls, surface)
+
+    # Pictures are fetched into buffer_dir, if there is no loader
+    def __init__(self, surface: Surface, css: Css, buffer_dir: str | None = None):
         self.surface = surface
         self.css = css
-        if not os.path.exists(buffer_dir)
-            os.mkdir(buffer_dir)
-        self.fetch_buffer = Url.FetchBuffer(buffer_dir)
+        if buffer_dir is not None:
+            if not os.path.exists(buffer_dir):
+                os.mkdir(buffer_dir)
+            self.fetch_buffer = Url.FetchBuffer(buffer_dir)
         self.img_surfaces = []
 
     def text_size(self) -> float:
         return self.font_extents()[2]
 
+    # The size from the current point to the bottom right corner of the clip
     def current_size(self) -> PixelPos:
         pos = self.current_pos()
         # (x1, y1, x2, y2)
-        width = self.clip_extents()
+        extents = self.clip_extents()
 
-        return PixelPos(width[1] - width[2] - pos.x, width[3] - width[1] - pos.y)
+        return PixelPos(extents[2] - pos.x, extents[3] - pos.y)
 
     def add_css(self, css: Css):
         self.css.add_css(css)
@@ -662,51 +801,36 @@ class CssContext(Context):
                         inherited_cls += css_class_inheriting
         return dict(inh_attributes=inherited, inh_classes=inherited_cls)
 
-    def alignment(self, css_alignment: CssAlignment) -> RectangleInt:
+    # The area (x, y, width, height) right of and below the current point, inside of the borders
+    def alignment_area(self, css_alignment: CssAlignment) -> tuple:
         current_px = self.current_pos()
 
-        align_x_origin = css_alignment.border_width[0] + css_alignment.border_top.px + css_alignment.border_left.px
-        align_y_origin = css_alignment.border_width[2] + css_alignment.border_top.px + css_alignment.border_left.px
+        align_x_origin = css_alignment.border_width[2] + css_alignment.border_left.px
+        align_y_origin = css_alignment.border_width[0] + css_alignment.border_top.px
 
-        align_x_margin = (css_alignment.border_width[2] + css_alignment.border_width[3]
-                          + css_alignment.border_right.px + css_alignment.border_left.px)
-        align_y_margin = (css_alignment.border_width[1] + css_alignment.border_width[1]
-                          + css_alignment.border_bottom.px + css_alignment.border_top.px)
+        align_x_margin = align_x_origin + css_alignment.border_width[3] + css_alignment.border_right.px
+        align_y_margin = align_y_origin + css_alignment.border_width[1] + css_alignment.border_bottom.px
 
-        width = self.current_size()
+        size = self.current_size()
 
-        return RectangleInt(current_px.x + align_x_origin, current_px.y + align_y_origin,
-                            current_px.x + width.x - align_x_margin,
-                            current_px.y + width.y - align_y_margin)
+        return (current_px.x + align_x_origin, current_px.y + align_y_origin,
+                max(0.0, size.x - align_x_margin), max(0.0, size.y - align_y_margin))
 
+    def alignment(self, css_alignment: CssAlignment) -> RectangleInt:
+        x, y, width, height = self.alignment_area(css_alignment)
+        return RectangleInt(int(x), int(y), int(width), int(height))
 
     def alignment_surface(self, css_alignment: CssAlignment) -> Surface:
-
-        current_px = self.current_pos()
-        align_x_origin = css_alignment.border_width[0] + css_alignment.border_top.px + css_alignment.border_left.px
-        align_y_origin = css_alignment.border_width[2] + css_alignment.border_top.px + css_alignment.border_left.px
-
-        align_x_margin = (css_alignment.border_width[2] + css_alignment.border_width[3]
-                          + css_alignment.border_right.px + css_alignment.border_left.px)
-        align_y_margin = (css_alignment.border_width[1] + css_alignment.border_width[1]
-                          + css_alignment.border_bottom.px + css_alignment.border_top.px)
-
-        width = self.current_size()
-
-        surface = self.surface.create_for_rectangle(current_px.x + align_x_origin, current_px.y + align_y_origin,
-                                                    current_px.x + width.x - align_x_margin,
-                                                    current_px.y + width.y - align_y_margin)
-        surface.set_device_offset(align_x_margin, align_y_margin)
-
-        return surface
+        return self.surface.create_for_rectangle(*self.alignment_area(css_alignment))
 
     def alignment_context(self, css_alignment: CssAlignment):
         return CssContext(self.alignment_surface(css_alignment), self.css)
 
 
 class CssSurfaceModifier:
-    def __init__(self, surface: Surface, css: Css, context: CssContext = None):
+    def __init__(self, surface: Surface, css: Css, context: CssContext = None, loader: BackgroundLoader = None):
         self.surface = surface
+        self.loader = loader
         if context is None:
             self.ctx = CssContext(surface, css)
         else:
@@ -723,48 +847,47 @@ class CssSurfaceModifier:
         if type(imgsrc) is not Url:
             imgsrc = Url(imgsrc)
 
-        img = imgsrc.fetch(imgsrc.filename(), self.ctx.fetch_buffer)
-
         alignment = self.ctx.alignment(css_alignment)
-        imgsurface = self.surface.map_to_image(alignment)
-        imgsurface.create_from_png(img.read())
-        imgsurface.finish()
+        if self.loader is not None:
+            # Waits for this image only, a prefetched one is not downloaded again and not hashed again
+            resource = self.loader.get(str(imgsrc))
+            imgsurface = image_cache.image(resource.body, alignment.width, alignment.height,
+                                           resource.content_hash())
+        else:
+            img = imgsrc.fetch(imgsrc.filename(), self.ctx.fetch_buffer)
+            imgsurface = image_cache.from_path(img, alignment.width, alignment.height)
+
+        # Painted straight from the cached, already scaled surface
+        self.ctx.save()
+        self.ctx.set_source_surface(imgsurface, alignment.x, alignment.y)
+        self.ctx.paint()
+        self.ctx.restore()
         self.surface.flush()
 
         # TODO opaque etc.
 
-        self.ctx.img_surfaces += imgsurface
+        self.ctx.img_surfaces.append(imgsurface)
 
         return imgsurface
 
     def text(self, txt: str, css_font: CssFont = None, css_alignment: CssAlignment = None):
         if css_font is None:
-            self.ctx.show_text(txt)
+            line_breaker.show(self.ctx, txt)
             self.surface.flush()
         else:
             # Positioning and alignment
             srfc = self.ctx.alignment_surface(css_alignment)
             ctx = CssContext(srfc, self.ctx.css)
 
-            # Save the original text parameters
-            tff = ctx.get_font_face()
-            tfo = ctx.get_font_options()
-            tfs = ctx.text_size()
-
-            # Modify the text parameters
-            font = css_font.to_font()
-            ctx.set_font_size(font.fontsize)
-            ctx.set_font_options(font)
-
-            # Make text
-            ctx.show_text(txt)
+            # The context is new and dropped after the text, so its font is set without saving the state,
+            # the face and the scaled font come from the pool
+            font_pool.use_css_font(ctx, css_font)
 
-            # Reset the parameters to the originals
-            ctx.set_font_face(tff)
-            ctx.set_font_options(tfo)
-            ctx.set_font_size(tfs)
+            # Make text, wrapped at the right edge of the alignment surface, the first line below its top
+            ctx.move_to(0.0, ctx.font_extents()[0])
+            line_breaker.show(ctx, txt)
 
-            srfc.get_device().finish()
+            srfc.finish()
 
     def draw_line(self, hend: float, vend: float, linedef: LineDefinition = LineDefinition()):
         # Modify line width, if modifier
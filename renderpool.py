@@ -0,0 +1,293 @@
+import collections
+import multiprocessing
+import multiprocessing.connection
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+from .pycairo.cairo import FontSlant, FontWeight
+from .backends import RecordingBackend, backends
+from .cairohtml import HtmlRenderer
+from .csscache import StylesheetCache
+from .fontpool import font_pool
+from .province_css import CssFont
+
+
+worker_renderer = None
+
+
+def init_worker(font_family: str, width: float, height: float, output_format: str, stylesheets: [str],
+                cache_dir: str | None):
+    # Runs once per worker process, the stylesheets are read from the warm cache
+    global worker_renderer
+    cache = StylesheetCache(cache_dir)
+    worker_renderer = HtmlRenderer(font_family, width, height, output_format)
+    for path in stylesheets:
+        worker_renderer.add_stylesheet(path, cache)
+    # Load the faces of the renderer font before the first job, instead of during it
+    for slant in (FontSlant.NORMAL, FontSlant.ITALIC):
+        for weight in (FontWeight.NORMAL, FontWeight.BOLD):
+            font_pool.get(font_family, slant, weight, CssFont.MEDIUM)
+
+
+def render_job(doc: str) -> bytes:
+    # Rendered into memory, the output never touches the filesystem
+    return worker_renderer.render(doc).getvalue()
+
+
+def worker_main(conn: multiprocessing.connection.Connection, job: Callable[[str], Any],
+                initializer: Callable[..., None], initargs: tuple):
+    # Reports (True, None) once it is ready, then answers every document with (True, output) or (False, error)
+    try:
+        initializer(*initargs)
+    except Exception as error:
+        conn.send((False, error))
+        return
+    conn.send((True, None))
+    while True:
+        try:
+            doc = conn.recv()
+        except EOFError:
+            return
+        if doc is None:
+            return
+        try:
+            reply = (True, job(doc))
+        except Exception as error:
+            reply = (False, error)
+        conn.send(reply)
+
+
+class RenderJob:
+    # The pending output of one document, completed by the dispatcher of its RenderPool
+    def __init__(self, doc: str, timeout: float | None):
+        self.doc = doc
+        self.timeout = timeout
+        self.done = threading.Event()
+        self.output = None
+        self.error = None
+
+    def ready(self) -> bool:
+        return self.done.is_set()
+
+    def complete(self, output: Any = None, error: BaseException = None):
+        self.output = output
+        self.error = error
+        self.done.set()
+
+    # Raises the error of the job, or multiprocessing.TimeoutError, if it did not complete within timeout
+    def get(self, timeout: float | None = None) -> bytes:
+        if not self.done.wait(timeout):
+            raise multiprocessing.TimeoutError()
+        if self.error is not None:
+            raise self.error
+        return self.output
+
+
+class RenderWorker:
+    # One worker process with its own pipe, it renders one job at a time
+    def __init__(self, context, job: Callable[[str], Any], initializer: Callable[..., None], initargs: tuple):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn, job, initializer, initargs),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.job = None
+        self.deadline = None
+
+    def start(self, job: RenderJob):
+        self.job = job
+        self.deadline = None if job.timeout is None else time.monotonic() + job.timeout
+        self.conn.send(job.doc)
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join()
+        self.conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class RenderPool:
+    # The functions run in the workers, they are pickled by reference
+    initializer = staticmethod(init_worker)
+    job = staticmethod(render_job)
+
+    # Renders documents in worker processes and returns the encoded output as bytes. A job, that runs longer
+    # than its timeout, is failed with multiprocessing.TimeoutError and its worker is killed and replaced
+    def __init__(self, font_family: str, width: float, height: float, output_format: str = 'png',
+                 stylesheets: [str] = (), cache_dir: str | None = None, processes: int | None = None,
+                 queue_size: int | None = None, timeout: float | None = None):
+        if output_format not in backends or output_format == RecordingBackend.format:
+            raise TypeError("'{0}' is not an encoded output format.".format(output_format))
+        processes = multiprocessing.cpu_count() if processes is None else processes
+        # Compile the stylesheets once here, so no worker has to parse them
+        cache = StylesheetCache(cache_dir)
+        for path in stylesheets:
+            cache.load(path)
+
+        # Workers are started by a fork server or spawned, forking this process would copy the cairo state and
+        # the locks of its threads. Every worker loads the stylesheets and fonts once, before its first job
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self.initargs = (font_family, width, height, output_format, list(stylesheets), cache_dir)
+        self.workers = [self.start_worker() for _ in range(processes)]
+        self.queue_size = 2 * processes if queue_size is None else queue_size
+        self.slots = threading.BoundedSemaphore(self.queue_size)
+        self.timeout = timeout
+        self.queue = collections.deque()
+        self.lock = threading.Lock()
+        self.failure = None
+        self.closing = False
+        self.terminated = False
+        self.wakeup_recv, self.wakeup_send = self.context.Pipe(duplex=False)
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def start_worker(self) -> RenderWorker:
+        return RenderWorker(self.context, self.job, self.initializer, self.initargs)
+
+    def wakeup(self):
+        self.wakeup_send.send_bytes(b'')
+
+    def complete(self, job: RenderJob, output: Any = None, error: BaseException = None):
+        job.complete(output, error)
+        self.slots.release()
+
+    # Kills the worker of a job, that timed out or lost its worker, and starts a fresh one in its place
+    def replace(self, worker: RenderWorker, error: BaseException):
+        job = worker.job
+        worker.kill()
+        self.workers[self.workers.index(worker)] = self.start_worker()
+        self.complete(job, error=error)
+
+    def receive(self, worker: RenderWorker):
+        try:
+            ok, value = worker.conn.recv()
+        except (EOFError, OSError):
+            if worker.job is not None:
+                self.replace(worker, RuntimeError('The render worker exited during the job.'))
+            else:
+                worker.kill()
+                self.workers.remove(worker)
+                self.failure = RuntimeError('A render worker exited before its first job.')
+            return
+        if not worker.ready:
+            if ok:
+                worker.ready = True
+            else:
+                # The stylesheets or fonts do not load, so no worker will ever start
+                worker.kill()
+                self.workers.remove(worker)
+                self.failure = value
+            return
+        job = worker.job
+        worker.job = None
+        worker.deadline = None
+        self.complete(job, value if ok else None, None if ok else value)
+
+    def dispatch(self):
+        while True:
+            with self.lock:
+                if self.terminated:
+                    return
+                if self.failure is not None or len(self.workers) == 0:
+                    while len(self.queue) > 0:
+                        self.complete(self.queue.popleft(), error=self.failure)
+                for worker in self.workers:
+                    if worker.ready and worker.job is None and len(self.queue) > 0:
+                        worker.start(self.queue.popleft())
+                waiting = [worker for worker in self.workers if not worker.ready or worker.job is not None]
+                if self.closing and len(self.queue) == 0 and all([worker.job is None for worker in waiting]):
+                    return
+
+            deadlines = [worker.deadline for worker in waiting if worker.deadline is not None]
+            wait_timeout = None if len(deadlines) == 0 else max(0.0, min(deadlines) - time.monotonic())
+            ready = multiprocessing.connection.wait([worker.conn for worker in waiting] + [self.wakeup_recv],
+                                                    wait_timeout)
+            with self.lock:
+                if self.wakeup_recv in ready:
+                    while self.wakeup_recv.poll():
+                        self.wakeup_recv.recv_bytes()
+                now = time.monotonic()
+                for worker in waiting:
+                    if worker not in self.workers:
+                        continue
+                    if worker.conn in ready:
+                        self.receive(worker)
+                    elif worker.deadline is not None and now >= worker.deadline:
+                        self.replace(worker, multiprocessing.TimeoutError(
+                            'Rendering took longer than {0} s.'.format(worker.job.timeout)))
+
+    # Blocks while queue_size jobs are pending, timeout counts from the start of the job in a worker
+    def submit(self, doc: str, timeout: float | None = None) -> RenderJob:
+        job = RenderJob(doc, self.timeout if timeout is None else timeout)
+        self.slots.acquire()
+        with self.lock:
+            if self.closing:
+                self.slots.release()
+                raise ValueError('The render pool is closed.')
+            self.queue.append(job)
+        self.wakeup()
+        return job
+
+    def result(self, job: RenderJob) -> bytes:
+        return job.get()
+
+    def render(self, doc: str, timeout: float | None = None) -> bytes:
+        return self.result(self.submit(doc, timeout))
+
+    # Yields the outputs of docs in order, while at most queue_size documents are in flight
+    def render_many(self, docs: Iterable[str], timeout: float | None = None):
+        pending = collections.deque()
+        for doc in docs:
+            while len(pending) > 0 and pending[0].ready():
+                yield self.result(pending.popleft())
+            if len(pending) >= self.queue_size:
+                # Backpressure, wait for the oldest job before submitting the next
+                yield self.result(pending.popleft())
+            pending.append(self.submit(doc, timeout))
+        while len(pending) > 0:
+            yield self.result(pending.popleft())
+
+    # Completes the submitted jobs and stops the workers
+    def close(self):
+        with self.lock:
+            self.closing = True
+        self.wakeup()
+        self.dispatcher.join()
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+
+    # Stops the workers at once and fails the jobs, that did not complete
+    def terminate(self):
+        with self.lock:
+            self.closing = True
+            self.terminated = True
+        self.wakeup()
+        self.dispatcher.join()
+        error = RuntimeError('The render pool was terminated.')
+        for worker in self.workers:
+            if worker.job is not None:
+                self.complete(worker.job, error=error)
+            worker.kill()
+        self.workers = []
+        while len(self.queue) > 0:
+            self.complete(self.queue.popleft(), error=error)
@@ -0,0 +1,203 @@
+import email.utils
+import hashlib
+import os
+import os.path
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Callable
+
+
+max_age_pattern = re.compile(r'max-age\s*=\s*(\d+)')
+
+
+class CachedResource:
+    __slots__ = ('url', 'hash', 'size', 'etag', 'last_modified', 'expires', 'path')
+
+    def __init__(self, url: str, hash: str, size: int, etag: str | None, last_modified: str | None,
+                 expires: float, path: str):
+        self.url = url
+        self.hash = hash
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+        self.path = path
+
+    def is_fresh(self, now: float = None) -> bool:
+        return self.expires > (time.time() if now is None else now)
+
+    # The headers of a conditional request, that is answered with 304, if the resource did not change
+    def validators(self) -> dict:
+        headers = dict()
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def read(self) -> bytes:
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+
+class ResourceCache:
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS resources (
+            url TEXT PRIMARY KEY, hash TEXT NOT NULL, size INTEGER NOT NULL,
+            etag TEXT, last_modified TEXT, expires REAL NOT NULL, used REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS resources_hash ON resources (hash);
+        CREATE INDEX IF NOT EXISTS resources_used ON resources (used);
+    '''
+
+    # Bodies by url, stored once per content hash below cache_dir and indexed in a sqlite database,
+    # the least recently used are evicted, when the bodies take more than max_bytes
+    def __init__(self, cache_dir: str, max_bytes: int = 256 << 20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self.db.executescript(ResourceCache.SCHEMA)
+        self.lock = threading.Lock()
+        self.size = self.db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM resources GROUP BY hash)').fetchone()[0]
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def object_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, 'objects', content_hash[:2], content_hash[2:])
+
+    # Seconds from now, that the response may be used without revalidation
+    @staticmethod
+    def freshness(headers: dict) -> float:
+        cache_control = headers.get('cache-control', '')
+        if 'no-cache' in cache_control or 'no-store' in cache_control:
+            return 0.0
+        match = max_age_pattern.search(cache_control)
+        if match is not None:
+            return float(match.group(1))
+        expires = headers.get('expires')
+        if expires is not None:
+            try:
+                return email.utils.parsedate_to_datetime(expires).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return 0.0
+        return 0.0
+
+    def lookup(self, url: str) -> CachedResource | None:
+        with self.lock:
+            row = self.db.execute('SELECT hash, size, etag, last_modified, expires FROM resources WHERE url = ?',
+                                  (url,)).fetchone()
+        if row is None:
+            return None
+        resource = CachedResource(url, row[0], row[1], row[2], row[3], row[4], self.object_path(row[0]))
+        if not os.path.exists(resource.path):
+            self.forget(url)
+            return None
+        return resource
+
+    # Returns (status, headers, body) of url, request(url, headers) does the same over the network.
+    # A fresh resource is not requested, a stale one is revalidated with its ETag or Last-Modified
+    def fetch(self, url: str, request: Callable[[str, dict], tuple], headers: dict = None) -> (int, dict, bytes):
+        resource = self.lookup(url)
+        if resource is not None and resource.is_fresh():
+            self.hits += 1
+            self.touch(url)
+            return 200, dict(), resource.read()
+
+        request_headers = dict() if headers is None else dict(headers)
+        if resource is not None:
+            request_headers.update(resource.validators())
+        status, response_headers, body = request(url, request_headers)
+        if status == 304 and resource is not None:
+            self.revalidate(resource, response_headers)
+            return 200, response_headers, resource.read()
+        self.misses += 1
+        if status == 200 and 'no-store' not in response_headers.get('cache-control', ''):
+            self.store(url, body, response_headers)
+        return status, response_headers, body
+
+    # After a 304 answer the cached body is used again, with the new expiry of headers
+    def revalidate(self, resource: CachedResource, headers: dict):
+        url = resource.url
+        self.revalidated += 1
+        resource.expires = time.time() + self.freshness(headers)
+        with self.lock:
+            self.db.execute('UPDATE resources SET expires = ?, used = ? WHERE url = ?',
+                            (resource.expires, time.time(), url))
+            self.db.commit()
+
+    def store(self, url: str, body: bytes, headers: dict) -> CachedResource:
+        content_hash = hashlib.sha256(body).hexdigest()
+        path = self.object_path(content_hash)
+        expires = time.time() + self.freshness(headers)
+        with self.lock:
+            # Written and indexed under the lock, release() can not delete the body in between
+            if not os.path.exists(path):
+                # Written atomically, a body is never read half written
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as tmp_file:
+                    tmp_file.write(body)
+                os.replace(tmp_file.name, path)
+            known = self.db.execute('SELECT 1 FROM resources WHERE hash = ? LIMIT 1', (content_hash,)).fetchone()
+            previous = self.db.execute('SELECT hash FROM resources WHERE url = ?', (url,)).fetchone()
+            self.db.execute('INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (url, content_hash, len(body), headers.get('etag'), headers.get('last-modified'),
+                             expires, time.time()))
+            self.db.commit()
+            if known is None:
+                self.size += len(body)
+            if previous is not None and previous[0] != content_hash:
+                self.release(previous[0])
+            self.evict()
+        return CachedResource(url, content_hash, len(body), headers.get('etag'), headers.get('last-modified'),
+                              expires, path)
+
+    def touch(self, url: str):
+        with self.lock:
+            self.db.execute('UPDATE resources SET used = ? WHERE url = ?', (time.time(), url))
+            self.db.commit()
+
+    def forget(self, url: str):
+        with self.lock:
+            row = self.db.execute('SELECT hash FROM resources WHERE url = ?', (url,)).fetchone()
+            if row is not None:
+                self.db.execute('DELETE FROM resources WHERE url = ?', (url,))
+                self.db.commit()
+                self.release(row[0])
+
+    # Deletes the body of content_hash, once no url refers to it, has to be called with the lock held
+    def release(self, content_hash: str):
+        if self.db.execute('SELECT 1 FROM resources WHERE hash = ? LIMIT 1', (content_hash,)).fetchone() is not None:
+            return
+        path = self.object_path(content_hash)
+        try:
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            pass
+
+    # Has to be called with the lock held
+    def evict(self):
+        while self.size > self.max_bytes:
+            row = self.db.execute('SELECT url, hash FROM resources ORDER BY used LIMIT 1').fetchone()
+            if row is None:
+                break
+            self.db.execute('DELETE FROM resources WHERE url = ?', (row[0],))
+            self.release(row[1])
+            self.evictions += 1
+        self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            count = self.db.execute('SELECT COUNT(*) FROM resources').fetchone()[0]
+        return dict(hits=self.hits, revalidated=self.revalidated, misses=self.misses, evictions=self.evictions,
+                    resources=count, bytes=self.size, max_bytes=self.max_bytes)
@@ -0,0 +1,172 @@
+import math
+from typing import Any, Callable
+
+from .pycairo.cairo import Content, Context, PDFSurface, Rectangle, RecordingSurface, Surface, SVGSurface
+from .backends import PdfBackend, PngBackend, RecordingBackend, SvgBackend
+from .cairohtml import HtmlRenderer, HtmlSurface
+from .html import HtmlTag
+from .loader import BackgroundLoader
+from .pngstream import PngStreamWriter
+from .province_css import Css, Font
+from .tiles import TileRenderer
+
+
+stream_formats = frozenset([PngBackend.format, PdfBackend.format, SvgBackend.format])
+
+
+class StreamSurface(HtmlSurface):
+    # Paints into a recording and hands every band of band_height to emit(index, source), as soon as the
+    # text flowed past it. The source is a recording of the band, replaying it replays the drawing
+    # operations inside the band only
+    def __init__(self, font_family: str, width: float, height: float, band_height: float,
+                 emit: Callable[[int, Surface], None], css: Css = None, font: Font = None,
+                 loader: BackgroundLoader = None, base_url: str = ''):
+        super().__init__(font_family, width, height, RecordingBackend(), css, font, loader=loader, base_url=base_url)
+        self.band_height = band_height
+        self.bands = max(1, math.ceil(height / band_height))
+        self.emit = emit
+        self.emitted = 0
+        # cairo does not replay what is drawn into a recording, after it was replayed once. The drawing is
+        # teed into segments, a segment is replayed once nothing is drawn into it anymore
+        self.segments = []
+        self.segment = self.new_segment()
+
+    def new_segment(self) -> RecordingSurface:
+        segment = RecordingSurface(Content.COLOR_ALPHA, Rectangle(0, 0, self.width, self.height))
+        self.add(segment)
+        return segment
+
+    # Keeps the drawing since the last band as a segment with its (top, bottom), and drops the segments
+    # above the bands still to emit
+    def close_segment(self):
+        self.glyphs.flush()
+        self.remove(self.segment)
+        x, y, width, height = self.segment.ink_extents()
+        if width > 0 and height > 0:
+            self.segments.append((y, y + height, self.segment))
+        self.segment = self.new_segment()
+
+    def band(self, index: int) -> Surface:
+        y = index * self.band_height
+        height = min(self.band_height, self.height - y)
+        band = RecordingSurface(Content.COLOR_ALPHA, Rectangle(0, 0, self.width, height))
+        ctx = Context(band)
+        for top, bottom, segment in self.segments:
+            if top < y + height and bottom > y:
+                ctx.set_source_surface(segment, 0, -y)
+                ctx.paint()
+        return band
+
+    # Emits the bands above end, that were not emitted yet
+    def emit_bands(self, end: int):
+        end = min(end, self.bands)
+        if self.emitted >= end:
+            return
+        self.close_segment()
+        while self.emitted < end:
+            self.emit(self.emitted, self.band(self.emitted))
+            self.emitted += 1
+        top = self.emitted * self.band_height
+        self.segments = [entry for entry in self.segments if entry[1] > top]
+
+    def tag_close(self, name):
+        super().tag_close(name)
+        if self.ctx.has_current_point():
+            # Text continues on the line of the current point, nothing is painted above its top anymore
+            top = self.ctx.get_current_point()[1] - self.ctx.font_extents()[2]
+            self.emit_bands(math.floor(top / self.band_height))
+
+    def html(self, html_tag: HtmlTag):
+        super().html(html_tag)
+        self.emit_bands(self.bands)
+
+
+class StreamRenderer(HtmlRenderer):
+    # Renders into a writable file object and writes every page or strip, as soon as it is painted,
+    # PDF output is split into pages of page_height, PNG output is rasterized in strips of tile_height
+    def __init__(self, font_family: str, width: float, height: float, output_format: str = 'png',
+                 css: Css = None, page_height: float | None = None, tile_height: int = 256,
+                 threads: int | None = None, loader: BackgroundLoader = None, base_url: str = ''):
+        super().__init__(font_family, width, height, output_format, css, loader, base_url)
+        self.page_height = height if page_height is None else page_height
+        self.tiles = TileRenderer(int(width), int(height), tile_height, threads)
+
+    # Paints doc once and calls emit(index, source) with every band of band_height in page order,
+    # while the painting goes on below it
+    def paint_bands(self, doc: str | HtmlTag, height: float, band_height: float,
+                    emit: Callable[[int, Surface], None]):
+        html_tag, urls = self.parse(doc)
+        surface = StreamSurface(self.font_family, self.width, height, band_height, emit, self.css, self.font,
+                                self.loader, self.base_url)
+        try:
+            surface.html(html_tag)
+        finally:
+            self.forget(urls)
+            surface.finish_output().finish()
+
+    @staticmethod
+    def flush(fp: Any):
+        if hasattr(fp, 'flush'):
+            fp.flush()
+
+    # Every strip is rasterized and encoded, once the painting left it, the strips are never stitched together
+    def stream_png(self, doc: str | HtmlTag, fp: Any):
+        writer = PngStreamWriter(fp, self.tiles.width, self.tiles.height)
+        rects = self.tiles.tile_rects()
+
+        def emit(index: int, source: Surface):
+            tile = self.tiles.render_tile(source, 0, rects[index][1])
+            writer.write_surface(tile)
+            tile.finish()
+
+        self.paint_bands(doc, self.tiles.height, self.tiles.tile_height, emit)
+        writer.close()
+
+    # Every page replays the part of the recording inside it, cairo writes the content of a page, when it is shown
+    def stream_pdf(self, doc: str | HtmlTag, fp: Any):
+        surface = PDFSurface(fp, self.width, self.page_height)
+
+        def emit(index: int, source: Surface):
+            ctx = Context(surface)
+            ctx.set_source_surface(source, 0, 0)
+            ctx.rectangle(0, 0, self.width, self.page_height)
+            ctx.clip()
+            ctx.paint()
+            surface.show_page()
+            self.flush(fp)
+
+        self.paint_bands(doc, self.height, self.page_height, emit)
+        surface.finish()
+        self.flush(fp)
+
+    # SVG has no pages, the canvas is one document, written to fp by cairo while it is finished
+    def stream_svg(self, doc: str | HtmlTag, fp: Any):
+        surface = SVGSurface(fp, self.width, self.height)
+
+        def emit(index: int, source: Surface):
+            ctx = Context(surface)
+            ctx.set_source_surface(source, 0, 0)
+            ctx.paint()
+
+        self.paint_bands(doc, self.height, self.height, emit)
+        surface.finish()
+        self.flush(fp)
+
+    # Renders doc to fp, a writable file object, and returns fp
+    def render_to_stream(self, doc: str | HtmlTag, fp: Any, output_format: str | None = None) -> Any:
+        output_format = self.output_format if output_format is None else output_format
+        if output_format not in stream_formats:
+            raise TypeError("'{0}' is not a streamable output format.".format(output_format))
+        if output_format == PngBackend.format:
+            self.stream_png(doc, fp)
+        elif output_format == PdfBackend.format:
+            self.stream_pdf(doc, fp)
+        else:
+            self.stream_svg(doc, fp)
+        return fp
+
+
+def render_to_stream(doc: str | HtmlTag, fp: Any, output_format: str, font_family: str, width: float,
+                     height: float, css: Css = None, page_height: float | None = None) -> Any:
+    renderer = StreamRenderer(font_family, width, height, output_format, css, page_height)
+    return renderer.render_to_stream(doc, fp)
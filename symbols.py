@@ -0,0 +1,61 @@
+import re
+from types import MappingProxyType
+
+
+class SymbolTable:
+    NONE = -1
+
+    # Interns tag names, attribute keys and class names to small integers
+    def __init__(self, names: [str] = ('', '#document')):
+        self.ids = dict()
+        self.names = list()
+        for name in names:
+            self.intern(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name: str):
+        return name in self.ids
+
+    def intern(self, name: str) -> int:
+        sid = self.ids.get(name)
+        if sid is None:
+            sid = len(self.names)
+            self.ids[name] = sid
+            self.names.append(name)
+        return sid
+
+    def get(self, name: str) -> int:
+        # Never interns, a name that was not parsed yet cannot match anything
+        return self.ids.get(name, SymbolTable.NONE)
+
+    def name(self, sid: int) -> str:
+        return self.names[sid]
+
+
+symbols = SymbolTable()
+
+CLASS = symbols.intern('class')
+ID = symbols.intern('id')
+
+attr_pattern = re.compile(r'''([^\s"'=/>]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+)))?''')
+no_classes = frozenset()
+no_attributes = MappingProxyType(dict())
+
+
+def parse_attrs(attr_str: str) -> dict:
+    attributes = dict()
+    for m in attr_pattern.finditer(attr_str):
+        value = m.group(2)
+        if value is None:
+            value = m.group(3) if m.group(4) is None else m.group(4)
+        attributes[symbols.intern(m.group(1).lower())] = str() if value is None else value
+    return attributes
+
+
+def parse_classes(attributes: dict) -> frozenset:
+    classes = attributes.get(CLASS)
+    if classes is None or len(classes) == 0:
+        return no_classes
+    return frozenset([symbols.intern(name) for name in classes.split()])
@@ -0,0 +1,50 @@
+import io
+
+import pytest
+
+from .pycairo.cairo import Context, RecordingSurface
+from .backends import PdfBackend, PngBackend, RecordingBackend, SvgBackend, backend_for
+
+
+def paint(backend, width: float = 40, height: float = 20):
+    surface = backend.create_surface(width, height)
+    ctx = Context(surface)
+    ctx.set_source_rgb(1, 0, 0)
+    ctx.rectangle(0, 0, width / 2, height)
+    ctx.fill()
+    return backend.finish(surface)
+
+
+@pytest.mark.parametrize('output_format, signature', [('png', b'\x89PNG'), ('pdf', b'%PDF'), ('svg', b'<?xml')])
+def test_encodes_into_memory(output_format, signature):
+    backend = backend_for(output_format)
+    paint(backend)
+    assert backend.getvalue().startswith(signature)
+
+
+def test_writes_into_file_object():
+    output = io.BytesIO()
+    assert paint(PdfBackend(output)) is output
+    assert output.getvalue().startswith(b'%PDF')
+
+
+def test_png_surface_stays_usable():
+    backend = PngBackend()
+    surface = backend.create_surface(8, 8)
+    backend.finish(surface)
+    Context(surface).paint()
+
+
+def test_recording_keeps_surface():
+    backend = RecordingBackend()
+    surface = paint(backend)
+    assert isinstance(surface, RecordingSurface)
+    assert backend.output is surface
+    with pytest.raises(TypeError):
+        backend.getvalue()
+
+
+def test_unknown_format():
+    with pytest.raises(TypeError):
+        backend_for('bmp')
+    assert isinstance(backend_for('svg'), SvgBackend)
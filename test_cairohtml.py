@@ -0,0 +1,189 @@
+import http.server
+import io
+import threading
+
+import pytest
+
+from .pycairo.cairo import Context, Format, ImageSurface
+from .backends import PdfBackend, RecordingBackend
+from .cairohtml import HtmlRenderer, HtmlSurface
+from .html import HtmlTag
+from .imagecache import image_cache
+from .loader import BackgroundLoader
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def test_render_svg_into_memory():
+    output = HtmlRenderer('sans-serif', 200, 100, 'svg').render('hello')
+    assert b'<svg' in output.getvalue()
+
+
+def test_render_png_reuses_scratch_surface():
+    renderer = HtmlRenderer('sans-serif', 64, 32, 'png')
+    first = renderer.render('one').getvalue()
+    scratch = renderer.scratch
+    second = renderer.render('two').getvalue()
+    assert first.startswith(PNG_SIGNATURE)
+    assert second.startswith(PNG_SIGNATURE)
+    assert renderer.scratch is scratch
+
+
+def painted(surface: ImageSurface) -> int:
+    # The number of pixels, that are not transparent
+    alphas = bytes(surface.get_data())[3::4]
+    return len(alphas) - alphas.count(0)
+
+
+def test_render_paints_text():
+    output = HtmlRenderer('sans-serif', 120, 40, 'png').render('<p>Hello world</p>')
+    output.seek(0)
+    image = ImageSurface.create_from_png(output)
+    assert (image.get_width(), image.get_height()) == (120, 40)
+    assert painted(image) > 0
+    empty = HtmlRenderer('sans-serif', 120, 40, 'png').render('')
+    empty.seek(0)
+    assert painted(ImageSurface.create_from_png(empty)) == 0
+
+
+def test_surfaces_teed_in_get_the_same_pixels():
+    copy = ImageSurface(Format.ARGB32, 120, 40)
+    surface = HtmlSurface('sans-serif', 120, 40, RecordingBackend())
+    surface.add(copy)
+    surface.html(HtmlTag.fromSource('<p>Hello world</p>'))
+    surface.finish_output()
+    copy.flush()
+    assert painted(copy) > 0
+
+
+def test_render_many_keeps_order():
+    renderer = HtmlRenderer('sans-serif', 64, 32, 'pdf')
+    outputs = {}
+
+    def output_factory(doc):
+        outputs[doc] = io.BytesIO()
+        return outputs[doc]
+
+    rendered = list(renderer.render_many(['a', 'b', 'c'], output_factory))
+    assert rendered == [outputs['a'], outputs['b'], outputs['c']]
+    assert all([output.getvalue().startswith(b'%PDF') for output in rendered])
+
+
+def test_unknown_output_format():
+    with pytest.raises(TypeError):
+        HtmlRenderer('sans-serif', 64, 32, 'bmp')
+
+
+class CallRecorder:
+    # Records the names of the calls on ctx and passes them on
+    def __init__(self, ctx, calls: list):
+        self.ctx = ctx
+        self.calls = calls
+
+    def __getattr__(self, name):
+        attribute = getattr(self.ctx, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args):
+            self.calls.append((name,) + args[:1])
+            return attribute(*args)
+        return call
+
+
+def test_text_is_shown_inside_its_tags():
+    surface = HtmlSurface('sans-serif', 200, 100, PdfBackend())
+    calls = []
+    surface.ctx = surface.glyphs.ctx = CallRecorder(surface.ctx, calls)
+    surface.html(HtmlTag.fromSource('<p>before <a>link</a> after</p>'))
+    surface.finish_output()
+
+    shown = [call[1] for call in calls if call[0] == 'show_text_glyphs']
+    assert shown == ['before', 'link', 'after']
+    names = [call[0] if call[0] == 'show_text_glyphs' else call[0] + ' ' + call[1].split('_')[0]
+             for call in calls if call[0] in ('tag_begin', 'tag_end', 'show_text_glyphs')]
+    # 'before' is the pre tag text of <a>, 'link' a text node with a tag of its own
+    assert names == ['tag_begin p', 'show_text_glyphs', 'tag_begin a', 'tag_begin ', 'show_text_glyphs', 'tag_end ',
+                     'tag_end a', 'show_text_glyphs', 'tag_end p']
+
+
+def test_words_of_a_tag_are_shown_with_one_call():
+    surface = HtmlSurface('sans-serif', 200, 200, RecordingBackend())
+    calls = []
+    surface.ctx = surface.glyphs.ctx = CallRecorder(surface.ctx, calls)
+    words = ' '.join(['word'] * 30)
+    surface.html(HtmlTag.fromSource('<p>{0}</p>'.format(words)))
+    recording = surface.finish_output()
+
+    shown = [call[1] for call in calls if call[0] == 'show_glyphs']
+    # The words wrap over several lines, all 120 glyphs are shown at once
+    assert len(shown) == 1
+    assert len(shown[0]) == 120
+    assert len(set(glyph[2] for glyph in shown[0])) > 1
+    x, y, width, height = recording.ink_extents()
+    assert width > 0 and height > 0
+
+
+def red_png(width: int, height: int) -> bytes:
+    image = ImageSurface(Format.ARGB32, width, height)
+    ctx = Context(image)
+    ctx.set_source_rgb(1.0, 0.0, 0.0)
+    ctx.paint()
+    output = io.BytesIO()
+    image.write_to_png(output)
+    return output.getvalue()
+
+
+class PictureHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = red_png(20, 10)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def picture_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), PictureHandler)
+    server.daemon_threads = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{0}/'.format(server.server_address[1]), server.requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_pictures_are_prefetched_and_painted(picture_server):
+    base_url, requests = picture_server
+    with BackgroundLoader() as loader:
+        renderer = HtmlRenderer('sans-serif', 100, 40, 'png', loader=loader, base_url=base_url)
+        output = renderer.render('<body>a<img src="red.png">b</body>')
+    output.seek(0)
+    image = ImageSurface.create_from_png(output)
+    data = bytes(image.get_data())
+    # Opaque red in native endian ARGB32, all of the 20 x 10 picture
+    red = sum(1 for pixel in range(0, len(data), 4) if data[pixel:pixel + 4] in (b'\x00\x00\xff\xff',
+                                                                                 b'\xff\xff\x00\x00'))
+    assert red == 200
+    assert requests == ['/red.png']
+
+
+def test_loaded_pictures_are_decoded_once(picture_server):
+    base_url, requests = picture_server
+    with BackgroundLoader() as loader:
+        renderer = HtmlRenderer('sans-serif', 100, 40, 'png', loader=loader, base_url=base_url)
+        renderer.render('<body><img src="once.png"></body>')
+        entries = image_cache.stats()['entries']
+        hits = image_cache.stats()['hits']
+        renderer.render('<body><img src="once.png"><img src="again.png"></body>')
+    # Fetched for every document, the same body is decoded once by its content hash
+    assert sorted(requests) == ['/again.png', '/once.png', '/once.png']
+    assert image_cache.stats()['entries'] == entries
+    assert image_cache.stats()['hits'] == hits + 2
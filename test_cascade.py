@@ -0,0 +1,55 @@
+import os.path
+
+from .cascade import RuleIndex, StyleResolver
+from .cssparser import CssParser
+from .dom import HtmlDom
+from .symbols import symbols
+
+
+def test_rules_are_bucketed_by_rightmost_compound():
+    index = RuleIndex()
+    assert index.add('#a, .b, p, *, div .c span', [('color', 'red')]) == 5
+    assert sorted(index.ids) == ['a']
+    assert sorted(index.classes) == [symbols.get('b')]
+    assert sorted(index.tags) == sorted([symbols.get('p'), symbols.get('span')])
+    assert len(index.universal) == 1
+
+
+def test_add_counts_only_indexed_selectors():
+    index = RuleIndex()
+    assert index.add('p::before, p:after, a', [('color', 'red')]) == 1
+    assert index.add('p >> a', [('color', 'red')]) == 0
+    assert len(index) == 1
+
+
+def test_add_returns_indexed_count_for_pure_css():
+    path = os.path.join(os.path.dirname(__file__), 'examples', 'pure.css')
+    with open(path, 'rb') as f:
+        stylesheet = CssParser.parse(f.read())
+    index = RuleIndex()
+    added = sum([index.add(rule.selectors, rule.declarations) for rule in stylesheet.style_rules()])
+    assert added == len(index) == len(index.rules())
+
+
+def test_match_in_cascade_order():
+    index = RuleIndex()
+    index.add('p', [('color', 'red')])
+    index.add('#x', [('color', 'blue')])
+    index.add('.y', [('color', 'green')])
+    dom = HtmlDom.fromSource('<p id="x" class="y">a</p>')
+    p = next(dom.elements())
+    assert [rule.selector.text for rule in index.match(dom, p)] == ['p', '.y', '#x']
+    assert StyleResolver(index).resolve(dom, p)['color'] == 'blue'
+
+
+def test_structural_rules_keep_style_sharing():
+    index = RuleIndex()
+    index.add('tr', [('color', 'black')])
+    index.add('tr:nth-child(even)', [('color', 'gray')])
+    dom = HtmlDom.fromSource('<table>' + '<tr><td>x</td></tr>' * 10 + '</table>')
+    resolver = StyleResolver(index)
+    styles = resolver.resolve_all(dom)
+    rows = [node for node in dom.elements() if dom[node].tagname == 'tr']
+    assert [styles[row]['color'] for row in rows] == ['black', 'gray'] * 5
+    assert len(set([id(styles[row]) for row in rows])) == 2
+    assert resolver.stats()['hits'] > resolver.stats()['misses']
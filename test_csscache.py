@@ -0,0 +1,61 @@
+import os
+import os.path
+
+import pytest
+
+from .csscache import StylesheetCache
+
+
+@pytest.fixture
+def stylesheet(tmp_path) -> str:
+    path = tmp_path / 'style.css'
+    path.write_text('p { color: red } .a, .b::before { margin: 0 }')
+    return str(path)
+
+
+def test_loads_from_cache_after_first_parse(tmp_path, stylesheet):
+    cache_dir = str(tmp_path / 'cache')
+    cache = StylesheetCache(cache_dir)
+    assert len(cache.load(stylesheet)) == 2
+    assert cache.stats() == dict(hits=0, misses=1)
+
+    cached = StylesheetCache(cache_dir)
+    assert len(cached.load(stylesheet)) == 2
+    assert cached.stats() == dict(hits=1, misses=0)
+    assert sorted(os.listdir(os.path.dirname(stylesheet))) == ['cache', 'style.css']
+
+
+def test_rejects_files_without_valid_header(tmp_path, stylesheet):
+    cache = StylesheetCache(str(tmp_path / 'cache'))
+    cache.load(stylesheet)
+    cache_path = cache.cache_path(stylesheet, 'screen', None)
+    with open(cache_path, 'r+b') as f:
+        f.seek(StylesheetCache.HEADER.size)
+        f.write(b'x')
+    assert cache.read(cache_path) is None
+
+    with open(cache_path, 'wb') as f:
+        f.write(b'\x80\x04N.')
+    assert cache.read(cache_path) is None
+    assert len(cache.load(stylesheet)) == 2
+    assert cache.stats() == dict(hits=0, misses=2)
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='POSIX permissions')
+def test_ignores_directory_others_can_write(tmp_path, stylesheet):
+    cache_dir = tmp_path / 'shared'
+    cache_dir.mkdir()
+    cache_dir.chmod(0o777)
+    cache = StylesheetCache(str(cache_dir))
+    assert not cache.private
+    cache.load(stylesheet)
+    cache.load(stylesheet)
+    assert os.listdir(cache_dir) == []
+    assert cache.stats() == dict(hits=0, misses=2)
+
+
+def test_default_dir_is_private(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    cache = StylesheetCache()
+    assert cache.cache_dir == str(tmp_path / 'pycairohtml' / 'stylesheets')
+    assert cache.private
@@ -0,0 +1,39 @@
+from .cssparser import CssAtRule, CssParser, CssRule
+
+
+def test_rules_and_declarations():
+    stylesheet = CssParser.parse('a,\n b { color: red; margin:0 !IMPORTANT }\n/* x { y: z } */ p{}')
+    assert len(stylesheet) == 2
+    rule = stylesheet.rules[0]
+    assert type(rule) is CssRule
+    assert rule.selectors == 'a, b'
+    assert rule.declarations == [('color', 'red'), ('margin', '0 !important')]
+    assert stylesheet.rules[1].declarations == []
+
+
+def test_strings_keep_structural_characters():
+    stylesheet = CssParser.parse('q::before { content: "a;}b"; quotes: \'{\' }')
+    assert stylesheet.rules[0].declarations == [('content', '"a;}b"'), ('quotes', "'{'")]
+
+
+def test_at_rules():
+    stylesheet = CssParser.parse('@import url(x.css);\n@media screen and (min-width: 600px) { p { color: red } }\n'
+                                 '@font-face { font-family: X; src: url(x.woff) }')
+    imports = stylesheet.at_rules('import')
+    assert len(imports) == 1 and imports[0].prelude == 'url(x.css)'
+    media, = stylesheet.at_rules('media')
+    assert type(media) is CssAtRule and len(media.rules) == 1
+    font_face, = stylesheet.at_rules('font-face')
+    assert font_face.declarations == [('font-family', 'X'), ('src', 'url(x.woff)')]
+
+
+def test_style_rules_by_media():
+    stylesheet = CssParser.parse('p { a: 1 } @media (min-width: 600px) { p { a: 2 } } @media print { p { a: 3 } }')
+    assert [rule.declarations[0][1] for rule in stylesheet.style_rules('screen', 800)] == ['1', '2']
+    assert [rule.declarations[0][1] for rule in stylesheet.style_rules('screen', 400)] == ['1']
+    assert [rule.declarations[0][1] for rule in stylesheet.style_rules('print')] == ['1', '3']
+
+
+def test_bytes_source():
+    stylesheet = CssParser.parse('p { content: "é" }'.encode('utf-8'))
+    assert stylesheet.rules[0].declarations == [('content', '"é"')]
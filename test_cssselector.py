@@ -0,0 +1,60 @@
+import pytest
+
+from .cssselector import SelectorParser, attr_value_tests, select
+from .dom import HtmlDom
+
+document = ('<div id="main" class="box wide"><ul><li class="a">1</li><li lang="en-US">2</li><li>3</li>'
+            '<li data-x="foo bar">4</li></ul><p></p><a href="x.html">link</a></div>')
+
+
+def tags(dom: HtmlDom, indices: [int]) -> [str]:
+    return [dom[index].tagname + dom[index].content for index in indices]
+
+
+@pytest.fixture
+def dom() -> HtmlDom:
+    return HtmlDom.fromSource(document)
+
+
+def test_type_class_and_id(dom):
+    assert tags(dom, select(dom, 'li.a')) == ['li1']
+    assert tags(dom, select(dom, '#main > ul > li:last-child')) == ['li4']
+    assert len(select(dom, 'div.box.wide')) == 1
+    assert select(dom, 'div.box.narrow') == []
+
+
+def test_attribute_operators(dom):
+    assert tags(dom, select(dom, '[lang|=en]')) == ['li2']
+    assert tags(dom, select(dom, 'li[data-x~="bar"]')) == ['li4']
+    assert tags(dom, select(dom, 'a[href$=".html"]')) == ['alink']
+    assert select(dom, 'a[href^=""]') == []
+
+
+def test_structural_pseudo_classes(dom):
+    assert tags(dom, select(dom, 'li:nth-child(odd)')) == ['li1', 'li3']
+    assert tags(dom, select(dom, 'li:nth-last-child(2)')) == ['li3']
+    assert tags(dom, select(dom, 'li:not(.a):not([lang])')) == ['li3', 'li4']
+    assert tags(dom, select(dom, 'p:empty')) == ['p']
+
+
+def test_combinators(dom):
+    assert tags(dom, select(dom, 'div li + li')) == ['li2', 'li3', 'li4']
+    assert tags(dom, select(dom, 'ul ~ a')) == ['alink']
+
+
+def test_specificity_and_structural_flag():
+    selector, = SelectorParser.compile('#a .b li:first-child::before')
+    assert selector.specificity == (1, 2, 2)
+    assert selector.pseudo_element == 'before'
+    assert selector.structural
+    assert not SelectorParser.compile('div > p.x')[0].structural
+
+
+def test_invalid_selector():
+    with pytest.raises(TypeError):
+        SelectorParser.compile('div >> p')
+
+
+def test_value_tests():
+    assert attr_value_tests['*=']('abc', 'b')
+    assert not attr_value_tests['*=']('abc', '')
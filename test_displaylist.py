@@ -0,0 +1,59 @@
+from .pycairo.cairo import Content, Context, ImageSurface, Rectangle, RecordingSurface
+from .backends import PngBackend
+from .cairohtml import HtmlRenderer
+from .displaylist import DisplayList
+
+
+def display_list(width: float = 40, height: float = 20) -> DisplayList:
+    # Red left half, transparent right half
+    recording = RecordingSurface(Content.COLOR_ALPHA, Rectangle(0, 0, width, height))
+    ctx = Context(recording)
+    ctx.set_source_rgb(1, 0, 0)
+    ctx.rectangle(0, 0, width / 2, height)
+    ctx.fill()
+    recording.flush()
+    return DisplayList(recording, width, height)
+
+
+def pixel(image, x: int, y: int) -> bytes:
+    offset = y * image.get_stride() + 4 * x
+    return bytes(image.get_data()[offset:offset + 4])
+
+
+def test_rasterize_at_scales():
+    displayed = display_list()
+    full = displayed.rasterize()
+    half = displayed.rasterize(0.5)
+    assert (full.get_width(), full.get_height()) == (40, 20)
+    assert (half.get_width(), half.get_height()) == (20, 10)
+    assert pixel(half, 2, 5) == pixel(full, 2, 10)
+    assert pixel(half, 17, 5) == b'\x00\x00\x00\x00'
+
+
+def test_size_is_never_empty():
+    assert display_list().size(0.001) == (1, 1)
+
+
+def test_render_scales_reuses_recording():
+    displayed = display_list()
+    outputs = list(displayed.render_scales([1.0, 0.25], lambda scale: PngBackend()))
+    assert [scale for scale, output in outputs] == [1.0, 0.25]
+    assert all([output.getvalue().startswith(b'\x89PNG') for scale, output in outputs])
+
+
+def test_record_document_replays_like_a_render():
+    doc = '<p>Hello <b>display</b> list</p>'
+    displayed = DisplayList.fromSource(doc, 'sans-serif', 160, 40)
+    # The text is recorded on the first line
+    x, y, width, height = displayed.recording.ink_extents()
+    assert width > 0 and height > 0 and y + height < 20
+
+    image = displayed.rasterize()
+    output = HtmlRenderer('sans-serif', 160, 40, 'png').render(doc)
+    output.seek(0)
+    rendered = ImageSurface.create_from_png(output)
+    # The png of a render is unpremultiplied, compare which pixels are painted
+    assert bytes(image.get_data())[3::4] == bytes(rendered.get_data())[3::4]
+
+    thumbnail = displayed.rasterize(0.5)
+    assert bytes(thumbnail.get_data())[3::4].count(0) < 80 * 20
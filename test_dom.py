@@ -0,0 +1,53 @@
+import gc
+import tracemalloc
+
+import pytest
+
+from .benchmark import html_document
+from .dom import HtmlDom
+from .nodes import HtmlNode
+from .symbols import no_attributes, symbols
+
+
+def traced_size(build, source) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        built = build(source)
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del built
+    return size
+
+
+def test_tree_structure():
+    dom = HtmlDom.fromSource('<ul><li class="a">x</li><li>y</li></ul>')
+    ul = next(dom.elements())
+    assert dom[ul].tagname == 'ul'
+    items = list(dom[ul].children())
+    assert [item.tagname for item in items] == ['li', 'li']
+    assert items[0].attr('class') == 'a'
+    assert items[0].classnames == frozenset([symbols.get('a')])
+    assert [child.content for child in items[1].children()] == ['y']
+    assert [dom[node].tagname for node in dom.walk()] == ['#document', 'ul', 'li', '', 'li', '']
+
+
+def test_elements_share_attributes():
+    dom = HtmlDom.fromSource('<p class="x">a</p><p class="x">b</p><p>c</p><br>')
+    first, second, plain, br = dom.elements()
+    assert dom.attributes[first] is dom.attributes[second]
+    assert dom.classnames[first] is dom.classnames[second]
+    assert dom.attributes[plain] is no_attributes
+    assert dom.attributes[br] is no_attributes
+    with pytest.raises(TypeError):
+        dom.attributes[first][symbols.intern('id')] = 'changed'
+    assert dom.attributes[second].get(symbols.get('id')) is None
+
+
+def test_memory_against_node_tree():
+    source = html_document(1 << 20)
+    dom_size = traced_size(HtmlDom.fromSource, source)
+    node_size = traced_size(HtmlNode.fromSource, source)
+    assert len(HtmlDom.fromSource(source)) > 100000
+    assert dom_size < 0.3 * node_size
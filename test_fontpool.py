@@ -0,0 +1,45 @@
+import threading
+
+from .pycairo.cairo import FontSlant, FontWeight
+from .fontpool import FontPool
+
+
+def get(pool: FontPool, size: float):
+    return pool.get('sans-serif', FontSlant.NORMAL, FontWeight.NORMAL, size)
+
+
+def test_least_recently_used_evicted_first():
+    pool = FontPool(max_scaled_fonts=3)
+    fonts = dict([(size, get(pool, size)[1]) for size in (10.0, 11.0, 12.0)])
+    # A hit on 10 makes 11 the least recently used
+    assert get(pool, 10.0)[1] is fonts[10.0]
+    get(pool, 13.0)
+    assert get(pool, 10.0)[1] is fonts[10.0]
+    assert get(pool, 12.0)[1] is fonts[12.0]
+    assert get(pool, 11.0)[1] is not fonts[11.0]
+    assert pool.stats()['scaled_fonts'] == 3
+
+
+def test_faces_are_shared_between_sizes():
+    pool = FontPool()
+    get(pool, 10.0)
+    get(pool, 20.0)
+    pool.get('sans-serif', FontSlant.ITALIC, FontWeight.NORMAL, 10.0)
+    assert pool.stats()['faces'] == 2
+
+
+def test_counters_under_threads():
+    pool = FontPool()
+
+    def lookups():
+        for size in range(200):
+            get(pool, 8.0 + size % 20)
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = pool.stats()
+    assert stats['misses'] == 20
+    assert stats['hits'] + stats['misses'] == 8 * 200
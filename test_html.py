@@ -0,0 +1,49 @@
+from .html import HtmlTag
+
+
+def test_from_source_builds_tree():
+    tag = HtmlTag.fromSource('<div class="box"><p>a<b>b</b>c</p><p>d</p></div>')
+    assert tag.tagname == 'div'
+    assert tag.attrval('class') == 'box'
+    assert [child.tagname for child in tag.children] == ['p', 'p']
+    first = tag.children[0]
+    assert [child.tagname for child in first.children] == ['b']
+    assert first.children[0].pre_tag == 'a'
+    assert first.children[0].post_tag == 'c'
+    assert first.children[0].children[0].content == 'b'
+    assert tag.children[1].children[0].content == 'd'
+
+
+def test_text_only_source():
+    tag = HtmlTag.fromSource('just text')
+    assert tag.is_text()
+    assert tag.content == 'just text'
+    assert len(tag.children) == 0
+
+
+def test_pre_tag_text():
+    tag = HtmlTag.fromSource('\n<html lang="en"><body></body></html>\n')
+    assert tag.tagname == 'html'
+    assert tag.pre_tag == '\n'
+    assert tag.post_tag == '\n'
+    assert tag.children[0].tagname == 'body'
+
+
+def test_scan_for_children():
+    tag = HtmlTag('ul', '', '<li>a<li>b')
+    assert [child.tagname for child in tag] == ['li', 'li']
+    assert [child.children[0].content for child in tag] == ['a', 'b']
+
+
+def test_deep_nesting_slices_content_on_access():
+    depth = 2000
+    source = '<div>' * depth + 'deep' + '</div>' * depth
+    tag = HtmlTag.fromSource(source)
+    inner = tag
+    for level in range(depth - 1):
+        inner = inner.children[0]
+    assert inner.content == 'deep'
+    # Every tag refers to the one source, no tag holds a copy of its body
+    assert inner.body[0] is tag.body[0] is source
+    assert tag.content == source[5:-6]
+    assert str(tag) == '<div >'
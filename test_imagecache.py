@@ -0,0 +1,45 @@
+import hashlib
+import io
+
+import pytest
+
+from .pycairo.cairo import Format, ImageSurface
+from .imagecache import ImageCache
+
+
+def png(width: int = 4, height: int = 2) -> bytes:
+    output = io.BytesIO()
+    ImageSurface(Format.ARGB32, width, height).write_to_png(output)
+    return output.getvalue()
+
+
+def test_image_by_given_hash_is_not_hashed(monkeypatch):
+    cache = ImageCache()
+    data = png()
+    content_hash = hashlib.sha256(data).hexdigest()
+    first = cache.image(data, content_hash=content_hash)
+    monkeypatch.setattr(ImageCache, 'content_hash', staticmethod(lambda data: pytest.fail('hashed again')))
+    assert cache.image(data, content_hash=content_hash) is first
+    assert cache.image(data, 8, 4, content_hash).get_width() == 8
+
+
+def test_paths_are_bounded(tmp_path):
+    cache = ImageCache(max_paths=2)
+    paths = []
+    for number in range(3):
+        path = tmp_path / '{0}.png'.format(number)
+        path.write_bytes(png(number + 1))
+        paths.append(str(path))
+    surfaces = [cache.from_path(path) for path in paths]
+    assert cache.stats()['paths'] == 2
+    # The same content is found by its hash, after its path was dropped
+    assert cache.from_path(paths[0]) is surfaces[0]
+
+
+def test_changed_file_is_read_again(tmp_path):
+    cache = ImageCache()
+    path = tmp_path / 'a.png'
+    path.write_bytes(png(4))
+    assert cache.from_path(str(path)).get_width() == 4
+    path.write_bytes(png(6))
+    assert cache.from_path(str(path)).get_width() == 6
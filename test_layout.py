@@ -0,0 +1,81 @@
+from .pycairo.cairo import Context, Format, ImageSurface
+from .cascade import RuleIndex, StyleResolver
+from .layout import BoxTree, LayoutCache, LayoutEngine, css_color, css_length
+from .linebreak import LineBreaker
+
+
+class FixedMeasurer:
+    # Every letter is 10 wide, fonts have the metrics (ascent, descent, height) (10, 3, 13)
+    def advance(self, css_font, text: str) -> float:
+        return 10.0 * len(text)
+
+    def font_metrics(self, css_font) -> tuple:
+        return 10.0, 3.0, 13.0
+
+
+def layout(source: str, width: float, css: str = '') -> BoxTree:
+    index = RuleIndex()
+    for rule in css.split('}'):
+        if '{' in rule:
+            selectors, declarations = rule.split('{')
+            index.add(selectors, [tuple(part.strip() for part in declaration.split(':'))
+                                  for declaration in declarations.split(';') if ':' in declaration])
+    return LayoutEngine.fromSource(source, index, width, FixedMeasurer(), LineBreaker())
+
+
+def texts(tree: BoxTree) -> [tuple]:
+    return [(tree.texts[index], tree.x[index], tree.y[index]) for index in range(len(tree))
+            if tree.kind[index] == BoxTree.TEXT]
+
+
+def test_css_values():
+    assert css_length('2em', 10.0, 100.0) == 20.0
+    assert css_length('50%', 10.0, 300.0) == 150.0
+    assert css_length('auto', 10.0, 100.0, None) is None
+    assert css_color('#f00') == (1.0, 0.0, 0.0, 1.0)
+    assert css_color('rgba(0, 0, 255, 0.5)') == (0.0, 0.0, 1.0, 0.5)
+
+
+def test_words_wrap_at_width():
+    tree = layout('<p>aa bb cc</p>', 55.0)
+    # 'aa bb' is 20 + 10 + 20 wide, 'cc' wraps onto the second line
+    assert texts(tree) == [('aa', 0.0, 0.0), ('bb', 30.0, 0.0), ('cc', 0.0, 13.0)]
+    assert tree.page_height == 26.0
+
+
+def test_blocks_stack_with_margins():
+    tree = layout('<div>a</div><div>b</div>', 100.0, 'div { margin: 5px }')
+    assert [(text, y) for text, x, y in texts(tree)] == [('a', 5.0), ('b', 28.0)]
+
+
+def test_diff_reports_changed_boxes():
+    before = layout('<p>aa bb</p>', 100.0)
+    after = layout('<p>aa cc</p>', 100.0)
+    assert before.diff(before) == []
+    assert after.diff(before) == [after.rect(len(after) - 1)]
+
+
+def test_layout_cache_by_key_and_width():
+    cache = LayoutCache(LayoutEngine(FixedMeasurer()), capacity=1)
+    dom = layout('<p>a</p>', 100.0).dom
+    styles = StyleResolver(RuleIndex()).resolve_all(dom)
+    first = cache.layout('doc', dom, styles, 100.0)
+    assert cache.layout('doc', dom, styles, 100.0) is first
+    cache.layout('doc', dom, styles, 50.0)
+    assert cache.stats() == dict(hits=1, misses=2, layouts=1)
+    assert cache.layout('doc', dom, styles, 100.0) is not first
+
+
+def test_paint_fills_backgrounds_and_text():
+    index = RuleIndex()
+    index.add('div', [('background-color', '#00ff00'), ('height', '20px')])
+    tree = LayoutEngine.fromSource('<div></div><p>Hello</p>', index, 100.0)
+    image = ImageSurface(Format.ARGB32, 100, 60)
+    tree.paint(Context(image))
+    image.flush()
+    data = bytes(image.get_data())
+    stride = image.get_stride()
+    # Opaque green in native endian ARGB32
+    assert data[10 * stride + 40:10 * stride + 44] in (b'\x00\xff\x00\xff', b'\xff\x00\xff\x00')
+    text_rows = data[20 * stride:]
+    assert text_rows[3::4].count(0) < len(text_rows) // 4
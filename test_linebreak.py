@@ -0,0 +1,36 @@
+from .linebreak import LineBreaker
+
+
+class CountingList(list):
+    # Counts the reads, to bound the work of the line breaker
+    reads = 0
+
+    def __getitem__(self, index):
+        CountingList.reads += 1
+        return super().__getitem__(index)
+
+
+def test_greedy_breaks_late():
+    assert LineBreaker.greedy([10.0, 10.0, 10.0], [0.0, 5.0, 5.0], 25.0) == [(0, 2), (2, 3)]
+    assert LineBreaker.greedy([], [], 25.0) == []
+
+
+def test_optimal_fills_lines():
+    widths = [30.0, 30.0, 30.0, 30.0]
+    spaces = [0.0, 5.0, 5.0, 5.0]
+    assert LineBreaker.optimal(widths, spaces, 100.0) == [(0, 3), (3, 4)]
+
+
+def test_word_wider_than_line_is_a_line():
+    widths = [30.0, 500.0, 30.0, 30.0]
+    spaces = [0.0, 5.0, 5.0, 5.0]
+    assert LineBreaker.optimal(widths, spaces, 100.0) == [(0, 1), (1, 2), (2, 4)]
+
+
+def test_optimal_scans_only_lines_that_fit():
+    count = 20000
+    CountingList.reads = 0
+    lines = LineBreaker.optimal(CountingList([30.0] * count), [0.0] + [5.0] * (count - 1), 300.0)
+    assert sum([end - start for start, end in lines]) == count
+    # About 9 words fit a line, the scan from each break stops after the first word that does not fit
+    assert CountingList.reads < 12 * count
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import http.server
+import threading
+import time
+import urllib.error
+
+import pytest
+
+from .dom import HtmlDom
+from .html import HtmlTag
+from .loader import BackgroundLoader, ConnectionPool, Resource, ResourceLoader, resource_urls, tag_resource_urls
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def answer(self, status: int, body: bytes = b'', headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or dict()).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.connections.add(self.client_address)
+        if self.path == '/redirect':
+            self.answer(302, headers={'Location': '/ok'})
+        elif self.path == '/missing':
+            self.answer(404)
+        elif self.path == '/slow':
+            time.sleep(2.0)
+            self.answer(200, b'late')
+        elif self.path == '/trickle':
+            self.send_response(200)
+            self.send_header('Content-Length', '100')
+            self.end_headers()
+            for _ in range(100):
+                self.wfile.write(b'x')
+                self.wfile.flush()
+                time.sleep(0.05)
+        elif self.path == '/drop':
+            # Keeps the connection looking alive, but closes it after the answer
+            self.answer(200, b'dropped')
+            self.close_connection = True
+        elif self.path.startswith('/hold'):
+            with server.lock:
+                server.active += 1
+                server.max_active = max(server.max_active, server.active)
+            time.sleep(0.1)
+            with server.lock:
+                server.active -= 1
+            self.answer(200, self.path.encode())
+        else:
+            self.answer(200, b'ok')
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = set()
+    server.active = 0
+    server.max_active = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_keep_alive_connection_is_reused(server):
+    pool = ConnectionPool()
+    for _ in range(3):
+        assert pool.request(server.url + '/ok')[2] == b'ok'
+    assert pool.stats() == dict(opened=1, reused=2, idle=1)
+    assert len(server.connections) == 1
+    pool.close()
+
+
+def test_retry_when_reused_connection_was_closed(server):
+    pool = ConnectionPool()
+    assert pool.request(server.url + '/drop')[2] == b'dropped'
+    time.sleep(0.1)
+    assert pool.request(server.url + '/ok')[2] == b'ok'
+    assert pool.stats()['opened'] == 2
+    assert pool.stats()['reused'] == 1
+    pool.close()
+
+
+def test_redirects_and_errors(server):
+    with BackgroundLoader() as loader:
+        resource = loader.get(server.url + '/redirect', 5.0)
+        assert (resource.status, resource.body) == (200, b'ok')
+        with pytest.raises(urllib.error.HTTPError):
+            loader.get(server.url + '/missing', 5.0)
+
+
+def test_per_host_limit(server):
+    with BackgroundLoader(ResourceLoader(per_host=2)) as loader:
+        urls = [server.url + '/hold/{0}'.format(number) for number in range(8)]
+        loader.prefetch(urls)
+        assert [loader.result(url, 5.0) for url in urls] == [url[len(server.url):].encode() for url in urls]
+    assert server.max_active == 2
+
+
+def test_finished_tasks_are_dropped(server):
+    with BackgroundLoader() as loader:
+        urls = [server.url + '/hold/{0}'.format(number) for number in range(3)]
+        loader.prefetch(urls)
+        assert loader.result(urls[0], 5.0) == b'/hold/0'
+        all_resources = asyncio.run_coroutine_threadsafe(loader.loader.get_all(urls), loader.loop).result(5.0)
+        assert [resource.body for resource in all_resources] == [b'/hold/0', b'/hold/1', b'/hold/2']
+        # The loader kept neither the tasks nor the bodies
+        assert len(loader.loader.tasks) == 0
+        # A forgotten prefetch is cancelled and dropped too
+        loader.prefetch([server.url + '/slow'])
+        loader.forget([server.url + '/slow'])
+        assert asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loader.loop).result(5.0) is None
+        assert len(loader.loader.tasks) == 0
+
+
+@pytest.mark.parametrize('path', ['/slow', '/trickle'])
+def test_timeout_ends_the_worker_request(server, path):
+    with BackgroundLoader(ResourceLoader(timeout=0.3)) as loader:
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            loader.get(server.url + path, 5.0)
+        assert time.monotonic() - start < 1.0
+
+
+def test_files_are_read_below_base_dir_only(tmp_path):
+    (tmp_path / 'pictures').mkdir()
+    (tmp_path / 'pictures' / 'a.png').write_bytes(b'a')
+    (tmp_path / 'secret').write_bytes(b'secret')
+    with BackgroundLoader(ResourceLoader(base_dir=str(tmp_path / 'pictures'))) as loader:
+        assert loader.result('a.png', 5.0) == b'a'
+        assert loader.result((tmp_path / 'pictures' / 'a.png').as_uri(), 5.0) == b'a'
+        for url in ['../secret', (tmp_path / 'secret').as_uri(), str(tmp_path / 'secret')]:
+            with pytest.raises(PermissionError):
+                loader.get(url, 5.0)
+    with BackgroundLoader() as loader:
+        with pytest.raises(PermissionError):
+            loader.get((tmp_path / 'pictures' / 'a.png').as_uri(), 5.0)
+
+
+def test_resource_urls():
+    dom = HtmlDom.fromSource('<img src="a.png"><div style="background: url(\'b.png\')"></div><img src="a.png">')
+    assert resource_urls(dom, 'http://host/dir/') == ['http://host/dir/a.png', 'http://host/dir/b.png']
+    tag = HtmlTag.fromSource('<body><p><img src="a.png"></p><div style="background: url(b.png)">x</div></body>')
+    assert tag_resource_urls(tag, 'http://host/dir/') == ['http://host/dir/a.png', 'http://host/dir/b.png']
+
+
+def test_content_hash_is_computed_once():
+    resource = Resource('http://host/a.png', 200, dict(), b'png')
+    assert resource.content_hash() == hashlib.sha256(b'png').hexdigest()
+    resource.body = b'changed'
+    assert resource.content_hash() == hashlib.sha256(b'png').hexdigest()
@@ -0,0 +1,43 @@
+import mmap
+
+from .nodes import HtmlNode, HtmlSource
+
+
+def test_node_offsets_into_shared_source():
+    source = '<div class="a b"><p>one</p>two</div>'
+    div = HtmlNode.fromSource(source)
+    assert div.tagname == 'div'
+    assert div.classes == 'class="a b"'
+    assert div.outer == source
+    assert div.content == '<p>one</p>two'
+    p, text = div.children
+    assert p.content == 'one'
+    assert text.is_text()
+    assert text.content == 'two'
+    assert p.source is div.source is text.source
+
+
+def test_outer_skips_leading_text():
+    node = HtmlNode.fromSource('\n  <span>x</span>')
+    assert node.tagname == 'span'
+    assert node.parent.tagname == ''
+
+
+def test_bytes_and_mmap_sources(tmp_path):
+    raw = '<p>café</p>'.encode('utf-8')
+    assert HtmlNode.fromSource(raw).content == 'café'
+    path = tmp_path / 'doc.html'
+    path.write_bytes(raw)
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    node = HtmlNode.fromSource(memoryview(mapped))
+    assert node.source.buffer is mapped
+    assert node.content == 'café'
+    del node
+    mapped.close()
+
+
+def test_source_text_decodes_slice():
+    source = HtmlSource(b'abc\xff', 'utf-8')
+    assert source.text(0, 3) == 'abc'
+    assert len(source) == 4
@@ -0,0 +1,72 @@
+import io
+import random
+import struct
+import zlib
+
+import pytest
+
+from .pycairo.cairo import Context, Format, ImageSurface
+from .pngstream import PngStreamWriter
+
+
+def unpremultiplied(row: bytes) -> bytes:
+    # The straight colors by the formula, one pixel at a time
+    result = bytearray(row)
+    for pos in range(0, len(row), 4):
+        alpha = row[pos + 3]
+        if 0 < alpha < 255:
+            for channel in range(pos, pos + 3):
+                result[channel] = min(255, (row[channel] * 255 + alpha // 2) // alpha)
+    return bytes(result)
+
+
+def test_unpremultiply_matches_formula():
+    random.seed(7)
+    for alphas in ([0, 255, 1, 128, 254], [128], list(range(256))):
+        row = bytearray()
+        for _ in range(300):
+            alpha = random.choice(alphas)
+            row += bytes([random.randint(0, alpha), random.randint(0, alpha), random.randint(0, 255), alpha])
+        expected = unpremultiplied(row)
+        PngStreamWriter.unpremultiply(row)
+        assert bytes(row) == expected
+
+
+def chunks(data: bytes) -> [tuple]:
+    found = []
+    pos = len(PngStreamWriter.SIGNATURE)
+    while pos < len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        found.append((kind, data[pos + 8:pos + 8 + length]))
+        pos += 12 + length
+    return found
+
+
+def test_strips_decode_to_rgba_rows():
+    output = io.BytesIO()
+    writer = PngStreamWriter(output, 3, 4)
+    for height in (3, 1):
+        strip = ImageSurface(Format.ARGB32, 3, height)
+        ctx = Context(strip)
+        ctx.set_source_rgba(1.0, 0.0, 0.0, 0.5)
+        ctx.paint()
+        writer.write_surface(strip)
+    writer.close()
+
+    data = output.getvalue()
+    assert data.startswith(PngStreamWriter.SIGNATURE)
+    found = chunks(data)
+    assert [kind for kind, body in found][0] == b'IHDR' and found[-1][0] == b'IEND'
+    rows = zlib.decompress(b''.join([body for kind, body in found if kind == b'IDAT']))
+    pixel = rows[1:5]
+    assert pixel[0] in (254, 255) and pixel[1:3] == b'\x00\x00' and pixel[3] in (127, 128)
+    assert rows == (b'\x00' + pixel * 3) * 4
+
+
+def test_rows_must_add_up():
+    writer = PngStreamWriter(io.BytesIO(), 3, 4)
+    with pytest.raises(TypeError):
+        writer.write_surface(ImageSurface(Format.ARGB32, 2, 4))
+    writer.write_surface(ImageSurface(Format.ARGB32, 3, 2))
+    with pytest.raises(TypeError):
+        writer.close()
@@ -0,0 +1,84 @@
+from .pycairo.cairo import Format, FontSlant, FontWeight, ImageSurface
+from .cascade import ComputedStyle
+from .province_css import (Color, ColorCode, Css, CssAlignment, CssAttribute, CssBorderWidth, CssFile, CssFont,
+                           CssSurfaceModifier, Font)
+
+
+def style(properties: dict, parent: ComputedStyle = None) -> ComputedStyle:
+    return ComputedStyle.cascade(parent, [list(properties.items())])
+
+
+def test_font_from_longhands():
+    font = CssFont.from_style(style({'font-size': '20px', 'font-style': 'italic', 'font-weight': '700',
+                                     'font-family': '"Open Sans", sans-serif'}))
+    assert font.fontsize == 20.0
+    assert font.slant() == FontSlant.ITALIC
+    assert font.weight() == FontWeight.BOLD
+    assert font.name == 'Open Sans'
+    assert font.family == Font.Family.sansserif
+
+
+def test_relative_sizes_resolve_once():
+    root = style({'font-size': '2em'})
+    child = style({}, root)
+    grandchild = style({'font-size': '50%'}, child)
+    assert CssFont.from_style(root).fontsize == 2 * CssFont.MEDIUM
+    assert CssFont.from_style(child).fontsize == 2 * CssFont.MEDIUM
+    assert CssFont.from_style(grandchild).fontsize == CssFont.MEDIUM
+
+
+def test_font_shorthand():
+    font = CssFont.from_style(style({'font': 'bold 12pt/1.5 Georgia, serif'}))
+    assert font.fontsize == 16.0
+    assert font.weight() == FontWeight.BOLD
+    assert font.slant() == FontSlant.NORMAL
+    assert font.name == 'Georgia'
+
+
+def test_font_is_derived_once_per_style():
+    shared = style({'font-size': 'large'})
+    assert CssFont.from_style(shared) is CssFont.from_style(shared)
+
+
+def test_from_attribute_reads_px_sizes():
+    font = CssFont.from_attribute(CssAttribute('font', 'italic 18px monospace'), 11.0)
+    assert font.fontsize == 18.0
+    assert font.slant() == FontSlant.ITALIC
+    assert font.family == Font.Family.monospace
+
+
+def test_color_code_reads_hex_pairs():
+    color = ColorCode('#1b1917').to_rgba()
+    assert (color.r(), color.g(), color.b()) == (27, 25, 23)
+    assert Color(27.0, 25.0, 23.0, 1.0).to_colorcode().code == '#1b1917'
+
+
+def test_border_width_shorthands():
+    assert CssBorderWidth.new(2) == [2, 2, 2, 2]
+    assert CssBorderWidth.new(1, 3) == [1, 1, 3, 3]
+    assert CssBorderWidth()[4] == -1
+
+
+def test_css_file_rules_reach_the_index(tmp_path):
+    path = tmp_path / 'style.css'
+    path.write_text('p { color: red } .note { font-size: 2em }')
+    css_file = CssFile(str(path))
+    assert [css_class.classname for css_class in css_file.classes] == ['p', '.note']
+    assert css_file.classes[1].attributes.find('font-size').value == '2em'
+
+    css = Css()
+    css.append(css_file)
+    assert len(css.index) == 2
+    assert css.paths == [str(path)]
+    assert css.append_stylesheet(str(path)) == 2
+    assert len(css.index) == 4
+
+
+def test_text_with_css_font_is_painted():
+    surface = ImageSurface(Format.ARGB32, 120, 40)
+    modifier = CssSurfaceModifier(surface, Css())
+    modifier.ctx.move_to(0, 0)
+    modifier.text('Hello', CssFont(Font.Style.bold, Font.Family.sansserif, 'sans-serif', 20.0), CssAlignment())
+    surface.flush()
+    alphas = bytes(surface.get_data())[3::4]
+    assert alphas.count(0) < len(alphas)
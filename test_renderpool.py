@@ -0,0 +1,87 @@
+import io
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from .pycairo.cairo import ImageSurface
+from .renderpool import RenderPool
+
+
+def no_init(*args):
+    pass
+
+
+def failing_init(*args):
+    raise ValueError('no fonts')
+
+
+def sleep_job(doc: str) -> bytes:
+    # Sleeps doc seconds and answers with its pid, so the tests see which worker rendered the doc
+    time.sleep(float(doc))
+    return str(os.getpid()).encode()
+
+
+class SleepPool(RenderPool):
+    initializer = staticmethod(no_init)
+    job = staticmethod(sleep_job)
+
+
+class BrokenPool(SleepPool):
+    initializer = staticmethod(failing_init)
+
+
+def test_render_in_worker():
+    with SleepPool('sans-serif', 64, 32, processes=1) as pool:
+        assert int(pool.render('0')) != os.getpid()
+
+
+def test_render_documents_into_png():
+    with RenderPool('sans-serif', 120, 40, processes=2) as pool:
+        outputs = list(pool.render_many(['<p>Hello</p>', '', '<p>world</p>']))
+    images = [ImageSurface.create_from_png(io.BytesIO(output)) for output in outputs]
+    assert [(image.get_width(), image.get_height()) for image in images] == [(120, 40)] * 3
+    alphas = [bytes(image.get_data())[3::4] for image in images]
+    assert [len(alpha) - alpha.count(0) > 0 for alpha in alphas] == [True, False, True]
+
+
+def test_timeout_replaces_worker():
+    with SleepPool('sans-serif', 64, 32, processes=1, queue_size=1) as pool:
+        first = int(pool.render('0'))
+        with pytest.raises(multiprocessing.TimeoutError):
+            pool.render('60', timeout=0.2)
+        # The slot was released and the hanging worker is gone
+        replaced = int(pool.render('0'))
+        assert replaced != first
+        with pytest.raises(ProcessLookupError):
+            os.kill(first, 0)
+
+
+def test_timeout_counts_from_job_start():
+    with SleepPool('sans-serif', 64, 32, processes=1, timeout=1.0) as pool:
+        outputs = list(pool.render_many(['0.3', '0.3', '0.3', '0.3']))
+        assert len(set(outputs)) == 1
+
+
+def test_job_errors_are_raised():
+    with SleepPool('sans-serif', 64, 32, processes=1) as pool:
+        with pytest.raises(ValueError):
+            pool.render('not a number')
+        assert pool.render('0')
+
+
+def test_failing_init_fails_jobs():
+    with BrokenPool('sans-serif', 64, 32, processes=1) as pool:
+        with pytest.raises(ValueError, match='no fonts'):
+            pool.render('0')
+
+
+def test_terminate_fails_pending_jobs():
+    pool = SleepPool('sans-serif', 64, 32, processes=1)
+    job = pool.submit('60')
+    pool.terminate()
+    with pytest.raises(RuntimeError):
+        job.get(1.0)
+    with pytest.raises(ValueError):
+        pool.submit('0')
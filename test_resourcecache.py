@@ -0,0 +1,66 @@
+import os
+import threading
+
+from .resourcecache import ResourceCache
+
+
+class Server:
+    # Answers request(url, headers) like the network, counts the requests
+    def __init__(self, headers: dict = None):
+        self.headers = dict(etag='"1"', **(headers or dict()))
+        self.requests = []
+
+    def __call__(self, url: str, headers: dict) -> (int, dict, bytes):
+        self.requests.append(headers)
+        if headers.get('If-None-Match') == self.headers['etag']:
+            return 304, dict(self.headers), b''
+        return 200, dict(self.headers), url.encode()
+
+
+def test_fresh_resource_is_not_requested(tmp_path):
+    cache = ResourceCache(str(tmp_path))
+    server = Server({'cache-control': 'max-age=60'})
+    assert cache.fetch('http://host/a', server)[2] == b'http://host/a'
+    assert cache.fetch('http://host/a', server)[2] == b'http://host/a'
+    assert len(server.requests) == 1
+    assert cache.stats()['hits'] == 1
+
+
+def test_stale_resource_is_revalidated(tmp_path):
+    cache = ResourceCache(str(tmp_path))
+    server = Server()
+    cache.fetch('http://host/a', server)
+    status, headers, body = cache.fetch('http://host/a', server)
+    assert (status, body) == (200, b'http://host/a')
+    assert server.requests[-1]['If-None-Match'] == '"1"'
+    assert cache.stats()['revalidated'] == 1
+
+
+def test_least_recently_used_evicted(tmp_path):
+    cache = ResourceCache(str(tmp_path), max_bytes=2 * len(b'http://host/a'))
+    for url in ('http://host/a', 'http://host/b', 'http://host/c'):
+        cache.store(url, url.encode(), dict())
+    assert cache.lookup('http://host/a') is None
+    assert cache.lookup('http://host/c').read() == b'http://host/c'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_concurrent_store_and_forget_keep_indexed_bodies(tmp_path):
+    # Two urls with the same body are stored and forgotten at the same time, a stored url always has its body
+    cache = ResourceCache(str(tmp_path))
+    missing = []
+
+    def store_and_forget(url: str):
+        for _ in range(300):
+            cache.store(url, b'body', dict())
+            if cache.lookup(url) is None:
+                missing.append(url)
+            cache.forget(url)
+
+    threads = [threading.Thread(target=store_and_forget, args=(url,)) for url in ('http://host/a', 'http://host/b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert missing == []
+    assert cache.stats()['bytes'] == 0
@@ -0,0 +1,65 @@
+import io
+
+import pytest
+
+from .pycairo.cairo import ImageSurface
+from .cairohtml import HtmlRenderer
+from .pngstream import PngStreamWriter
+from .streaming import StreamRenderer, StreamSurface
+from .html import HtmlTag
+
+
+def long_doc(paragraphs: int = 40) -> str:
+    return '<body>{0}</body>'.format(''.join(['<p>paragraph {0} of the long document</p>'.format(number)
+                                              for number in range(paragraphs)]))
+
+
+# Painted pixels of every row of a png
+def painted_rows(output: io.BytesIO) -> [int]:
+    output.seek(0)
+    image = ImageSurface.create_from_png(output)
+    data = bytes(image.get_data())
+    stride = image.get_stride()
+    return [image.get_width() - data[row * stride:(row + 1) * stride][3::4].count(0)
+            for row in range(image.get_height())]
+
+
+def test_bands_are_emitted_while_painting():
+    emitted = []
+
+    def emit(index, source):
+        emitted.append((index, surface.ctx.get_current_point()[1]))
+
+    surface = StreamSurface('sans-serif', 300, 800, 100, emit)
+    surface.html(HtmlTag.fromSource(long_doc()))
+    surface.finish_output().finish()
+
+    assert [index for index, y in emitted] == list(range(8))
+    # Every band was written, as soon as the text flowed past it, not after the whole document
+    assert [y for index, y in emitted[:3]] == sorted(y for index, y in emitted[:3])
+    assert all(index * 100 < y < (index + 2) * 100 for index, y in emitted[:3])
+
+
+def test_stream_png_has_all_rows():
+    output = StreamRenderer('sans-serif', 120, 300, 'png', tile_height=64).render_to_stream(long_doc(), io.BytesIO())
+    data = output.getvalue()
+    assert data.startswith(PngStreamWriter.SIGNATURE)
+    assert data[16:24] == (120).to_bytes(4, 'big') + (300).to_bytes(4, 'big')
+    assert data.endswith(b'IEND\xaeB`\x82')
+    # The strips hold the same pixels as a single pass render
+    rows = painted_rows(output)
+    assert rows == painted_rows(HtmlRenderer('sans-serif', 120, 300, 'png').render(long_doc()))
+    assert all(sum(rows[y:y + 64]) > 0 for y in range(0, 300, 64))
+
+
+def test_stream_pdf_writes_every_page():
+    output = StreamRenderer('sans-serif', 200, 400, 'pdf', page_height=100).render_to_stream(long_doc(),
+                                                                                             io.BytesIO())
+    data = output.getvalue()
+    assert data.startswith(b'%PDF')
+    assert data.count(b'/Type /Page') - data.count(b'/Type /Pages') == 4
+
+
+def test_unknown_stream_format():
+    with pytest.raises(TypeError):
+        StreamRenderer('sans-serif', 64, 32, 'png').render_to_stream('x', io.BytesIO(), 'recording')
@@ -0,0 +1,25 @@
+from .symbols import CLASS, ID, SymbolTable, no_classes, parse_attrs, parse_classes, symbols
+
+
+def test_intern_returns_stable_ids():
+    table = SymbolTable()
+    sid = table.intern('div')
+    assert table.intern('div') == sid
+    assert table.name(sid) == 'div'
+    assert 'div' in table
+    assert table.get('span') == SymbolTable.NONE
+    assert 'span' not in table
+
+
+def test_parse_attrs_keys_by_interned_id():
+    attributes = parse_attrs(''' id="main" CLASS='a  b' data-x=1 hidden''')
+    assert attributes[ID] == 'main'
+    assert attributes[CLASS] == 'a  b'
+    assert attributes[symbols.get('data-x')] == '1'
+    assert attributes[symbols.get('hidden')] == ''
+
+
+def test_parse_classes():
+    assert parse_classes(parse_attrs('class="a b a"')) == frozenset([symbols.get('a'), symbols.get('b')])
+    assert parse_classes(parse_attrs('id=x')) is no_classes
+    assert parse_classes(parse_attrs('class=""')) is no_classes
@@ -0,0 +1,48 @@
+from .pycairo.cairo import Context, FontOptions, Format, ImageSurface, Matrix, ScaledFont, ToyFontFace
+from .textcache import TextCache
+
+
+def test_least_recently_used_evicted_first():
+    key = TextCache.font_key('sans-serif', 0, 0, 13.0)
+    value = (0.0,) * 6
+    cache = TextCache(max_bytes=3 * TextCache.entry_size((key, 'a'), value))
+    for text in ('a', 'b', 'c'):
+        cache.put(key, text, value)
+    assert cache.get(key, 'a') == value
+    cache.put(key, 'd', value)
+    assert cache.get(key, 'b') is None
+    assert [cache.get(key, text) for text in ('a', 'c', 'd')] == [value] * 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_put_replaces_entry_size():
+    key = TextCache.font_key('sans-serif', 0, 0, 13.0)
+    cache = TextCache()
+    cache.put(key, 'a', (1.0,) * 6)
+    size = cache.size
+    cache.put(key, 'a', (2.0,) * 6)
+    assert len(cache) == 1
+    assert cache.size == size
+
+
+def test_extents_measured_once():
+    ctx = Context(ImageSurface(Format.ARGB32, 8, 8))
+    ctx.select_font_face('sans-serif')
+    ctx.set_font_size(13.0)
+    cache = TextCache()
+    key = TextCache.context_font_key(ctx)
+    assert cache.text_extents(ctx, key, 'word') == tuple(ctx.text_extents('word'))
+    assert cache.advance(ctx, key, 'word') == ctx.text_extents('word')[4]
+    assert cache.font_extents(ctx, key) == tuple(ctx.font_extents())
+    assert cache.stats()['misses'] == 2
+    assert cache.stats()['hits'] == 1
+
+
+def test_key_of_scaled_font():
+    ctx = Context(ImageSurface(Format.ARGB32, 8, 8))
+    ctx.set_scaled_font(ScaledFont(ToyFontFace('sans-serif'), Matrix(xx=12, yy=12), Matrix(), FontOptions()))
+    key = TextCache.context_font_key(ctx)
+    assert key == TextCache.context_font_key(ctx)
+    assert key[3] == 12
+    ctx.set_font_size(14)
+    assert TextCache.context_font_key(ctx) != key
@@ -0,0 +1,57 @@
+from .pycairo.cairo import Content, Context, Format, ImageSurface, Rectangle, RecordingSurface
+from .html import HtmlTag
+from .tiles import TileRenderer
+
+
+def recording(width: int, height: int) -> RecordingSurface:
+    surface = RecordingSurface(Content.COLOR_ALPHA, Rectangle(0, 0, width, height))
+    ctx = Context(surface)
+    for y in range(0, height, 10):
+        ctx.set_source_rgb((y % 30) / 30, 0.5, 1.0 - (y % 50) / 50)
+        ctx.rectangle(y % width, y, 20, 10)
+        ctx.fill()
+    surface.flush()
+    return surface
+
+
+def test_tile_rects_cover_page():
+    renderer = TileRenderer(100, 1100, tile_height=512)
+    assert renderer.tile_rects() == [(0, 512), (512, 512), (1024, 76)]
+
+
+def test_tiles_in_page_order():
+    renderer = TileRenderer(50, 300, tile_height=64, threads=2)
+    tiles = list(renderer.tiles(recording(50, 300)))
+    assert [y for y, tile in tiles] == [0, 64, 128, 192, 256]
+    assert [tile.get_height() for y, tile in tiles] == [64, 64, 64, 64, 44]
+
+
+def test_stitched_page_matches_single_pass():
+    source = recording(50, 300)
+    expected = ImageSurface(Format.ARGB32, 50, 300)
+    ctx = Context(expected)
+    ctx.set_source_surface(source, 0, 0)
+    ctx.paint()
+    expected.flush()
+
+    page = TileRenderer(50, 300, tile_height=64, threads=3).stitch(source)
+    assert bytes(page.get_data()) == bytes(expected.get_data())
+
+
+def test_document_tiles_match_single_pass():
+    renderer = TileRenderer(120, 200, tile_height=48, threads=2)
+    doc = '<body>' + ''.join(['<p>line {0}</p>'.format(number) for number in range(40)]) + '</body>'
+    source = renderer.record(HtmlTag.fromSource(doc), 'sans-serif')
+    expected = ImageSurface(Format.ARGB32, 120, 200)
+    ctx = Context(expected)
+    ctx.set_source_surface(source, 0, 0)
+    ctx.paint()
+    expected.flush()
+
+    page = renderer.stitch(source)
+    data = bytes(page.get_data())
+    assert data == bytes(expected.get_data())
+    # Text reaches into more than one tile
+    painted_tiles = [y for y, tile in renderer.tiles(source)
+                     if bytes(tile.get_data())[3::4].count(0) < 120 * tile.get_height()]
+    assert len(painted_tiles) > 1
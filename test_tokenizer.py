@@ -0,0 +1,61 @@
+from .tokenizer import HtmlHandler, HtmlTokenizer
+
+
+class EventRecorder(HtmlHandler):
+    def __init__(self, source):
+        self.source = source
+        self.events = []
+
+    def start(self, tagname: str, attrs_start: int, attrs_end: int, start: int, end: int):
+        self.events.append(('start', tagname))
+
+    def end(self, tagname: str, start: int, end: int):
+        self.events.append(('end', tagname))
+
+    def text(self, start: int, end: int):
+        self.events.append(('text', self.source[start:end]))
+
+
+def events(source) -> list:
+    return HtmlTokenizer(source).tokenize(EventRecorder(source)).events
+
+
+def test_nested_tags_and_text():
+    assert events('<p>a<b>b</b>c</p>') == [('start', 'p'), ('text', 'a'), ('start', 'b'), ('text', 'b'),
+                                            ('end', 'b'), ('text', 'c'), ('end', 'p')]
+
+
+def test_quoted_gt_does_not_end_tag():
+    assert events('<a title="1 > 0">x</a>') == [('start', 'a'), ('text', 'x'), ('end', 'a')]
+
+
+def test_unquoted_apostrophe_in_attribute():
+    assert events("<img alt=don't>hello<b>world</b>") == [
+        ('start', 'img'), ('end', 'img'), ('text', 'hello'), ('start', 'b'), ('text', 'world'), ('end', 'b')]
+
+
+def test_rawtext_end_tag_in_any_case():
+    assert events('<script>if (a < b) {}</SCRIPT><p>x</p>') == [
+        ('start', 'script'), ('text', 'if (a < b) {}'), ('end', 'script'), ('start', 'p'), ('text', 'x'),
+        ('end', 'p')]
+
+
+def test_rawtext_ignores_other_end_tags():
+    assert events('<style>a</b></styles></style>') == [('start', 'style'), ('text', 'a</b></styles>'),
+                                                       ('end', 'style')]
+
+
+def test_list_item_closes_open_list_item():
+    assert events('<ul><li>a<li>b</ul>') == [
+        ('start', 'ul'), ('start', 'li'), ('text', 'a'), ('end', 'li'), ('start', 'li'), ('text', 'b'),
+        ('end', 'li'), ('end', 'ul')]
+
+
+def test_nested_list_stays_nested():
+    assert events('<li><ul><li>a</ul>') == [
+        ('start', 'li'), ('start', 'ul'), ('start', 'li'), ('text', 'a'), ('end', 'li'), ('end', 'ul'),
+        ('end', 'li')]
+
+
+def test_bytes_source():
+    assert events(b'<P class="x">a</p>') == [('start', 'p'), ('text', b'a'), ('end', 'p')]
@@ -0,0 +1,141 @@
+import http.server
+import io
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from .util import HtmlDoc, HtmlTagBasic, Url
+
+
+def test_feed_returns_closed_tag():
+    doc = HtmlDoc()
+    tags = doc.feed('<div class="x">\n hi\n</div>\n')
+    assert len(tags) == 1
+    assert tags[0] == '<div class="x">'
+    assert tags[0].attrval('class') == 'x'
+    assert tags[0].content_doc == '\nhi\n'
+    assert list(doc) == tags
+
+
+def test_feed_chunks_split_inside_tags():
+    doc = HtmlDoc()
+    assert doc.feed('<div cla') == []
+    assert doc.feed('ss="x">\n h') == []
+    assert doc.feed('i\n</d') == []
+    tags = doc.feed('iv>\n<p>\n')
+    assert [tag.attrval('class') for tag in tags] == ['x']
+    assert tags[0].content_doc == '\nhi\n'
+
+
+def test_close_scans_unterminated_lane():
+    doc = HtmlDoc()
+    assert doc.feed('<span>\n text\n') == []
+    tags = doc.close()
+    assert tags == []
+    assert doc.feed('</span>') == []
+    assert [tag.tagid for tag in doc.close()] == [HtmlTagBasic('<span>').tagid]
+
+
+def test_long_lane_is_not_carried_over():
+    doc = HtmlDoc(retain=False)
+    chunk = 'x' * (HtmlDoc.MAX_LANE // 4)
+    for _ in range(9):
+        doc.feed(chunk)
+        assert doc.lane_rest_len < HtmlDoc.MAX_LANE
+    assert len(doc) == 0
+
+
+def test_long_single_line_is_cut_at_tags():
+    words = ' '.join(['word'] * (HtmlDoc.MAX_LANE // 4))
+    line = words + '<b>bold</b><i>italic</i>' + words
+    source = '<div class="long">\n' + line + '\n</div>\n'
+    assert len(line) > HtmlDoc.MAX_LANE
+    doc = HtmlDoc(retain=False)
+    tags = []
+    for start in range(0, len(source), HtmlDoc.CHUNK_SIZE):
+        tags += doc.feed(source[start:start + HtmlDoc.CHUNK_SIZE])
+        assert doc.lane_rest_len < HtmlDoc.MAX_LANE + HtmlDoc.CHUNK_SIZE
+    tags += doc.close()
+    # The line was cut behind tags only, the content is the one of the uncut line
+    assert [tag.attrval('class') for tag in tags] == ['long']
+    assert tags[0].content_doc == '\n' + line + '\n'
+
+
+def test_stream_yields_tags_without_retaining():
+    reader = io.StringIO('<ul>\n item\n</ul>\n<ol>\n</ol>')
+    tags = list(HtmlDoc.stream(reader, chunk_size=3))
+    assert [str(tag) for tag in tags] == ['<ul>', '<ol>']
+
+
+class ImageHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/slow.png':
+            time.sleep(2.0)
+        body = b'png ' + self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'max-age=60')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server_url():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_buffer_opens_cache_on_first_fetch(tmp_path, server_url):
+    buffer = Url.FetchBuffer(str(tmp_path))
+    other = Url.FetchBuffer(str(tmp_path))
+    assert os.listdir(tmp_path) == []
+    assert buffer.files is not other.files
+
+    file = Url(server_url + '/a.png').fetch('logo.png', buffer)
+    assert file == os.path.join(str(tmp_path), 'logo.png')
+    with open(file, 'rb') as f:
+        assert f.read() == b'png /a.png'
+    # The second fetch is served by the cache
+    Url(server_url + '/a.png').fetch('copy.png', buffer)
+    assert buffer.cache.stats()['hits'] == 1
+    assert sorted(os.listdir(tmp_path)) == ['.cache', 'copy.png', 'logo.png']
+    buffer.close()
+
+
+def test_fetch_times_out(tmp_path, server_url):
+    buffer = Url.FetchBuffer(str(tmp_path), timeout=0.3)
+    with pytest.raises((TimeoutError, socket.timeout, OSError)):
+        Url(server_url + '/slow.png').fetch('slow.png', buffer)
+    buffer.close()
+
+
+def test_mapped_doc_decodes_content_when_used(tmp_path):
+    source = '<ul class="a">\n <li>\n  x\n </li>\n</ul>\n<p>\n ü\n</p>\n'
+    path = tmp_path / 'doc.html'
+    path.write_text(source, encoding='utf-8')
+    with HtmlDoc(str(path), mapped=True) as mapped:
+        expected = HtmlDoc(source)
+        assert [str(tag) for tag in mapped] == [str(tag) for tag in expected]
+        assert [tag.content_doc for tag in mapped] == [tag.content_doc for tag in expected]
+        assert [tag.attrval('class') for tag in mapped] == ['', '']
+        assert mapped[1].content_start > 0
+    with pytest.raises(ValueError):
+        mapped[0].content_doc
+
+
+def test_mapped_dom_is_closed(tmp_path):
+    path = tmp_path / 'doc.html'
+    path.write_text('<p>text</p>')
+    with HtmlDoc.map(str(path)) as dom:
+        assert dom[2].content == 'text'
+    assert dom.source.buffer.closed
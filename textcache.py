@@ -0,0 +1,96 @@
+import collections
+import sys
+
+from .pycairo.cairo import Context, FontOptions, ToyFontFace
+
+
+class TextCache:
+    # Estimated bytes of one entry besides its string: the key and value tuples and the slot of the ordered dict
+    ENTRY_OVERHEAD = 240
+    # Estimated bytes of one item of a value, a float or a glyph
+    ITEM_SIZE = 32
+
+    # Text extents and font extents by (font face, size, options, string), least recently used evicted first
+    def __init__(self, max_bytes: int = 8 << 20):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def font_key(family: str, slant: int, weight: int, size: float, options: FontOptions = None) -> tuple:
+        return family, int(slant), int(weight), size, 0 if options is None else options.hash()
+
+    # The key of the font currently set on ctx. The face of a scaled font is the face cairo resolved the toy
+    # face to, it has no family and is keyed by itself, faces compare equal by their cairo face
+    @staticmethod
+    def context_font_key(ctx: Context) -> tuple:
+        font_face = ctx.get_font_face()
+        matrix = ctx.get_font_matrix()
+        if isinstance(font_face, ToyFontFace):
+            return TextCache.font_key(font_face.get_family(), font_face.get_slant(), font_face.get_weight(),
+                                      matrix.xx, ctx.get_font_options())
+        return font_face, 0, 0, matrix.xx, ctx.get_font_options().hash()
+
+    @staticmethod
+    def entry_size(key: tuple, value: tuple) -> int:
+        text_size = 0 if key[1] is None else sys.getsizeof(key[1])
+        return TextCache.ENTRY_OVERHEAD + text_size + TextCache.ITEM_SIZE * len(value)
+
+    def get(self, font_key: tuple, text: str | None) -> tuple | None:
+        key = (font_key, text)
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, font_key: tuple, text: str | None, value: tuple):
+        key = (font_key, text)
+        previous = self.entries.get(key)
+        if previous is not None:
+            self.size -= self.entry_size(key, previous)
+            self.entries.move_to_end(key)
+        self.entries[key] = value
+        self.size += self.entry_size(key, value)
+        while self.size > self.max_bytes and len(self.entries) > 0:
+            evicted, evicted_value = self.entries.popitem(last=False)
+            self.size -= self.entry_size(evicted, evicted_value)
+            self.evictions += 1
+
+    # The font of ctx has to be the font of font_key
+    def text_extents(self, ctx: Context, font_key: tuple, text: str) -> tuple:
+        extents = self.get(font_key, text)
+        if extents is None:
+            extents = tuple(ctx.text_extents(text))
+            self.put(font_key, text, extents)
+        return extents
+
+    def advance(self, ctx: Context, font_key: tuple, text: str) -> float:
+        return self.text_extents(ctx, font_key, text)[4]
+
+    # Font extents are cached under the string None
+    def font_extents(self, ctx: Context, font_key: tuple) -> tuple:
+        extents = self.get(font_key, None)
+        if extents is None:
+            extents = tuple(ctx.font_extents())
+            self.put(font_key, None, extents)
+        return extents
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses, entries=len(self.entries), bytes=self.size,
+                    max_bytes=self.max_bytes, evictions=self.evictions)
+
+
+text_cache = TextCache()
@@ -0,0 +1,56 @@
+import collections
+import concurrent.futures
+import os
+
+from .pycairo.cairo import Context, Format, ImageSurface, RecordingSurface
+from .displaylist import DisplayList
+from .html import HtmlTag
+from .province_css import Css, Font
+
+
+class TileRenderer:
+    # Paints a page once into a recording and rasterizes it in horizontal tiles on a thread pool
+    def __init__(self, width: int, height: int, tile_height: int = 512, threads: int | None = None):
+        self.width = width
+        self.height = height
+        self.tile_height = tile_height
+        self.threads = (os.cpu_count() or 1) if threads is None else threads
+
+    def record(self, html_tag: HtmlTag, font_family: str, css: Css = None, font: Font = None) -> RecordingSurface:
+        return DisplayList.record(html_tag, font_family, self.width, self.height, css, font).recording
+
+    def tile_rects(self) -> [tuple]:
+        return [(y, min(self.tile_height, self.height - y)) for y in range(0, self.height, self.tile_height)]
+
+    def render_tile(self, recording: RecordingSurface, y: int, height: int) -> ImageSurface:
+        # cairo releases the GIL while replaying, so tiles rasterize in parallel
+        tile = ImageSurface(Format.ARGB32, self.width, height)
+        ctx = Context(tile)
+        ctx.set_source_surface(recording, 0, -y)
+        ctx.paint()
+        tile.flush()
+        return tile
+
+    # Yields (y, tile) in page order, with at most two tiles per thread in flight
+    def tiles(self, recording: RecordingSurface):
+        with concurrent.futures.ThreadPoolExecutor(self.threads) as executor:
+            pending = collections.deque()
+            for y, height in self.tile_rects():
+                if len(pending) >= 2 * self.threads:
+                    done_y, future = pending.popleft()
+                    yield done_y, future.result()
+                pending.append((y, executor.submit(self.render_tile, recording, y, height)))
+            while len(pending) > 0:
+                done_y, future = pending.popleft()
+                yield done_y, future.result()
+
+    def stitch(self, recording: RecordingSurface) -> ImageSurface:
+        page = ImageSurface(Format.ARGB32, self.width, self.height)
+        ctx = Context(page)
+        for y, tile in self.tiles(recording):
+            ctx.set_source_surface(tile, 0, y)
+            ctx.rectangle(0, y, self.width, tile.get_height())
+            ctx.fill()
+            tile.finish()
+        page.flush()
+        return page
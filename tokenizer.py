@@ -0,0 +1,197 @@
+
+class HtmlHandler:
+    # Receives the events of an HtmlTokenizer, all positions are offsets into the tokenized source
+    def start(self, tagname: str, attrs_start: int, attrs_end: int, start: int, end: int):
+        pass
+
+    def end(self, tagname: str, start: int, end: int):
+        pass
+
+    def text(self, start: int, end: int):
+        pass
+
+
+class HtmlTokenizer:
+    void_tags = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+                           'link', 'meta', 'param', 'source', 'track', 'wbr'])
+    rawtext_tags = frozenset(['script', 'style'])
+    # Open tags, that a start tag closes implicitly, as long as they are the innermost open tags
+    implied_end_tags = {
+        'li': frozenset(['li']),
+        'dt': frozenset(['dt', 'dd']),
+        'dd': frozenset(['dt', 'dd']),
+        'p': frozenset(['p']),
+        'option': frozenset(['option']),
+        'tr': frozenset(['tr', 'td', 'th']),
+        'td': frozenset(['td', 'th']),
+        'th': frozenset(['td', 'th']),
+    }
+
+    class Chars:
+        def __init__(self, encode):
+            self.lt = encode('<')
+            self.gt = encode('>')
+            self.slash = encode('/')
+            self.bang = encode('!')
+            self.question = encode('?')
+            self.equals = encode('=')
+            self.dquote = encode('"')
+            self.squote = encode("'")
+            self.comment_open = encode('<!--')
+            self.comment_close = encode('-->')
+            self.end_open = encode('</')
+            self.name_stop = encode(' \t\r\n/>')
+
+    str_chars = Chars(str)
+    bytes_chars = Chars(str.encode)
+
+    @staticmethod
+    def buffer(source):
+        # A memoryview is scanned through the object it is spanning, e.g. a mmap
+        if type(source) is memoryview:
+            if hasattr(source.obj, 'find') and source.nbytes == len(source.obj):
+                return source.obj
+            return source.tobytes()
+        return source
+
+    def __init__(self, source, encoding: str = 'utf-8'):
+        self.source = self.buffer(source)
+        self.encoding = encoding
+        if isinstance(self.source, str):
+            self.chars = HtmlTokenizer.str_chars
+        else:
+            self.chars = HtmlTokenizer.bytes_chars
+
+    def decode(self, raw) -> str:
+        if isinstance(raw, str):
+            return raw
+        return raw.decode(self.encoding, 'replace')
+
+    def find_tag_end(self, pos: int) -> int:
+        src = self.source
+        chars = self.chars
+        gt = src.find(chars.gt, pos)
+        # Skip '>' inside of quoted attribute values, a quote only opens a value right after '='
+        while gt > -1:
+            dq = src.find(chars.dquote, pos, gt)
+            sq = src.find(chars.squote, pos, gt)
+            if dq == -1 and sq == -1:
+                return gt
+            quote = dq if sq == -1 or -1 < dq < sq else sq
+            if not self.after_equals(quote):
+                pos = quote + 1
+                continue
+            pos = src.find(src[quote:quote+1], quote + 1)
+            if pos == -1:
+                return -1
+            pos += 1
+            if pos > gt:
+                gt = src.find(chars.gt, pos)
+        return gt
+
+    def after_equals(self, pos: int) -> bool:
+        src = self.source
+        pos -= 1
+        while pos > 0 and src[pos:pos+1].isspace():
+            pos -= 1
+        return src[pos:pos+1] == self.chars.equals
+
+    def find_end_tag(self, tagname: str, pos: int) -> int:
+        # The end tag of a raw text element, in any letter case
+        src = self.source
+        chars = self.chars
+        name_len = len(tagname)
+        close = src.find(chars.end_open, pos)
+        while close > -1:
+            name_end = close + 2 + name_len
+            if (self.decode(src[close+2:name_end]).lower() == tagname
+                    and (name_end >= len(src) or src[name_end:name_end+1] in chars.name_stop)):
+                return close
+            close = src.find(chars.end_open, close + 2)
+        return len(src)
+
+    def name_end(self, pos: int, end: int) -> int:
+        src = self.source
+        name_stop = self.chars.name_stop
+        while pos < end and src[pos:pos+1] not in name_stop:
+            pos += 1
+        return pos
+
+    def tokenize(self, handler: HtmlHandler) -> HtmlHandler:
+        src = self.source
+        src_len = len(src)
+        find = src.find
+        chars = self.chars
+        open_tags = []
+
+        pos = 0
+        text_start = 0
+        while pos < src_len:
+            lt = find(chars.lt, pos)
+            if lt == -1:
+                break
+            nxt = src[lt+1:lt+2]
+
+            if nxt == chars.slash:
+                gt = find(chars.gt, lt + 2)
+                if gt == -1:
+                    break
+                if text_start < lt:
+                    handler.text(text_start, lt)
+                tagname = self.decode(src[lt+2:self.name_end(lt + 2, gt)]).lower()
+                # Close the matching tag and every tag left open inside of it, ignore stray end tags
+                if tagname in open_tags:
+                    while True:
+                        opened = open_tags.pop()
+                        if opened == tagname:
+                            handler.end(opened, lt, gt + 1)
+                            break
+                        handler.end(opened, lt, lt)
+                pos = text_start = gt + 1
+            elif nxt == chars.bang or nxt == chars.question:
+                if text_start < lt:
+                    handler.text(text_start, lt)
+                if src[lt:lt+4] == chars.comment_open:
+                    gt = find(chars.comment_close, lt + 4)
+                    pos = src_len if gt == -1 else gt + 3
+                else:
+                    gt = find(chars.gt, lt + 2)
+                    pos = src_len if gt == -1 else gt + 1
+                text_start = pos
+            elif nxt.isalpha():
+                gt = self.find_tag_end(lt + 1)
+                if gt == -1:
+                    break
+                if text_start < lt:
+                    handler.text(text_start, lt)
+                name_end = self.name_end(lt + 1, gt)
+                tagname = self.decode(src[lt+1:name_end]).lower()
+                implied = self.implied_end_tags.get(tagname)
+                while implied is not None and len(open_tags) > 0 and open_tags[-1] in implied:
+                    handler.end(open_tags.pop(), lt, lt)
+                self_closing = src[gt-1:gt] == chars.slash
+                handler.start(tagname, name_end, gt - 1 if self_closing else gt, lt, gt + 1)
+                pos = text_start = gt + 1
+
+                if self_closing or tagname in self.void_tags:
+                    handler.end(tagname, pos, pos)
+                elif tagname in self.rawtext_tags:
+                    # The body of script and style is text up to the matching end tag
+                    close = self.find_end_tag(tagname, pos)
+                    if pos < close:
+                        handler.text(pos, close)
+                    gt = find(chars.gt, close)
+                    pos = text_start = src_len if gt == -1 else gt + 1
+                    handler.end(tagname, close, pos)
+                else:
+                    open_tags.append(tagname)
+            else:
+                # A '<' that does not open a tag is text
+                pos = lt + 1
+
+        if text_start < src_len:
+            handler.text(text_start, src_len)
+        while len(open_tags) > 0:
+            handler.end(open_tags.pop(), src_len, src_len)
+
+        return handler
@@ -1,21 +1,29 @@
 
 from abc import ABC, abstractmethod
+import contextlib
+import functools
+import mmap
 import operator
 import os.path
 import re
 import sys
-import shutil
 import tempfile
+import threading
+import urllib.error
 import urllib.request
 from typing import Any, AnyStr, Callable
 
+from .dom import HtmlDom
+from .resourcecache import ResourceCache
+from .symbols import symbols, parse_attrs, parse_classes
+
 
 def hex_to_int(hex: str) -> int:
     return int(hex, 16)
 
 
 def int_to_hex(integer: int) -> str:
-    return str(hex(integer))
+    return '{0:02x}'.format(integer)
 
 
 def ifnonot(o: Any) -> str:
@@ -64,11 +72,31 @@ def notin(l1: list, l2: list) -> list:
     return match
 
 
+# The file mapped read-only, its pages are only read when they are scanned. Empty files can not be mapped
+def map_file(path: str) -> mmap.mmap | bytes:
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return bytes()
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# map_file for a with statement, the mapping is closed at its end
+@contextlib.contextmanager
+def open_mapped(path: str):
+    source = map_file(path)
+    try:
+        yield source
+    finally:
+        if isinstance(source, mmap.mmap):
+            source.close()
+
+
 class PathBasic(str):
     prefix: str
 
     def __init__(self, pathstr: str, prefix: str = str()):
-        super().__init__(pathstr)
+        # The string value is set by str.__new__
+        super().__init__()
         self.prefix = prefix
 
     def __str__(self):
@@ -120,7 +148,8 @@ class DirectoryPath(PathBasic):
 
     def __init__(self, pathstr: str):
         super().__init__(pathstr)
-        dct = self.parse(pathstr)
+        # Not self.parse, subclasses parse other parts
+        dct = DirectoryPath.parse(pathstr)
         self.prefix = dct['prefix']
         self.path = dct['path']
 
@@ -130,7 +159,7 @@ class DirectoryPath(PathBasic):
 
 class FilePath(DirectoryPath):
     filename: str
-    directory: super()
+    directory: DirectoryPath
 
     @staticmethod
     def parse(pathstr: str) -> dict:
@@ -145,13 +174,16 @@ class FilePath(DirectoryPath):
 
     def __init__(self, pathstr: str):
         super().__init__(pathstr)
-        dct = self.parse(pathstr)
+        dct = FilePath.parse(pathstr)
         self.filename = dct['filename']
 
     def __str__(self):
         return str(self.directory + self.filename)
 
-    def read(self) -> AnyStr:
+    # mapped returns the mapped bytes instead of the decoded text, to be parsed in place
+    def read(self, mapped: bool = False) -> AnyStr | mmap.mmap:
+        if mapped:
+            return map_file(str(self.directory + self.filename))
         with open(str(self.directory + self.filename), 'r') as f:
             return f.read()
 
@@ -191,25 +223,52 @@ class Url(PathBasic):
         return dct
 
     class FetchBuffer(DirectoryPath):
-        files = [FilePath]
+        # Fetched files by filename in pathstr, the downloads below pathstr/.cache are shared by every
+        # document fetching into this buffer. Requests time out after timeout seconds
+        def __new__(cls, pathstr: str, max_bytes: int = 256 << 20, timeout: float = 10.0):
+            return super().__new__(cls, pathstr)
 
-        def __init__(self, pathstr: str):
+        def __init__(self, pathstr: str, max_bytes: int = 256 << 20, timeout: float = 10.0):
             super().__init__(pathstr)
-            self.files = []
+            self.buffer_dir = pathstr
+            self.max_bytes = max_bytes
+            self.timeout = timeout
+            self.files = dict()
+            self.resource_cache = None
+            self.lock = threading.Lock()
+
+        # Opened on the first fetch, so a buffer that fetches nothing creates no database
+        @property
+        def cache(self) -> ResourceCache:
+            with self.lock:
+                if self.resource_cache is None:
+                    self.resource_cache = ResourceCache(os.path.join(self.buffer_dir, '.cache'), self.max_bytes)
+                return self.resource_cache
 
         def add_file(self, filename) -> FilePath:
-            file = FilePath(self + filename)
-            if os.path.exists(self + filename) or self + filename in self.files:
-                return self.files[self.files.index(self + filename)]
-            self.files.append(file)
+            file = self.files.get(filename)
+            if file is None:
+                file = FilePath(os.path.join(self.buffer_dir, os.path.basename(filename)))
+                self.files[filename] = file
             return file
 
         def get_file(self, filename) -> FilePath:
-            for file in self.files:
-                if file.filename is filename:
-                    return file
             return self.add_file(filename)
 
+        # Writes body to filename atomically, a file is never read half written
+        def put_file(self, filename, body: bytes) -> FilePath:
+            file = self.add_file(filename)
+            with tempfile.NamedTemporaryFile(dir=self.buffer_dir, delete=False) as tmp_file:
+                tmp_file.write(body)
+            os.replace(tmp_file.name, file)
+            return file
+
+        def close(self):
+            with self.lock:
+                if self.resource_cache is not None:
+                    self.resource_cache.close()
+                    self.resource_cache = None
+
     def __init__(self, urlstr: str):
         super().__init__(urlstr)
         dct = self.parse(urlstr)
@@ -228,17 +287,30 @@ class Url(PathBasic):
         pos_filename_start = str('/' + self.urlpath).rfind('/') if len(self.urlpath) > 0 else 0
         return str() if len(self.urlpath) is 0 else str(self.urlpath[pos_filename_start:])
 
+    @staticmethod
+    def request(url: str, headers: dict, timeout: float = 10.0) -> (int, dict, bytes):
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+                return response.status, {key.lower(): value for key, value in response.getheaders()}, response.read()
+        except urllib.error.HTTPError as error:
+            if error.code != 304:
+                raise
+            return error.code, {key.lower(): value for key, value in error.headers.items()}, bytes()
+
+    # Returns the body as filename in the fetch buffer. Fetched once, then revalidated with ETag or
+    # Last-Modified, once it is stale
     def fetch(self, filename: str, fetch_buffer: FetchBuffer) -> FilePath:
-        fetch_file = fetch_buffer.get_file(filename)
-        with urllib.request.urlopen(self) as response:
-            with tempfile.NamedTemporaryFile(dir=fetch_file.directory, delete=False) as tmp_file:
-                shutil.copyfileobj(response, tmp_file)
-        return fetch_file
+        # The string value is the url as given
+        url = str.__str__(self)
+        status, headers, body = fetch_buffer.cache.fetch(url, functools.partial(Url.request,
+                                                                                timeout=fetch_buffer.timeout))
+        return fetch_buffer.put_file(filename, body)
 
 
 class HtmlTagBasic(str):
-    attrs = list(str)
+    attrs = list()
     closing = False
+    tagid = 0
     content_doc = ''
 
     parent_tag = None
@@ -249,27 +321,36 @@ class HtmlTagBasic(str):
         self.join(dct['tagname'])
         self.attrs = dct['attrs']
         self.closing = dct['closing']
+        self.tagid = symbols.intern(dct['tagname'])
+        self.attributes = dct['attributes']
+        self.classnames = parse_classes(self.attributes)
 
     def findattr(self, attrkey: str) -> str:
-        for attr in self.attrs:
-            if HtmlTagBasic.attr_key(attr) is attrkey:
-                return attrkey
+        if symbols.get(attrkey) in self.attributes:
+            return attrkey
         return str()
 
+    def attrval(self, attrkey: str) -> str:
+        return self.attributes.get(symbols.get(attrkey), str())
+
     @staticmethod
     def parse_tag(tag_str: str):
+        pos_tag_end = tag_str.find('>')
+        if pos_tag_end == -1:
+            pos_tag_end = len(tag_str)
         if tag_str.startswith('</'):
             dct = dict(closing=True)
-            tag = tag_str[2:tag_str.find('>')-1].removeprefix(' ').removesuffix(' ')
+            tag = tag_str[2:pos_tag_end].strip()
         elif tag_str.startswith('<'):
             dct = dict(closing=False)
-            tag = tag_str[1:tag_str.find('>')-1].removeprefix(' ').removesuffix(' ')
+            tag = tag_str[1:pos_tag_end].removesuffix('/').strip()
         else:
             return dict()
 
         attrs = tag.split(' ')
-        dct['tagname'] = attrs[0]
+        dct['tagname'] = attrs[0].lower()
         dct['attrs'] = attrs[1:]
+        dct['attributes'] = parse_attrs(tag[len(attrs[0]):])
 
         return dct
 
@@ -298,23 +379,72 @@ class HtmlTagBasic(str):
             chld.parent_tag = self
 
 
-class HtmlDoc(list(HtmlTagBasic)):
-    doc = ''
+class MappedTag(HtmlTagBasic):
+    # A tag of a mapped HtmlDoc, that keeps the byte offsets of its content and decodes it when it is used
+    def __new__(cls, tag_str: str, source: mmap.mmap | bytes, content_start: int, content_end: int,
+                encoding: str = 'utf-8'):
+        return super().__new__(cls, tag_str)
 
-    def __init__(self, filepath: str = str()):
-        if os.path.isfile(filepath):
+    def __init__(self, tag_str: str, source: mmap.mmap | bytes, content_start: int, content_end: int,
+                 encoding: str = 'utf-8'):
+        super().__init__(tag_str)
+        self.source = source
+        self.content_start = content_start
+        self.content_end = content_end
+        self.encoding = encoding
+
+    # Like the content of HtmlDoc.scan_lane, each lane after the first loses one leading space.
+    # Raises ValueError, once the document is closed
+    @property
+    def content_doc(self) -> str:
+        lanes = self.source[self.content_start:self.content_end].decode(self.encoding, 'replace').split('\n')
+        return '\n'.join(lanes[:1] + [lane.removeprefix(' ') for lane in lanes[1:]])
+
+
+class HtmlDoc(list):
+    doc = ''
+    source = None
+    encoding = 'utf-8'
+    CHUNK_SIZE = 1 << 16
+    # The longest text carried over between feed() calls, a longer lane is scanned in parts
+    MAX_LANE = 1 << 20
+
+    # With retain=False the document keeps no tags, they are only returned by feed(), close() and stream().
+    # With mapped=True the file is scanned over its mapping and the tags decode their content, when it is used,
+    # until close() unmaps the file
+    def __init__(self, filepath: str = str(), retain: bool = True, mapped: bool = False):
+        self.retain = retain
+        self.lane_rest = []
+        self.lane_rest_len = 0
+        self.lane_limit = HtmlDoc.MAX_LANE
+        self.lane_continued = False
+        self.newtag = True
+        self.closing_tag_reached = False
+        self.prefix_ident = 0
+        self.opening_tag = str()
+        self.tag_content = []
+        self.content_start = None
+        if os.path.isfile(filepath) and mapped:
+            super().__init__()
+            self.source = map_file(filepath)
+            self.scan_mapped()
+        elif os.path.isfile(filepath):
+            super().__init__()
             with open(filepath, 'r') as f:
-                file = f.read()
-                super().__init__(HtmlDoc.scan_for_tags(file))
-                self.doc = file
+                if retain:
+                    self.doc = f.read()
+                    self.feed(self.doc)
+                else:
+                    for chunk in iter(lambda: f.read(HtmlDoc.CHUNK_SIZE), ''):
+                        self.feed(chunk)
+                self.close()
         elif len(filepath) > 0:
-            super().__init__(HtmlDoc.scan_for_tags(filepath))
+            super().__init__()
+            self.feed(filepath)
+            self.close()
         else:
             super().__init__()
 
-    def __iter__(self):
-        return self
-
     @staticmethod
     def parse_tag_lane(tag_str: str) -> HtmlTagBasic:
         pos_closing_tag = tag_str.find('>')
@@ -328,43 +458,171 @@ class HtmlDoc(list(HtmlTagBasic)):
     def count_ident(lane: str) -> int:
         return (len(lane.removeprefix(' ')) - len(lane)) * (-1)
 
-    @staticmethod
-    def scan_for_tags(html_source_str: str) -> [HtmlTagBasic]:
-        lanes = html_source_str.splitlines(keepends=True)
-        tags = [HtmlTagBasic]
-
-        newtag = True
-        closing_tag_reached = False
-        prefix_ident = 0
-        tag_content = str()
-        for idx, lane in enumerate(lanes):
-            if newtag:
-                tag_content = str()
-                newtag = False
-                closing_tag_reached = False
-
-            lane_nows = lane.removeprefix(' ').removesuffix(' ')
-            if lane_nows.startswith('</') and HtmlDoc.count_ident(lane) is prefix_ident:
-                closing_tag = lane_nows[2:lane_nows.find('>')]
-                tag_content += lane_nows[lane_nows.find('>'):]
-                newtag = True
-                closing_tag_reached = True
-            elif lane_nows.startswith('<'):
-                opening_tag = lane_nows[1:lane_nows.find('>')]
-                tag_content += lane_nows[lane_nows.find('>'):]
-                closing_tag_reached = False
-                prefix_ident = HtmlDoc.count_ident(lane)
-            else:
-                tag_content += lane_nows
+    # continued is True for the rest of a lane, that was cut behind a tag by feed()
+    def scan_lane(self, lane: str, continued: bool = False) -> HtmlTagBasic | None:
+        if self.newtag:
+            self.tag_content = []
+            self.newtag = False
+            self.closing_tag_reached = False
+
+        if continued:
+            if len(self.opening_tag) > 0:
+                self.tag_content.append(lane)
+            return None
+
+        lane_nows = lane.removeprefix(' ').removesuffix(' ')
+        if lane_nows.startswith('</') and HtmlDoc.count_ident(lane) == self.prefix_ident:
+            self.newtag = True
+            self.closing_tag_reached = True
+        elif lane_nows.startswith('<'):
+            self.opening_tag = lane_nows[:lane_nows.find('>')+1]
+            # Text in front of an opening lane belongs to no tag
+            self.tag_content = [lane_nows[lane_nows.find('>')+1:]]
+            self.closing_tag_reached = False
+            self.prefix_ident = HtmlDoc.count_ident(lane)
+        elif len(self.opening_tag) > 0:
+            self.tag_content.append(lane_nows)
+
+        if self.closing_tag_reached:
+            tag = HtmlTagBasic(self.opening_tag)
+            tag.content_doc = ''.join(self.tag_content)
+            self.tag_content = []
+            return tag
+        return None
+
+    # scan_lane over the lane source[start:end] of the mapping, only the opening tags are decoded
+    def scan_mapped_lane(self, start: int, end: int) -> MappedTag | None:
+        source = self.source
+        ident = 1 if source[start:start+1] == b' ' else 0
+        lane_start = start + ident
+        if self.newtag:
+            self.content_start = None
+            self.newtag = False
+            self.closing_tag_reached = False
+
+        head = source[lane_start:lane_start+2]
+        if head == b'</' and ident == self.prefix_ident:
+            self.newtag = True
+            self.closing_tag_reached = True
+        elif head[:1] == b'<':
+            tag_end = source.find(b'>', lane_start, end) + 1
+            tag_end = lane_start if tag_end == 0 else tag_end
+            self.opening_tag = source[lane_start:tag_end].decode(self.encoding, 'replace')
+            self.content_start = tag_end
+            self.closing_tag_reached = False
+            self.prefix_ident = ident
+        elif len(self.opening_tag) > 0 and self.content_start is None:
+            self.content_start = lane_start
+
+        if self.closing_tag_reached:
+            content_start = start if self.content_start is None else self.content_start
+            self.content_start = None
+            return MappedTag(self.opening_tag, source, content_start, start, self.encoding)
+        return None
+
+    # Scans the mapping lane by lane in place, the file is never decoded as a whole
+    def scan_mapped(self):
+        source = self.source
+        size = len(source)
+        start = 0
+        while start < size:
+            end = source.find(b'\n', start) + 1
+            end = size if end == 0 else end
+            tag = self.scan_mapped_lane(start, end)
+            if tag is not None and self.retain:
+                self.append(tag)
+            start = end
+
+    # Scans all complete lanes of chunk and returns the tags, that were closed by them
+    def feed(self, chunk: str) -> [HtmlTagBasic]:
+        lanes_end = chunk.rfind('\n') + 1
+        if lanes_end == 0:
+            # The pieces of an unterminated lane are only joined, once it is complete or too long
+            self.lane_rest.append(chunk)
+            self.lane_rest_len += len(chunk)
+            if self.lane_rest_len < self.lane_limit:
+                return []
+            lane = ''.join(self.lane_rest)
+            # A too long lane is only cut behind a complete tag, not in front of the next one. The text carried
+            # into the next lane continues the content, as it did in the whole lane
+            split = lane.rfind('>') + 1
+            while 0 < split < len(lane) and lane[split] == '<':
+                split = lane.rfind('>', 0, split - 1) + 1
+            if split == 0 and '<' not in lane:
+                # Text without tags is content wherever it is cut
+                split = len(lane)
+            if split == 0:
+                # No tag is complete yet, wait for twice the text, before joining again
+                self.lane_rest = [lane]
+                self.lane_limit = 2 * len(lane)
+                return []
+            lanes = [lane[:split]]
+            self.lane_rest = [lane[split:]] if split < len(lane) else []
+            self.lane_limit = HtmlDoc.MAX_LANE
+        else:
+            self.lane_limit = HtmlDoc.MAX_LANE
+            self.lane_rest.append(chunk[:lanes_end])
+            lanes = ''.join(self.lane_rest).splitlines(keepends=True)
+            self.lane_rest = [chunk[lanes_end:]] if lanes_end < len(chunk) else []
+        self.lane_rest_len = sum([len(piece) for piece in self.lane_rest])
+
+        tags = []
+        continued = self.lane_continued
+        # After a cut, the next lane continues the cut one
+        self.lane_continued = lanes_end == 0
+        for lane in lanes:
+            tag = self.scan_lane(lane, continued)
+            continued = False
+            if tag is not None:
+                tags.append(tag)
+        if self.retain:
+            self.extend(tags)
+        return tags
 
-            if not newtag and closing_tag_reached:
-                tag = HtmlTagBasic(opening_tag)
-                tag.content_doc = tag_content
-                newtag = True
-                tags += tag
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # Scans the last, unterminated lane and returns the tags, that were closed by it. Unmaps a mapped file,
+    # its tags can not decode their content any more
+    def close(self) -> [HtmlTagBasic]:
+        tags = []
+        if self.lane_rest_len > 0:
+            tag = self.scan_lane(''.join(self.lane_rest), self.lane_continued)
+            self.lane_rest = []
+            self.lane_rest_len = 0
+            self.lane_limit = HtmlDoc.MAX_LANE
+            self.lane_continued = False
+            if tag is not None:
+                tags.append(tag)
+        if self.retain:
+            self.extend(tags)
+        if isinstance(self.source, mmap.mmap):
+            self.source.close()
         return tags
 
+    @staticmethod
+    def stream(reader: Any, chunk_size: int = 1 << 16):
+        # Yields the tags of a pipe, socket or file as soon as their closing lane was read
+        doc = HtmlDoc(retain=False)
+        chunk = reader.read(chunk_size)
+        while len(chunk) > 0:
+            yield from doc.feed(chunk)
+            chunk = reader.read(chunk_size)
+        yield from doc.close()
+
+    # The dom of the file, parsed over the mapped bytes, the texts are decoded when they are used,
+    # until HtmlDom.close() unmaps the file
+    @staticmethod
+    def map(filepath: str, encoding: str = 'utf-8') -> HtmlDom:
+        return HtmlDom.fromSource(map_file(filepath), encoding)
+
+    @staticmethod
+    def scan_for_tags(html_source_str: str) -> [HtmlTagBasic]:
+        doc = HtmlDoc(retain=False)
+        return doc.feed(html_source_str) + doc.close()
 
 
 class Equation:
@@ -408,7 +666,7 @@ class Operators(dict):
 
 class Function:
     funcname = ''
-    parameters = list(str)
+    parameters = list()
     func = None
 
     def __init__(self, funcstr: str, func: Callable[..., Any] = None):
@@ -417,7 +675,7 @@ class Function:
         self.parameters = funcattrs['parameters']
         self.func = func
 
-    def call(self, parameters: list(str)) -> list:
+    def call(self, parameters: [str]) -> list:
         return self.func(parameters)
 
     @staticmethod
@@ -425,22 +683,22 @@ class Function:
         pos_opening_bracket = funcstr.find('(')
         pos_closing_bracket = funcstr.rfind(')')
 
-        if pos_opening_bracket is -1 or pos_closing_bracket is -1:
-            return dict(funcname=funcstr)
+        if pos_opening_bracket == -1 or pos_closing_bracket == -1:
+            return dict(funcname=funcstr, parameters=list())
 
-        parameters_str = funcstr[pos_opening_bracket+1:pos_closing_bracket-1]
+        parameters_str = funcstr[pos_opening_bracket+1:pos_closing_bracket]
         parameters = Function.parse_parameters(parameters_str)
 
-        return dict(funcname=funcstr[:pos_opening_bracket-1], parameters=parameters)
+        return dict(funcname=funcstr[:pos_opening_bracket], parameters=parameters)
 
     @staticmethod
-    def parse_parameters(parameters_str: str) -> list(str):
+    def parse_parameters(parameters_str: str) -> [str]:
         if parameters_str.__contains__(','):
             tokens = parameters_str.split(',')
         else:
             tokens = [parameters_str]
 
-        for idx, token in tokens:
+        for idx, token in enumerate(tokens):
             if token.startswith(' '):
                 tokens[idx] = token.removeprefix(' ')
 
@@ -452,8 +710,8 @@ class Functions(dict):
         func = Function(funcstr, func)
         self[func.funcname] = func
 
-    def call(self, funcname: str, parameters: list(str)) -> list:
+    def call(self, funcname: str, parameters: [str]) -> list:
         if self[funcname] is None:
-            return list(str)
+            return list()
 
         return self[funcname].call(parameters)
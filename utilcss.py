@@ -1,6 +1,8 @@
 
 from typing import Callable, Any
 
+from .cssselector import attr_value_tests
+from .symbols import symbols
 from .util import Function, Functions, Equation, HtmlTagBasic, HtmlDoc, notin
 
 
@@ -8,14 +10,17 @@ class CssOperator:
     op = ''
     opfunc = None
 
-    def __init__(self, opstr: str, opfunc: Callable[[str, str, str, HtmlTagBasic], list(HtmlTagBasic)]):
-        super().__init__(opstr, opfunc)
+    def __init__(self, opstr: str, opfunc: Callable[[str, str, str, HtmlTagBasic], [HtmlTagBasic]]):
+        self.op = opstr
+        self.opfunc = opfunc
 
     def eval(self, e: str, attr: str, val: str, htmltag: HtmlTagBasic) -> [HtmlTagBasic]:
         return self.opfunc(e, attr, val, htmltag)
 
 
 class CssOperators(dict):  # S. 133 "Attribute Selectors"
+    value_tests = attr_value_tests
+
     def __init__(self):
         super().__init__()
         self.registerall()
@@ -23,104 +28,49 @@ class CssOperators(dict):  # S. 133 "Attribute Selectors"
     def eval(self, op: str, e: str, attr: str, val: str, html: HtmlTagBasic) -> [HtmlTagBasic]:
         return self[op].eval(e, attr, val, html)
 
+    @staticmethod
+    def tags(html: HtmlTagBasic) -> [HtmlTagBasic]:
+        return [html] + list(html.children_tags)
+
     @staticmethod
     def any(e: str, attr: str, val: str, html: HtmlTagBasic) -> [HtmlTagBasic]:
         if html is None:
             return []
 
-        eall = e.split(' ')
-        htmlall = html + html.children_tags
-        matches = [HtmlTagBasic]
-        # Test all tags
-        for tag in htmlall:
-            # Test, if the element e is same than in definition
-            for etest in eall:
-                if tag is etest:
-                    # Test, if attr is included
-                    attributes = tag.attrs
-                    for attribute in attributes:
-                        if HtmlTagBasic.attr_key(attribute) is attr:
-                            matches += tag
-                    break
+        # Compare interned ids instead of strings
+        eids = set([symbols.get(etest) for etest in e.split(' ')])
+        attrid = symbols.get(attr)
+        return [tag for tag in CssOperators.tags(html) if tag.tagid in eids and attrid in tag.attributes]
 
-        return matches
+    @staticmethod
+    def matching(e: str, attr: str, val: str, html: HtmlTagBasic,
+                 test: Callable[[str, str], bool]) -> [HtmlTagBasic]:
+        attrid = symbols.get(attr)
+        return [tag for tag in CssOperators.any(e, attr, val, html) if test(tag.attributes[attrid], val)]
 
     @staticmethod
     def exact(e: str, attr: str, val: str, html: HtmlTagBasic) -> [HtmlTagBasic]:
-        htmlany = CssOperators.any(e, attr, val, html)
-
-        matches = [HtmlTagBasic]
-        for htmltag in htmlany:
-            for attribute in htmltag.attrs:
-                if HtmlTagBasic.attr_key(attribute) is not attr:
-                    continue
-                else:
-                    if HtmlTagBasic.attr_val(attribute) is val:
-                        matches += htmltag
-                    else:
-                        break
-
-        return matches
+        return CssOperators.matching(e, attr, val, html, CssOperators.value_tests['='])
 
     @staticmethod
     def beginswith(e: str, attr: str, val: str, html: HtmlTagBasic) -> [HtmlTagBasic]:
-        eall = CssOperators.any(e, attr, val, html)
-        matches = [HtmlTagBasic]
-
-        for htmltag in eall:
-            attribute = htmltag.findattr(attr)
-            if HtmlTagBasic.attr_val(attribute).startswith(val):
-                matches += htmltag
-
-        return matches
+        return CssOperators.matching(e, attr, val, html, CssOperators.value_tests['^='])
 
     @staticmethod
     def eitherorbegin(e: str, attr: str, val: str, html: HtmlTagBasic) -> [HtmlTagBasic]:
-        matches = CssOperators.exact(e, attr, val, html)
-
-        htmlbeginsall = notin(matches, html + html.children_tags)
-        for htmltag in htmlbeginsall:
-            attribute = htmltag.findattr(attr)
-            if HtmlTagBasic.attr_val(attribute).startswith(val):
-                matches += htmltag
-
-        return matches
+        return CssOperators.matching(e, attr, val, html, CssOperators.value_tests['|='])
 
     @staticmethod
     def haswithin(e: str, attr: str, val: str, html: HtmlTagBasic) -> [HtmlTagBasic]:
-        eall = CssOperators.any(e, attr, val, html)
-        matches = [HtmlTagBasic]
-
-        for htmltag in eall:
-            attribute = htmltag.findattr(attr)
-            if HtmlTagBasic.attr_val(attribute).__contains__(' ' + val + ' '):
-                matches += htmltag
-
-        return matches
+        return CssOperators.matching(e, attr, val, html, CssOperators.value_tests['~='])
 
     @staticmethod
     def endswith(e: str, attr: str, val: str, html: HtmlTagBasic) -> [HtmlTagBasic]:
-        eall = CssOperators.any(e, attr, val, html)
-        matches = [HtmlTagBasic]
-
-        for htmltag in eall:
-            attribute = htmltag.findattr(attr)
-            if HtmlTagBasic.attr_val(attribute).endswith(val):
-                matches += htmltag
-
-        return matches
+        return CssOperators.matching(e, attr, val, html, CssOperators.value_tests['$='])
 
     @staticmethod
     def anywherewithin(e: str, attr: str, val: str, html: HtmlTagBasic) -> [HtmlTagBasic]:
-        eall = CssOperators.any(e, attr, val, html)
-        matches = [HtmlTagBasic]
-
-        for htmltag in eall:
-            attribute = htmltag.findattr(attr)
-            if HtmlTagBasic.attr_val(attribute).__contains__(val):
-                matches += htmltag
-
-        return matches
+        return CssOperators.matching(e, attr, val, html, CssOperators.value_tests['*='])
 
     def register(self, operator: CssOperator):
         self[operator.op] = operator
@@ -185,12 +135,13 @@ class CssFunctions(dict):  # S. 137ff "Structural Pseudo Classes"
 
     @staticmethod
     def onlyoftype(e: str, html: HtmlTagBasic) -> [HtmlTagBasic]:
-        matches = list(HtmlTagBasic)
+        matches = []
         html.scan_for_children()
 
-        for htmlelem in html + html.children_tags:
-            if e is str(htmlelem.tag):
-                matches += htmlelem
+        eid = symbols.get(e)
+        for htmlelem in CssOperators.tags(html):
+            if htmlelem.tagid == eid:
+                matches.append(htmlelem)
 
         return matches
 
@@ -239,10 +190,10 @@ class CssFunctions(dict):  # S. 137ff "Structural Pseudo Classes"
     @staticmethod
     def empty(e: str, html: HtmlTagBasic) -> HtmlTagBasic | None:
         html.scan_for_children()
-        if str(html) is e and len(html.content_doc) is 0 \
+        if html.tagid == symbols.get(e) and len(html.content_doc) is 0 \
             or (html.content_doc.startswith('<!-- ') and html.content_doc.endswith(' -->')):
             return html
-        elif str(html) is ('br' or 'input' or '!DOCTYPE' or 'meta'):  # Match empty and void elements
+        elif html.tagid in (symbols.get('br'), symbols.get('input'), symbols.get('!doctype'), symbols.get('meta')):  # Match empty and void elements
             return html
 
         return None
@@ -274,12 +225,8 @@ class CssFunctions(dict):  # S. 137ff "Structural Pseudo Classes"
 
             return notin(html + html.children_tags, htmltags)
         else:
-            matches = [HtmlTagBasic]
-            htmltags = html + html.children_tags
-            for htmltag in htmltags:
-                if str(htmltag) is not expression:
-                    matches += htmltag
-            return matches
+            eid = symbols.get(expression)
+            return [htmltag for htmltag in CssOperators.tags(html) if htmltag.tagid != eid]
 
     def registerall(self):
         self.register(CssFunction('root', CssFunctions.root))